@@ -1,30 +1,181 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, request, render_template, jsonify
 from flask_cors import CORS
+import msgspec
+import threading
+import signal
+import hashlib
+import gzip
 import time
-from src.query import Queryier, CacheStrategy
+import os
+from src.query import Queryier, CacheStrategy, QueryException, WEIGHT_NAMES
 from src.config import Config
+from src.hotswap import IndexSwapper, residentMemory
 
+try:
+    import brotli
+except ImportError:
+    # optional, responses fall back to gzip
+    brotli = None
+
+launch = time.time_ns()
 app = Flask(__name__)
 CORS(app)
 config = Config()
-Q = Queryier(config.index_src, cacheStrategy = CacheStrategy.POPULARITY)
+# QUERY_LOG overrides the configured query log, empty disables it, eg: so load tests do not log their queries
+queryLog: str = os.environ.get("QUERY_LOG", config.query_log)
+
+def loadIndex(indexLoc: str) -> Queryier:
+    return Queryier(indexLoc, cacheStrategy = CacheStrategy.POPULARITY, queryLog = queryLog or None)
+
+def warmIndex(queryier: Queryier) -> None:
+    if queryLog:
+        queryier.warm(queryLog, config.warm_terms)
+
+# SEARCH_INDEX overrides the configured index, eg: for load testing
+index = IndexSwapper(os.environ.get("SEARCH_INDEX", config.index_src), loadIndex, warmIndex)
+print(f"Index loaded in {index.current.startupTime} ms (snapshot {'used' if index.current.snapshotLoaded else 'not used'})")
+firstQuery = True
+# the pid of the prefork parent, set in its workers
+preforkParent: int = None
+# bounds the searches in progress, requests past it are rejected instead of queued
+admission = threading.BoundedSemaphore(config.max_inflight) if config.max_inflight > 0 else None
+encoder = msgspec.json.Encoder()
 
 @app.route("/")
 def home():
     return render_template("index.html")
 
+def _compress_(body: bytes) -> tuple[bytes, str|None]:
+    """Compress a response body with the best encoding the client accepts, if it is large enough to be worth it."""
+    if len(body) < config.compress_min_size:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body, quality = 4), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel = 5), "gzip"
+    return body, None
+
 @app.route("/search/")
 def query():
-    q = request.args.get("query")
+    if admission is not None and not admission.acquire(blocking = False):
+        return Response(encoder.encode({"error": "overloaded"}), status = 503, mimetype = "application/json", headers = {"Retry-After": "1"})
+    try:
+        return _search_()
+    finally:
+        if admission is not None:
+            admission.release()
+
+def _search_() -> Response:
+    q = request.args.get("query", "")
+    cursor = max(request.args.get("cursor", 0, type = int), 0)
+    # per-request ranking weights, eg: &HEADER=2&ALPHA=0.5
+    try:
+        weights = {k: float(request.args[k]) for k in ("ALPHA", *WEIGHT_NAMES) if k in request.args}
+    except ValueError:
+        return jsonify({"error": "weights must be numbers"}), 400
+    with index.acquire() as Q:
+        # the same query on the same index version always has the same results
+        etag = f"{Q.version}-{hashlib.sha1(f'{cursor}:{sorted(weights.items())}:{q}'.encode('utf-8')).hexdigest()[:16]}"
+        headers = {
+            "ETag": f'W/"{etag}"',
+            "Cache-Control": f"public, max-age={config.http_max_age}",
+            "Vary": "Accept-Encoding"
+        }
+        if request.if_none_match.contains_weak(etag):
+            return Response(status = 304, headers = headers)
+        
+        start = time.time_ns()
+        try:
+            res, count, partial = Q.searchIndex(q, cursor = cursor, weights = weights)
+        except QueryException as e:
+            return jsonify({"error": str(e)}), 400
+        end = time.time_ns()
+        global firstQuery
+        if firstQuery:
+            print(f"Time to First Query: {(end-launch) / 10**6} ms since server start")
+            firstQuery = False
+        suggestion = Q.didYouMean(q) if cursor == 0 else None
+    
+    # encode the results first to time them, then splice them into the response
+    serializeStart = time.time_ns()
+    results = msgspec.Raw(encoder.encode(res))
+    serializeEnd = time.time_ns()
+    body = encoder.encode({
+        "results": results,
+        "time": (end-start) / 10**6,
+        "serializeTime": (serializeEnd-serializeStart) / 10**6,
+        "count": count,
+        # the ranking ran out of QUERY_BUDGET and left out the most common terms
+        "partial": partial,
+        "suggestion": suggestion,
+        # cursor for the next page, None on the last page
+        "cursor": cursor + len(res) if cursor + len(res) < count else None
+    })
+    compressStart = time.time_ns()
+    body, encoding = _compress_(body)
+    compressEnd = time.time_ns()
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    if partial:
+        # a later request may have time to rank in full
+        del headers["ETag"]
+        headers["Cache-Control"] = "no-store"
+    headers["Server-Timing"] = ", ".join([
+        f"search;dur={(end-start) / 10**6}",
+        f"serialize;dur={(serializeEnd-serializeStart) / 10**6}",
+        f"compress;dur={(compressEnd-compressStart) / 10**6}"
+    ])
+    return Response(body, mimetype = "application/json", headers = headers)
+
+@app.route("/suggest/")
+def suggest():
+    prefix = request.args.get("prefix", "")
     start = time.time_ns()
-    res, count = Q.searchIndex(q)
+    with index.acquire() as Q:
+        res = Q.complete(prefix)
     end = time.time_ns()
-    response = {
-        "results": res,
-        "time": (end-start) / 10**6,
-        "count": count
-    }
-    return jsonify(response)
+    return jsonify({
+        "suggestions": res,
+        "time": (end-start) / 10**6
+    })
+
+@app.route("/admin/reload/", methods = ["POST"])
+def reload():
+    # only from this machine
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return jsonify({"error": "forbidden"}), 403
+    if preforkParent is not None:
+        # the parent reloads the shared index and replaces every worker
+        if request.args.get("index"):
+            return jsonify({"error": "prefork workers only reload the served index"}), 400
+        os.kill(preforkParent, signal.SIGHUP)
+        return jsonify({"started": True, "prefork": True}), 202
+    started = index.reload(request.args.get("index"))
+    return jsonify({"started": started, "status": index.status}), 202 if started else 409
+
+@app.route("/admin/status/")
+def status():
+    return jsonify({**index.status, "current": index.indexLoc, "pid": os.getpid(), "memory": residentMemory()})
+
+def serve(host: str = "127.0.0.1", port: int = 5000) -> None:
+    """Run the server, forking SERVER_WORKERS processes which share the index if it is more than 1."""
+    global preforkParent
+    if config.server_workers > 1:
+        from src.prefork import preforkServe
+        if queryLog:
+            # warm before forking so the workers start with the warmed caches
+            warmIndex(index.current)
+        preforkParent = os.getpid()
+        preforkServe(index, app, host, port, config.server_workers, config.index_watch)
+        return None
+    if queryLog:
+        # warm the caches with the most popular logged terms without delaying startup
+        index.current.warmInBackground(queryLog, config.warm_terms)
+    if config.index_watch > 0:
+        # swap in the index whenever it is rebuilt
+        index.watch(config.index_watch)
+    app.run(host, port)
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    serve()
\ No newline at end of file
@@ -1,19 +1,49 @@
 function setup() {
-    // search on hit enter while typing search query
+    // search on hit enter while typing search query, otherwise suggest completions
     $("#searchBar").on("keyup", ev => {
         if (ev.key === "Enter") {
             ev.preventDefault();
             $("#searchButton").click();
         }
+        else if (ev.key.length === 1 || ev.key === "Backspace") {
+            suggest();
+        }
     })
 }
 
+// fill the search bar's completion list for the current prefix
+async function suggest() {
+    const prefix = $("#searchBar").val();
+    const response = await fetch(`http://127.0.0.1:5000/suggest/?prefix=${encodeURIComponent(prefix)}`);
+    response.json().then(data => {
+        // skip stale responses if the user kept typing
+        if ($("#searchBar").val() !== prefix) return;
+        $("#suggestions").empty();
+        $.each(data["suggestions"], (_, s) => {
+            $("#suggestions").append($("<option/>", {value: s}));
+        });
+    });
+}
+
 // add click event for search button and insert results
-async function search() {
-    const response = await fetch(`http://127.0.0.1:5000/search/?query=${encodeURIComponent($("#searchBar").val())}`);
+// a cursor fetches the next page of the previous query and appends it to the results
+async function search(cursor = 0) {
+    const response = await fetch(`http://127.0.0.1:5000/search/?query=${encodeURIComponent($("#searchBar").val())}&cursor=${cursor}`);
     response.json().then(data => {
         results = data["results"];
-        $("#results").empty();
+        $("#more").remove();
+        if (cursor === 0) $("#results").empty();
+        if (data["suggestion"]) {
+            let p = $("<p/>").addClass("resultP").text("Did you mean: ");
+            let a = $("<a>", {text: data["suggestion"], href: "#"});
+            a.on("click", ev => {
+                ev.preventDefault();
+                $("#searchBar").val(data["suggestion"]);
+                search();
+            });
+            p.append(a);
+            $("#results").append(p);
+        }
         $.each(results, (_, res) => {
             let p = $("<p/>").addClass("resultP");
             let title = res["title"];
@@ -24,10 +54,20 @@ async function search() {
             });
             p.append(a);
             p.append($("<br/>"));
+            // the snippet is escaped by the server, only the query terms are marked up
+            if (res["snippet"]) {
+                p.append($("<span/>").addClass("snippet").html(res["snippet"]));
+                p.append($("<br/>"));
+            }
             p.append(res["summary"]);
             $("#results").append(p);
         });
-        if (results.length === 0) {
+        if (data["cursor"] !== null) {
+            let more = $("<button/>", {id: "more", text: "More Results"}).addClass("twelve columns");
+            more.on("click", () => search(data["cursor"]));
+            $("#results").append(more);
+        }
+        if (results.length === 0 && cursor === 0) {
             let p = $("<p/>").addClass("resultP");
             p.append($("<h3/>", {text: "Oops!"}));
             p.append("Sorry, we couldn't find any results for that query. ");
@@ -37,7 +77,13 @@ async function search() {
         let info = $("<p/>");
         info.append($("<span/>").text(`Query Time: ${data["time"]} ms`));
         info.append($("<br/>"));
+        info.append($("<span/>").text(`Serialization Time: ${data["serializeTime"]} ms`));
+        info.append($("<br/>"));
         info.append($("<span/>").text(`Total Results: ${data["count"]}`));
+        if (data["partial"]) {
+            info.append($("<br/>"));
+            info.append($("<span/>").text("Partial results: the search ran out of time and skipped the most common terms."));
+        }
         $("#info").empty();
         $("#info").append(info);
         $("h1").addClass("searched");
@@ -1,28 +1,39 @@
 import os
 import argparse
 import time
-import json
-from src.indexer import Indexer, Site
-from src.matrix import  Matrix, Posting
-from src.query import Queryier, CacheStrategy
-from src.refactor import refactor, RefactorException
-from src.ranker import PageRanker
-from src.config import Config
-
-def CreateIndex(dataset: str = "test", chunkSize: int = 1000, offload: bool = True, printing: bool = True, maxDocs: int = None, breakpoints: list[str] = ["a", "i", "r"]):
+
+# heavy modules (bs4, nltk, numpy, msgspec) are imported inside the commands that need them,
+# so the querier never loads the indexer's dependencies
+
+def CreateIndex(dataset: str = "test", chunkSize: int = 1000, offload: bool = True, printing: bool = True, maxDocs: int = None, breakpoints: list[str] = ["a", "i", "r"], resume: bool = False, warmStart: str = None, publishEvery: int = 0):
     """Create an index from a dataset.
 
     Args:
-        dataset (str, optional): which dataset to index, can be "test" or "large". Defaults to "test".
+        dataset (str, optional): which dataset to index, can be "test", "large", or the path to a dataset folder, jsonl file or tar archive. Defaults to "test".
         chunkSize (int, optional): the number of documents to keep in memory at a time. Defaults to 1000.
         offload (bool, optional): whether to save partial indexes during the process, merging them at the end. Defaults to True.
         printing (bool, optional): whether to print progress reports during index creation. Defaults to True.
         maxDocs (int, optional): the limit on how many documents to index. Defaults to None.
         breakpoints (list[str], optional): the breakpoints to divide the tokens by. Defaults to ["a", "i", "r"].
+        resume (bool, optional): whether to resume an interrupted build from its last checkpoint. Defaults to False.
+        warmStart (str, optional): a previous index folder whose pageranks PageRank starts from. Defaults to None.
+        publishEvery (int, optional): publish a queryable snapshot of the index every this many offloads, 0 to only publish the final index. Defaults to 0.
     """
+    from src.indexer import Indexer, Site
+    from src.matrix import Matrix, Posting
+    from src.ranker import PageRanker, loadRanks
+    from src.config import Config
+    from src.checkpoint import Checkpoint
+    from src.publish import Publisher
+    from src.helpers import stableHash
     
     if len(breakpoints) == 1 and breakpoints[0].lower() == "none":
         breakpoints = []
+    checkpoint = Checkpoint("index")
+    resume = resume and checkpoint.exists()
+    if resume:
+        # the partial matrices must be segmented the same way
+        breakpoints = checkpoint.breakpoints()
     
     config = Config()
     time_start = time.process_time()
@@ -32,69 +43,118 @@ def CreateIndex(dataset: str = "test", chunkSize: int = 1000, offload: bool = Tr
         print("Offload:", "Yes" if offload else "No")
         print("Limit Document Count:", f"Yes ({maxDocs})" if maxDocs is not None else "No")
         print("Breakpoints:", breakpoints)
+        print("Resume:", "Yes" if resume else "No")
+        print("Publish Snapshots:", f"Every {publishEvery} offloads" if publishEvery > 0 and offload else "No")
+    # read before the matrix cleans the index folder, which may be the previous index
+    previousRanks, previousStats = loadRanks(warmStart) if warmStart else ({}, {})
+    if printing:
+        if warmStart:
+            print("PageRank Warm Start:", f"Yes ({len(previousRanks)} pages from {warmStart})" if len(previousRanks) > 0 else f"No (no documents.csv in {warmStart})")
         print("Creating Indexer: ", end = "")
     indexer = Indexer(dataset, config.openai_summary)
     if printing:
         print("Done")
         print("Creating Matrix: ", end = "")
-    matrix: Matrix = Matrix(breakpoints = breakpoints, clean = True)
+    matrix: Matrix = Matrix(breakpoints = breakpoints, clean = not resume, blockSize = config.docstore_block_size)
     if printing:
         print("Done")
+    count = 0
+    if resume:
+        if printing:
+            print("Restoring Checkpoint: ", end = "")
+        count = checkpoint.restore(indexer, matrix)
+        if printing:
+            print(f"Done ({count} pages)")
+    if printing:
         print("Begin Indexing")
     ranker = PageRanker()
+    # snapshots are merged from the offloaded partials
+    publisher = Publisher("index", config.publish_keep, config.pagerank and config.publish_pagerank) if publishEvery > 0 and offload else None
     
-    count = 0
-    tokens: Site = indexer.getNextSite()
-    # while there's another document to index
-    while tokens:
-        # insert each token to the matrix
-        matrix.addDocument(hash(tokens.url), tokens.url, tokens.title, tokens.summary)
-        for k,v in tokens.tokens.items():
-            matrix.add(k, Posting(hash(tokens.url), v, k in tokens.headers, k in tokens.bold, k in tokens.titles))
-        tokens = indexer.getNextSite()
-        count += 1
-        # print progress and offload every chunkSize documents
-        if count % chunkSize == 0:
-            if printing:
-                print(f"\nIndexed {count} pages.")
-            if offload:
-                if printing:
-                    print("Offloading Matrix: ", end = "")
-                matrix.save()
+    # while there's another document to index, until maxDocs documents have been indexed
+    try:
+        while maxDocs is None or count < maxDocs:
+            tokens: Site = indexer.getNextSite()
+            if tokens is None:
+                break
+            # insert each token to the matrix
+            docID = stableHash(tokens.url)
+            matrix.addDocument(docID, tokens.url, tokens.title, tokens.summary, tokens.textHash, tokens.text, tokens.surfaces)
+            for k,v in tokens.tokens.items():
+                matrix.add(k, Posting(docID, v, k in tokens.headers, k in tokens.bold, k in tokens.titles))
+            count += 1
+            # print progress and offload every chunkSize documents
+            if count % chunkSize == 0:
                 if printing:
-                    print("Done")
-        # break if maxDocs documents have been indexed
-        if maxDocs is not None and count >= maxDocs:
-            break
+                    print(f"\nIndexed {count} pages.")
+                if offload:
+                    if printing:
+                        print("Offloading Matrix: ", end = "")
+                    matrix.save()
+                    # everything up to here is on disk, an interrupted build can resume from this point
+                    checkpoint.save(indexer, matrix, count)
+                    if printing:
+                        print("Done")
+                    if publisher is not None and (count // chunkSize) % publishEvery == 0:
+                        if printing:
+                            print("Publishing Snapshot: ", end = "")
+                        graph = indexer.getLinks()
+                        publisher.publish(matrix, graph, count)
+                        graph.close()
+                        if printing:
+                            print(f"Done ({publisher.report()})")
+    finally:
+        # maxDocs can stop indexing before the dataset runs out, leaving the reader blocked on its queue
+        indexer.closeReader()
     
     if printing:
+        if config.preparse_dedup:
+            print(f"\nPre-Parse Dedup: {indexer.dedupReport()}")
         print("Creating PageRank: ", end = "")
+    graph = indexer.getLinks()
     if config.pagerank:
-        pagerank = ranker.run(indexer.getLinks())
+        pagerank = ranker.run(graph, previousRanks, previousStats)
     else:
-        links = indexer.getLinks()
-        pagerank = {i: 1/len(links) for i in links.keys()}
+        pagerank = {doc: 1/graph.nodeCount() for docs in graph.pages.values() for doc in docs}
+    graph.close()
+    os.remove(indexer.links.path)
     if printing:
         print("Done")
+        if config.pagerank:
+            print(f"PageRank: {ranker.report()}")
     
     matrix.save()
     if printing:
         print(f"Finished Dataset: {count} pages.")
         print("Consolidating Index: ", end = "")
-    matrix.finalize(pagerank, printing)
+    matrix.finalize(pagerank, printing, ranker.stats)
+    checkpoint.clear()
+    # the final index has its own meta.json, so queriers already open it instead of the last snapshot
+    if publisher is not None:
+        publisher.clear()
     if printing:
         print("Done")
     
+    if config.openai_summary:
+        # the summary pipeline keeps running during indexing, attach what it finished and save the rest for --summarize
+        from src.summarizer import attachSummaries, PENDING_FILE
+        remaining = indexer.closeSummaries(f"index/{PENDING_FILE}")
+        attached = attachSummaries("index", indexer.summaryCache)
+        if printing:
+            print(f"Summaries: {attached} attached, {remaining} pending")
+    
     time_end = time.process_time()
     
     # save summary stats
-    sizes = [os.stat(f"index/matrix{i}.csv").st_size for i in range(matrix._matrix_count_)]
+    sizes = matrix.segment_sizes()
     total = sum(sizes)
     with open("index/summary.txt", "w") as f:
         f.write(f"Number of pages: {count}\nNumber of unique tokens: {matrix.scan_size()}\n" +
             "\n".join(f"  Matrix {i} Filesize: {size / 1024:.4f} kb | {size / 1024**2:.4f} mb | {size / 1024**3:.4f} gb" for i,size in enumerate(sizes)) +
             f"\nTotal Index File Size: {total / 1024:.4f} kb | {total / 1024**2:.4f} mb | {total / 1024**3:.4f} gb" +
-            f"\nTime to Create Index: {time_end-time_start:.2f} seconds | {(time_end-time_start)/60:.2f} minutes")
+            f"\nTime to Create Index: {time_end-time_start:.2f} seconds | {(time_end-time_start)/60:.2f} minutes" +
+            (f"\nPageRank: {ranker.report()}" if config.pagerank else "") +
+            (f"\nPre-Parse Dedup: {indexer.dedupReport()}" if config.preparse_dedup else ""))
 
     print("Time:", time_end-time_start, "seconds")
     print("\nIndexing Complete")
@@ -107,6 +167,9 @@ def queryIndex(indexFolderPath: str = "index", cache_size: int = 25, cacheStrate
         cache_size (int, optional): the querier cache size. Defaults to 25.
         cacheStrategy (str, optional): the cache update strategy. Can be T or P. Defaults to T.
     """
+    time_launch = time.time_ns()
+    from src.query import Queryier, CacheStrategy
+    
     if cacheStrategy == "T":
         update = CacheStrategy.TIMELY
     elif cacheStrategy == "P":
@@ -119,19 +182,194 @@ def queryIndex(indexFolderPath: str = "index", cache_size: int = 25, cacheStrate
     print("Cache Update Policy:", cacheStrategy)
     print("Enter query to search. To exit, press enter on a blank query.")
     q = Queryier(indexFolderPath, cache_size, update)
+    startup = time.time_ns() - time_launch
+    print(f"Startup Time: {startup / 10**6} ms (index load {q.startupTime} ms, snapshot {'used' if q.snapshotLoaded else 'not used'})")
+    first = True
     while True:
         query = input("\nq:> ")
         if len(query.strip()) < 1:
             break
         time_start = time.time_ns()
-        results,totalCount = q.searchIndex(query)
+        results,totalCount,partial = q.searchIndex(query)
         time_end = time.time_ns()
+        suggestion = q.didYouMean(query)
+        if suggestion is not None:
+            print(f"  Did you mean: {suggestion}")
         for r in results:
             print(f"    {r.url}")
-        print(f"  Results: {len(results)} / {totalCount}")
+        print(f"  Results: {len(results)} / {totalCount}" + (" (partial, QUERY_BUDGET ran out)" if partial else ""))
         print(f"  Time: {(time_end-time_start) / 10**6} ms")
+        if first:
+            # time to first query excludes time spent waiting for input
+            print(f"  Time to First Query: {(startup + time_end-time_start) / 10**6} ms")
+            first = False
+
+def packDataset(dataset: str, output: str, printing: bool) -> None:
+    """Pack a dataset folder into a single jsonl file which the indexer can read directly.
+
+    Args:
+        dataset (str): "test", "large", or the path to a dataset folder.
+        output (str): the jsonl file to write, gzipped if it ends with .gz.
+        printing (bool): whether to print progress.
+    """
+    from src.corpus import packCorpus
+    from src.indexer import SMALL_DATASET_ROOT, LARGE_DATASET_ROOT
+    
+    root = {"test": SMALL_DATASET_ROOT, "large": LARGE_DATASET_ROOT}.get(dataset, dataset)
+    start = time.time()
+    count = packCorpus(root, output)
+    if printing:
+        print(f"Packed {count} pages from {root} into {output} in {time.time()-start:.2f} seconds")
+        print(f"  Size: {os.stat(output).st_size / 1024**2:.4f} mb")
+
+def summarizeIndex(index: str, printing: bool) -> None:
+    """Summarize the pages left pending by indexing and attach all cached summaries to the index documents.
+
+    Args:
+        index (str): the folder containing the index.
+        printing (bool): whether to print progress.
+    """
+    from src.config import Config
+    from src.summarizer import SummaryCache, SummaryPipeline, getSummarizer, attachSummaries, PENDING_FILE
+    
+    config = Config()
+    cache = SummaryCache(config.summary_cache)
+    pipeline = SummaryPipeline(getSummarizer(config.summarizer), cache, config.summary_workers, config.summary_rate_limit, config.summary_retries)
+    count = pipeline.load(f"{index}/{PENDING_FILE}")
+    if printing:
+        print("Pending Summaries:", count)
+    # report progress until only failed pages are left
+    while printing and pipeline.pending() > pipeline.failed:
+        print(f"\r  Remaining: {pipeline.pending()}", end = "")
+        time.sleep(1)
+    remaining = pipeline.close(True, f"{index}/{PENDING_FILE}")
+    attached = attachSummaries(index, cache)
+    if printing:
+        print(f"\nSummaries: {attached} attached, {remaining} pending")
+
+def requantizeIndex(index: str, printing: bool) -> None:
+    """Recompute an index's impact scores for the current [WEIGHTS] without rebuilding it.
+
+    Args:
+        index (str): the folder containing the index.
+        printing (bool): whether to print progress.
+    """
+    from src.impact import requantize
+    
+    start = time.time()
+    count = requantize(index, printing)
+    if printing:
+        print(f"Requantized {count} terms in {time.time()-start:.2f} seconds")
+
+def optimizeIndex(index: str, printing: bool) -> None:
+    """Write the startup snapshot for an index so that queriers load it with a single read.
+
+    Args:
+        index (str): the folder containing the index.
+        printing (bool): whether to print progress.
+    """
+    from src.query import Queryier
+    from src.spelling import saveTrigramIndex, scanDocumentFrequencies, TRIGRAM_FILE
+    from src.suggest import saveTermArray, TERMS_FILE
+    
+    # indexes built before the term dictionaries existed get them here
+    if not os.path.exists(f"{index}/{TRIGRAM_FILE}") or not os.path.exists(f"{index}/{TERMS_FILE}"):
+        q = Queryier(index, useSnapshot = False)
+        dfs = scanDocumentFrequencies(index, q.filename, len(q.breakpoints)+1)
+        saveTrigramIndex(index, dfs)
+        saveTermArray(index, dfs)
+        if printing:
+            print("Saved Term Dictionaries")
+    q = Queryier(index, useSnapshot = False)
+    path = q.saveSnapshot()
+    if printing:
+        print("Saved Snapshot:", path)
+        print(f"  Size: {os.stat(path).st_size / 1024**2:.4f} mb")
+        start = time.time_ns()
+        Queryier(index)
+        print(f"  Load Time: {(time.time_ns()-start) / 10**6} ms (without snapshot: {q.startupTime} ms)")
+
+def loadTestServer(index: str, queryFile: str, url: str, duration: float, concurrency: int, rate: float) -> None:
+    """Load test the search server with a query mix and print throughput and latency.
+
+    Args:
+        index (str): the index to start the server on, ignored if url is given.
+        queryFile (str): the query mix, one query per line.
+        url (str): the base url of an already running server, or None to start one.
+        duration (float): seconds to send requests for.
+        concurrency (int): the number of clients when rate is 0.
+        rate (float): requests per second, or 0 to run concurrent clients as fast as the server answers.
+    """
+    import json
+    from src.loadtest import loadQueries, loadTest, startServer
+    
+    queries = loadQueries(queryFile)
+    server = None
+    if url is None:
+        print("Starting Server:", index)
+        server, url = startServer(index)
+    try:
+        print(f"Load Testing {url}: {len(queries)} queries, {f'{rate} requests/s' if rate > 0 else f'{concurrency} clients'} for {duration} s")
+        report = loadTest(url, queries, duration, concurrency, rate).summary()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent = 4))
+    print(f"Throughput: {report['throughput']:.2f} requests/s | Errors: {report['errorRate']*100:.2f}% of {report['requests']}")
+    print(f"Rejected (503): {report['rejected']} | Partial Rankings: {report['partial']}")
+    for name in ("latency", "serverTime", "overhead"):
+        print(f"  {name}: " + " | ".join(f"{k} {v:.2f} ms" for k,v in report[name].items()))
+
+def indexStatistics(index: str, cacheSize: int) -> None:
+    """Report the shape of an index, saving it to stats.json in the index folder.
+
+    Args:
+        index (str): the folder containing the index.
+        cacheSize (int): the querier cache size, to estimate the memory of caching.
+    """
+    from src.stats import indexStats, saveStats, formatStats
+    from src.config import Config
+    
+    start = time.time()
+    stats = indexStats(index, cacheSize = cacheSize, rDocs = Config().r_docs)
+    path = saveStats(index, stats)
+    print(formatStats(stats))
+    print(f"Saved {path} in {time.time()-start:.2f} seconds")
+
+def sweepSettings(index: str, grid: str, queryFile: str, judgmentFile: str, minOverlap: float = 0.9) -> None:
+    """Measure latency and result quality for a grid of ranking settings, loading the index once.
+
+    Args:
+        index (str): the folder containing the index.
+        grid (str): a json file or string of the values to try, eg: {"RDOCS": [100, 500], "HEADER": [1, 1.5]}.
+        queryFile (str): the query set, one query per line.
+        judgmentFile (str): tab separated query and relevant url lines, or None.
+        minOverlap (float, optional): the overlap with the reference ranking a setting needs to be recommended. Defaults to 0.9.
+    """
+    import json
+    from src.query import Queryier
+    from src.loadtest import loadQueries
+    from src.sweep import sweep, loadGrid, loadJudgments, fastestSetting, SWEEP_FILE
+    
+    queries = loadQueries(queryFile)
+    q = Queryier(index)
+    report = sweep(q, queries, loadGrid(grid), loadJudgments(judgmentFile) if judgmentFile else None)
+    with open(f"{index}/{SWEEP_FILE}", "w") as f:
+        json.dump(report, f, indent = 4)
+    
+    print(f"Reference: {report['reference']} over {report['queries']} queries (scored per field, without impacts)")
+    for s in sorted(report["settings"], key = lambda s: s["latency"]["p50"]):
+        judged = f" | judged recall {s['judgedRecall']:.3f}" if s.get("judgedRecall") is not None else ""
+        print(f"  {s['settings']}: p50 {s['latency']['p50']:.2f} ms | p90 {s['latency']['p90']:.2f} ms | p99 {s['latency']['p99']:.2f} ms | overlap {s['overlap']:.3f}{judged}")
+    best = fastestSetting(report, minOverlap)
+    print(f"Fastest with overlap >= {minOverlap}:", best["settings"] if best is not None else "None")
+    print(f"Saved {index}/{SWEEP_FILE}")
 
 def refactorIndex(index: str, breakpoints: list[str], printing: bool):
+    from src.refactor import refactor, RefactorException
+    
+    auto = None
     if len(breakpoints) == 1:
         if breakpoints[0].lower() == "long":
             breakpoints = sorted([*"0123456789abcdefghijklmnopqrstuvwxyz", *[f"{l}m" for l in "abcdefghijklmnopqrstuvwxyz"]])
@@ -141,47 +379,71 @@ def refactorIndex(index: str, breakpoints: list[str], printing: bool):
             breakpoints = [*"048cgkosw"]
         elif breakpoints[0].lower() == "none":
             breakpoints = []
-    filename = "matrix"
+        elif breakpoints[0].lower().startswith("auto:"):
+            # size-balanced breakpoints chosen by the refactor
+            try:
+                auto = int(breakpoints[0].split(":")[1])
+            except ValueError:
+                auto = 0
+            if auto < 1:
+                print(f"Invalid breakpoints: {breakpoints[0]}, auto:N needs a file count N of at least 1 (eg: auto:8)")
+                return
+            breakpoints = []
+    # refactor also rewrites meta.json and meta_index.json
     try:
-        refactor(index, filename, breakpoints, printing, True)
+        refactor(index, "matrix", breakpoints, printing, True, auto)
     except RefactorException:
-        filename = "index"
-        refactor(index, filename, breakpoints, printing, True)
-
-    # resave the meta
-    with open(f"{index}/meta.json", "r") as f:
-        meta = json.load(f)
-    meta["filename"] = filename
-    meta["breakpoints"] = breakpoints
-    with open(f"{index}/meta.json", "w") as f:
-        json.dump(meta, f, indent = 4)
-    
-    # reform the meta index
-    matrix = Matrix(folder = index, breakpoints = breakpoints, filename = filename)
-    matrix._matrix_count_ = len(breakpoints)+1
-    meta_index = matrix._index_matrix_()
-    with open(f"{index}/meta_index.json", "w") as f:
-        json.dump(meta_index, f, indent = 4)
+        refactor(index, "index", breakpoints, printing, True, auto)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Run Indexer and Search Engine")
     parser.add_argument("--index", help = "Run Indexer", action = argparse.BooleanOptionalAction)
     parser.add_argument("--query", help = "Run Search Engine Querier", action = argparse.BooleanOptionalAction)
     parser.add_argument("--refactor", help = "Refactor an Index", action = argparse.BooleanOptionalAction)
-    parser.add_argument("-d", "--dataset", help = "Which dataset to index, defaults to testing set. [Indexer Only]", nargs = "?", type = str, default = "test")
+    parser.add_argument("--pack", help = "Pack a dataset folder into a single jsonl file", nargs = "?", type = str, const = "dataset.jsonl.gz", default = None, metavar = "OUTPUT")
+    parser.add_argument("--summarize", help = "Finish pending summaries and attach them to an Index", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--requantize", help = "Recompute an Index's impact scores for the current weights", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--optimize", help = "Write the startup snapshot for an Index", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--stats", help = "Report the statistics of an Index", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--sweep", help = "Measure latency and quality for a grid of settings, given as a json file or string", nargs = "?", type = str, default = None, metavar = "GRID")
+    parser.add_argument("--loadtest", help = "Load test the search server with a query mix", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--resume", help = "Resume an interrupted Index build from its last checkpoint. [Indexer Only]", action = argparse.BooleanOptionalAction)
+    parser.add_argument("--publish", help = "Publish a queryable snapshot of the index every N offloads while indexing, needs --offload. [Indexer Only]", type = int, default = 0, metavar = "N")
+    parser.add_argument("--warmstart", help = "Start PageRank from the ranks of a previous index, defaults to the index being rebuilt. [Indexer Only]", nargs = "?", type = str, const = "index", default = None, metavar = "INDEX")
+    parser.add_argument("-d", "--dataset", help = "Which dataset to index: test, large, or a folder, jsonl, jsonl.gz or tar path. Defaults to testing set. [Indexer or Packing]", nargs = "?", type = str, default = "test")
     parser.add_argument("-c", "--chunksize", help = "Indexing Chunk Size, defaults to 1000. [Indexer Only]", nargs = "?", type = int, default = 1000)
     parser.add_argument("-o", "--offload", help = "Offload chunks as they are loaded, defaults to False. [Indexer Only]", action = argparse.BooleanOptionalAction)
     parser.add_argument("-p", "--printing", help = "Print progress.", action = argparse.BooleanOptionalAction)
     parser.add_argument("-m", "--maxDocs", help = "Set maximum number of documents to index. Defaults to None. [Indexer only]", nargs = "?", type = int, default = -1)
-    parser.add_argument("-b", "--breakpoints", help = "Set breakpoints for indexer. [Indexer or Refactoring]", nargs = "+", type = str, default = ["a", "i", "r"])
-    parser.add_argument("-i", "--indexSource", help = "The index to search. Defaults to testing index. [Querier or Refactoring]", nargs = "?", type = str, default = "indexSmall")
-    parser.add_argument("-cs", "--cacheSize", help = "Querier cache size, defaults to 25. [Querier only]", nargs = "?", type = int, default = 25)
+    parser.add_argument("-b", "--breakpoints", help = "Set breakpoints for indexer. Refactoring also accepts long, mid, short, none or auto:N. [Indexer or Refactoring]", nargs = "+", type = str, default = ["a", "i", "r"])
+    parser.add_argument("-i", "--indexSource", help = "The index to search. Defaults to testing index. [Querier, Refactoring, Summarizing, Requantizing, Optimizing, Statistics, Sweep or Load Testing]", nargs = "?", type = str, default = "indexSmall")
+    parser.add_argument("-cs", "--cacheSize", help = "Querier cache size, defaults to 25. [Querier or Statistics]", nargs = "?", type = int, default = 25)
     parser.add_argument("-u", "--update", help = "Querier cache update strategy, can be TIMELY or POPULARITY, enter T or P. Defaults to T.", nargs = "?", choices = ["T", "P"], default = "T")
+    parser.add_argument("--judgments", help = "Judged results file, one tab separated query and relevant url per line. [Sweep Only]", nargs = "?", type = str, default = None)
+    parser.add_argument("--queries", help = "Query mix file, one query per line. Defaults to TEST.txt. [Load Testing or Sweep]", nargs = "?", type = str, default = "TEST.txt")
+    parser.add_argument("--url", help = "Load test an already running server instead of starting one. [Load Testing Only]", nargs = "?", type = str, default = None)
+    parser.add_argument("--duration", help = "Seconds to send requests for, defaults to 30. [Load Testing Only]", nargs = "?", type = float, default = 30)
+    parser.add_argument("--concurrency", help = "Number of concurrent clients, defaults to 8. [Load Testing Only]", nargs = "?", type = int, default = 8)
+    parser.add_argument("--rate", help = "Send a fixed number of requests per second instead of using concurrent clients. [Load Testing Only]", nargs = "?", type = float, default = 0)
     args = parser.parse_args()
     
     if args.index:
-        CreateIndex(args.dataset, args.chunksize, args.offload, args.printing, None if args.maxDocs < 0 else args.maxDocs, args.breakpoints)
+        CreateIndex(args.dataset, args.chunksize, args.offload, args.printing, None if args.maxDocs < 0 else args.maxDocs, args.breakpoints, bool(args.resume), args.warmstart, args.publish)
     elif args.query:
         queryIndex(args.indexSource, args.cacheSize, args.update)
     elif args.refactor:
-        refactorIndex(args.indexSource, args.breakpoints, args.printing)
\ No newline at end of file
+        refactorIndex(args.indexSource, args.breakpoints, args.printing)
+    elif args.pack is not None:
+        packDataset(args.dataset, args.pack, args.printing)
+    elif args.summarize:
+        summarizeIndex(args.indexSource, args.printing)
+    elif args.requantize:
+        requantizeIndex(args.indexSource, args.printing)
+    elif args.optimize:
+        optimizeIndex(args.indexSource, args.printing)
+    elif args.stats:
+        indexStatistics(args.indexSource, args.cacheSize)
+    elif args.sweep is not None:
+        sweepSettings(args.indexSource, args.sweep, args.queries, args.judgments)
+    elif args.loadtest:
+        loadTestServer(args.indexSource, args.queries, args.url, args.duration, args.concurrency, args.rate)
\ No newline at end of file
@@ -6,4 +6,4 @@ def open_browser():
     webbrowser.open_new("http://127.0.0.1:5000/")
 
 Timer(1, open_browser).start()
-serve.app.run()
\ No newline at end of file
+serve.serve()
\ No newline at end of file
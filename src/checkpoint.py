@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import shutil
+import json
+import csv
+import os
+
+if TYPE_CHECKING:
+    from src.indexer import Indexer
+    from src.matrix import Matrix
+
+CHECKPOINT_FOLDER = "checkpoint"
+
+class CheckpointException(Exception):
+    pass
+
+class Checkpoint:
+    # append-only journals, each truncated to its size at the last good checkpoint on resume
+    JOURNALS = ("processed.txt", "simhashes.txt", "pages.csv", "fingerprints.csv", "documents.csv")
+
+    def __init__(self, folder: str = "index"):
+        """Persist the state of an index build at each offload so that it can be resumed.
+
+        The processed files, dedup fingerprints, link graph pages and finished documents are
+        appended to journals, and state.json records the size of each journal, the link spill
+        and the partial index counter. state.json is replaced atomically, so a crash during a
+        checkpoint leaves the previous one intact.
+
+        Args:
+            folder (str, optional): the index folder. Defaults to "index".
+        """
+        self.root = Path(folder)
+        self.folder = self.root / CHECKPOINT_FOLDER
+
+    def exists(self) -> bool:
+        return (self.folder / "state.json").exists()
+
+    def _append_(self, name: str, lines: list[str]) -> None:
+        with (self.folder / name).open("a", encoding = "utf-8", newline = "") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def save(self, indexer: Indexer, matrix: Matrix, count: int) -> None:
+        """Save a checkpoint. Call right after the matrix has been offloaded.
+
+        Args:
+            indexer (Indexer): the indexer.
+            matrix (Matrix): the matrix, with every document so far offloaded.
+            count (int): the number of pages indexed.
+        """
+        self.folder.mkdir(parents = True, exist_ok = True)
+        indexer.links.flush()
+        processed, simhashes, pages, fingerprints = indexer.drainJournal()
+        self._append_("processed.txt", [f"{p}\n" for p in processed])
+        self._append_("simhashes.txt", [f"{s}\n" for s in simhashes])
+        self._append_("pages.csv", [f"{n},{d}\n" for n,d in pages])
+        self._append_("fingerprints.csv", [f"{c},{u}\n" for c,u in fingerprints])
+        with (self.folder / "documents.csv").open("a", encoding = "utf-8", newline = "") as f:
+            csv.writer(f).writerows(matrix.drainDocuments())
+            f.flush()
+            os.fsync(f.fileno())
+
+        state = {
+            "count": count,
+            "counter": matrix._counter_,
+            "breakpoints": matrix._breakpoints_,
+            "links": os.stat(indexer.links.path).st_size if Path(indexer.links.path).exists() else 0,
+            "journals": {name: os.stat(self.folder / name).st_size for name in self.JOURNALS}
+        }
+        with (self.folder / "state.json.tmp").open("w") as f:
+            json.dump(state, f, indent = 4)
+        os.replace(self.folder / "state.json.tmp", self.folder / "state.json")
+
+    def breakpoints(self) -> list[str]:
+        """Return the breakpoints of the checkpointed build."""
+        with (self.folder / "state.json").open("r") as f:
+            return json.load(f)["breakpoints"]
+
+    def restore(self, indexer: Indexer, matrix: Matrix) -> int:
+        """Restore the indexer and matrix to the last checkpoint, discarding any later work.
+
+        Args:
+            indexer (Indexer): a new indexer for the same dataset.
+            matrix (Matrix): a new matrix on the same index folder, created without cleaning it.
+
+        Returns:
+            int: the number of pages indexed at the checkpoint.
+        """
+        if not self.exists():
+            raise CheckpointException(f"No checkpoint found in: {self.root}")
+        with (self.folder / "state.json").open("r") as f:
+            state = json.load(f)
+
+        # drop anything written after the checkpoint
+        for name,size in state["journals"].items():
+            with (self.folder / name).open("r+b") as f:
+                f.truncate(size)
+        indexer.links.resume(state["links"])
+        for p in self.root.glob(f"*partial*.*"):
+            if int(p.stem.split("partial")[-1]) >= state["counter"]:
+                p.unlink()
+
+        with (self.folder / "processed.txt").open("r", encoding = "utf-8") as f:
+            processed = [line.rstrip("\n") for line in f]
+        with (self.folder / "simhashes.txt").open("r") as f:
+            simhashes = [int(line) for line in f]
+        with (self.folder / "pages.csv").open("r") as f:
+            pages = [tuple(int(i) for i in line.split(",")) for line in f]
+        fingerprints = []
+        # checkpoints from before the pre-parse dedup have no fingerprints
+        if "fingerprints.csv" in state["journals"]:
+            with (self.folder / "fingerprints.csv").open("r") as f:
+                fingerprints = [tuple(int(i) for i in line.split(",")) for line in f]
+        indexer.restore(processed, simhashes, pages, fingerprints)
+        with (self.folder / "documents.csv").open("r", encoding = "utf-8", newline = "") as f:
+            matrix.restoreDocuments(csv.reader(f), state["counter"])
+        return state["count"]
+
+    def clear(self) -> None:
+        """Delete the checkpoint."""
+        shutil.rmtree(self.folder, ignore_errors = True)
@@ -16,20 +16,87 @@ class Config:
         # general options
         self.sim_thresh: float = float(parser["GENERAL"]["SIM_THRESH"])
         """Threshold for similarity detection."""
+        self.preparse_dedup: bool = bool(int(parser["GENERAL"]["PREPARSE_DEDUP"]))
+        """Whether pages with duplicate raw content or canonical urls are skipped before parsing."""
+        self.noise_params: list[str] = [p.strip().lower() for p in parser["GENERAL"]["NOISE_PARAMS"].split(",") if len(p.strip()) > 0]
+        """Query parameters left out of canonical urls, a trailing * matches any suffix."""
         self.k_results: int = int(parser["GENERAL"]["KRESULTS"])
         """Number of results to return."""
         self.r_docs: int = int(parser["GENERAL"]["RDOCS"])
         """Number of posts to traverse per term. Value < 0 indicates no limit."""
         self.pageRank_max_iters: int = int(parser["GENERAL"]["PAGERANK_MAX_ITERS"])
+        self.pageRank_tolerance: float = float(parser["GENERAL"]["PAGERANK_TOLERANCE"])
+        """Mean change of a page's rank in an iteration below which pagerank stops."""
         self.pageRank_damping_factor: float = float(parser["GENERAL"]["DAMPING_FACTOR"])
         self.index_src: str = parser["GENERAL"]["INDEX"]
         self.pagerank: bool = bool(int(parser["GENERAL"]["PAGERANK"]))
         self.openai_summary: bool = bool(int(parser["GENERAL"]["OPENAI_SUMMARY"]))
+        self.summarizer: str = parser["GENERAL"]["SUMMARIZER"]
+        """Summarizer used when OPENAI_SUMMARY is set: 'openai' or 'stub'."""
+        self.summary_cache: str = parser["GENERAL"]["SUMMARY_CACHE"]
+        self.summary_workers: int = int(parser["GENERAL"]["SUMMARY_WORKERS"])
+        self.summary_rate_limit: float = float(parser["GENERAL"]["SUMMARY_RATE_LIMIT"])
+        """Maximum summary requests per minute. Value <= 0 indicates no limit."""
+        self.summary_retries: int = int(parser["GENERAL"]["SUMMARY_RETRIES"])
+        self.impact_scores: bool = bool(int(parser["GENERAL"]["IMPACT_SCORES"]))
+        """Whether the querier ranks with the precomputed impact scores when they match the current weights."""
+        self.stopword_preload: bool = bool(int(parser["GENERAL"]["STOPWORD_PRELOAD"]))
+        """Whether the querier preloads the stopword postings, truncated to RDOCS."""
+        self.query_log: str = parser["GENERAL"]["QUERY_LOG"]
+        """File the search server appends the stemmed queries to. Empty disables the log."""
+        self.warm_terms: int = int(parser["GENERAL"]["WARM_TERMS"])
+        """Number of the most frequent logged terms to warm at server startup."""
+        self.spelling_distance: int = int(parser["GENERAL"]["SPELLING_DISTANCE"])
+        """Largest edit distance for spelling suggestions."""
+        self.spelling_budget: float = float(parser["GENERAL"]["SPELLING_BUDGET"])
+        """Time budget in ms for each spelling suggestion."""
+        self.result_cache_ttl: float = float(parser["GENERAL"]["RESULT_CACHE_TTL"])
+        """Seconds before a cached query ranking expires. Value <= 0 indicates no expiry."""
+        self.result_cache_size: int = int(parser["GENERAL"]["RESULT_CACHE_SIZE"])
+        """Maximum number of document ids held by the query result cache."""
+        self.component_cache_size: int = int(parser["GENERAL"]["COMPONENT_CACHE_SIZE"])
+        """Maximum number of documents held by the cache of unweighted score components."""
+        self.http_max_age: int = int(parser["GENERAL"]["HTTP_MAX_AGE"])
+        """Seconds browsers may reuse a search response before revalidating it."""
+        self.compress_min_size: int = int(parser["GENERAL"]["COMPRESS_MIN_SIZE"])
+        """Smallest search response in bytes which is compressed."""
+        self.index_watch: float = float(parser["GENERAL"]["INDEX_WATCH"])
+        """Seconds between checks for a rebuilt index in the search server. Value <= 0 disables the check."""
+        self.docstore_block_size: int = int(parser["GENERAL"]["DOCSTORE_BLOCK_SIZE"])
+        """Uncompressed bytes of page text per document store block."""
+        self.snippet_words: int = int(parser["GENERAL"]["SNIPPET_WORDS"])
+        """Number of words in each result snippet."""
+        self.query_budget: float = float(parser["GENERAL"]["QUERY_BUDGET"])
+        """Time budget in ms for ranking each query. Value <= 0 indicates no budget."""
+        self.max_inflight: int = int(parser["GENERAL"]["MAX_INFLIGHT"])
+        """Most search requests the server handles at once. Value <= 0 indicates no limit."""
+        self.server_workers: int = int(parser["GENERAL"]["SERVER_WORKERS"])
+        """Number of search server processes. Values > 1 fork workers sharing the loaded index."""
+        self.publish_pagerank: bool = bool(int(parser["GENERAL"]["PUBLISH_PAGERANK"]))
+        """Whether published snapshots use a provisional pagerank instead of uniform ranks."""
+        self.publish_keep: int = int(parser["GENERAL"]["PUBLISH_KEEP"])
+        """Number of published snapshots kept during indexing."""
         
+        self.setWeights({
+            "HEADER": header_weight,
+            "BOLD": bold_weight,
+            "TITLE": title_weight,
+            "COSINE_SIMILARITY": cosine_similarity_weight,
+            "CONJUNCTIVE": conjunctive_weight
+        })
+    
+    def setWeights(self, weights: dict[str: float]) -> None:
+        """Set the relevance score weights, normalizing them to sum to 1.
+
+        Args:
+            weights (dict[str: float]): the relative weights, keyed by their [WEIGHTS] names.
+        """
+        self.weights: dict[str: float] = dict(weights)
+        """The relative weights as given, before normalization."""
         # normalize weights
-        total = header_weight + bold_weight + title_weight + cosine_similarity_weight + conjunctive_weight
-        self.header_weight = header_weight / total
-        self.bold_weight = bold_weight / total
-        self.title_weight = title_weight / total
-        self.cosine_similarity_weight = cosine_similarity_weight / total
-        self.conjunctive_weight = conjunctive_weight / total
\ No newline at end of file
+        total = sum(weights.values())
+        self.header_weight = weights["HEADER"] / total
+        self.bold_weight = weights["BOLD"] / total
+        self.title_weight = weights["TITLE"] / total
+        self.cosine_similarity_weight = weights["COSINE_SIMILARITY"] / total
+        self.conjunctive_weight = weights["CONJUNCTIVE"] / total
\ No newline at end of file
@@ -0,0 +1,139 @@
+from pathlib import Path
+from collections.abc import Iterator
+import threading
+import queue
+import tarfile
+import gzip
+import json
+
+class CorpusException(Exception):
+    pass
+
+def _is_tar_(path: Path) -> bool:
+    return path.name.endswith((".tar", ".tar.gz", ".tgz"))
+
+def _is_jsonl_(path: Path) -> bool:
+    return path.name.endswith((".jsonl", ".jsonl.gz"))
+
+def iterDocuments(source: str) -> Iterator[tuple[Path, dict]]:
+    """Iterate over the pages of a corpus, in either layout.
+
+    Args:
+        source (str): a folder of json files, a (gzipped) jsonl file or a tar archive of json files.
+
+    Yields:
+        tuple[Path, dict]: the path of each page and its decoded json.
+    """
+    path = Path(source)
+    if path.is_dir():
+        for p in path.glob("**/*.json"):
+            with p.open("r") as f:
+                yield p, json.loads(f.read())
+    elif _is_jsonl_(path):
+        opener = gzip.open if path.name.endswith(".gz") else open
+        with opener(path, "rt", encoding = "utf-8") as f:
+            for i,line in enumerate(f):
+                if len(line.strip()) < 1:
+                    continue
+                data = json.loads(line)
+                yield Path(data.pop("path", f"{path}#{i}")), data
+    elif _is_tar_(path):
+        with tarfile.open(path, "r:*") as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".json"):
+                    yield Path(member.name), json.loads(tar.extractfile(member).read())
+    else:
+        raise CorpusException(f"Unsupported corpus: {source}")
+
+class PrefetchReader:
+    _END_ = object()
+
+    def __init__(self, source: str, size: int = 64):
+        """Read and decode a corpus on a background thread.
+
+        Args:
+            source (str): the corpus, see iterDocuments.
+            size (int, optional): the maximum number of decoded pages waiting to be used. Defaults to 64.
+        """
+        self._queue_: queue.Queue = queue.Queue(maxsize = max(size, 1))
+        self._error_: Exception = None
+        self._stop_ = threading.Event()
+        self._thread_ = threading.Thread(target = self._read_, args = (source,), daemon = True)
+        self._thread_.start()
+
+    def _read_(self, source: str) -> None:
+        documents = iterDocuments(source)
+        try:
+            for item in documents:
+                # wait for room in the queue, giving up if the reader was closed
+                while not self._stop_.is_set():
+                    try:
+                        self._queue_.put(item, timeout = 0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stop_.is_set():
+                    return
+        except Exception as e:
+            self._error_ = e
+        finally:
+            # close the corpus file now, not whenever the generator is collected
+            documents.close()
+        self._queue_.put(self._END_)
+
+    def __iter__(self) -> "PrefetchReader":
+        return self
+
+    def __next__(self) -> tuple[Path, dict]:
+        item = self._queue_.get()
+        if item is self._END_:
+            # keep the end marker for any further calls
+            self._queue_.put(self._END_)
+            if self._error_ is not None:
+                raise self._error_
+            raise StopIteration
+        return item
+
+    def __enter__(self) -> "PrefetchReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop the background thread, closing the corpus and dropping the pages read ahead."""
+        self._stop_.set()
+        # make room for a reader blocked on a full queue, so it sees the stop and exits
+        while self._thread_.is_alive():
+            try:
+                self._queue_.get(timeout = 0.1)
+            except queue.Empty:
+                pass
+        self._thread_.join()
+        while not self._queue_.empty():
+            self._queue_.get_nowait()
+        self._queue_.put(self._END_)
+
+def packCorpus(root: str, output: str) -> int:
+    """Pack a folder of json pages into a single jsonl file (gzipped if output ends with .gz).
+
+    Args:
+        root (str): the corpus folder.
+        output (str): the jsonl file to write.
+
+    Returns:
+        int: the number of pages packed.
+    """
+    if not Path(root).is_dir():
+        raise CorpusException(f"Corpus folder not found: {root}")
+    opener = gzip.open if output.endswith(".gz") else open
+    count = 0
+    with opener(output, "wt", encoding = "utf-8") as out:
+        for p in Path(root).glob("**/*.json"):
+            with p.open("r") as f:
+                data = json.loads(f.read())
+            # keep the original path so pages are still identified the same way
+            data["path"] = str(p)
+            out.write(json.dumps(data) + "\n")
+            count += 1
+    return count
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+import threading
+import struct
+import zlib
+import numpy as np
+
+DOCSTORE_FILE = "docstore.bin"
+MAGIC = b"DOCS"
+TRAILER = struct.Struct("<QQQ")
+"""Table offset, block count and document count, at the end of the file."""
+
+class DocStoreException(Exception):
+    pass
+
+class DocStoreWriter:
+    def __init__(self, path: str, blockSize: int = 16384):
+        """Write document texts into zlib-compressed blocks followed by an offset table.
+
+        Args:
+            path (str): the store file.
+            blockSize (int, optional): the uncompressed bytes of text per block. Defaults to 16384.
+        """
+        self.blockSize = blockSize
+        self._file_ = open(path, "wb")
+        self._file_.write(MAGIC)
+        self._block_: list[bytes] = []
+        self._block_size_ = 0
+        self._block_offsets_: list[int] = []
+        # (doc id, block, start within block, length) of each document
+        self._docs_: list[tuple[int, int, int, int]] = []
+
+    def add(self, docID: int, text: str) -> None:
+        """Append the text of a document."""
+        data = text.encode("utf-8")
+        self._docs_.append((docID, len(self._block_offsets_), self._block_size_, len(data)))
+        self._block_.append(data)
+        self._block_size_ += len(data)
+        if self._block_size_ >= self.blockSize:
+            self._flush_()
+
+    def addBlock(self, block: bytes, docs: list[tuple[int, int, int]]) -> None:
+        """Append an already compressed block and its (doc id, start, length) documents, eg: when merging stores."""
+        self._flush_()
+        self._docs_.extend((d, len(self._block_offsets_), start, length) for d,start,length in docs)
+        self._block_offsets_.append(self._file_.tell())
+        self._file_.write(block)
+
+    def _flush_(self) -> None:
+        if self._block_size_ < 1 and len(self._block_) < 1:
+            return None
+        self._block_offsets_.append(self._file_.tell())
+        self._file_.write(zlib.compress(b"".join(self._block_), 6))
+        self._block_.clear()
+        self._block_size_ = 0
+
+    def close(self) -> None:
+        """Write the last block and the offset table."""
+        self._flush_()
+        tableOffset = self._file_.tell()
+        docs = np.array(self._docs_, dtype = np.int64).reshape(-1, 4)
+        # sorted by doc id for binary search
+        docs = docs[np.argsort(docs[:, 0], kind = "stable")]
+        self._file_.write(np.array(self._block_offsets_ + [tableOffset], dtype = "<u8").tobytes())
+        self._file_.write(docs[:, 0].astype("<i8").tobytes())
+        self._file_.write(docs[:, 1:].astype("<u4").tobytes())
+        self._file_.write(TRAILER.pack(tableOffset, len(self._block_offsets_), len(docs)))
+        self._file_.close()
+
+class DocStore:
+    def __init__(self, path: str, cacheBlocks: int = 64):
+        """Read document texts from a block-compressed store, decompressing only the blocks needed.
+
+        Args:
+            path (str): the store file.
+            cacheBlocks (int, optional): the number of decompressed blocks to keep. Defaults to 64.
+
+        Raises:
+            DocStoreException: if the file is malformed.
+        """
+        self._file_ = open(path, "rb")
+        if self._file_.read(len(MAGIC)) != MAGIC:
+            raise DocStoreException(f"Malformed document store: {path}")
+        self._file_.seek(-TRAILER.size, 2)
+        tableOffset, blocks, count = TRAILER.unpack(self._file_.read(TRAILER.size))
+        self._file_.seek(tableOffset)
+        table = self._file_.read()
+        self.blockOffsets: np.ndarray = np.frombuffer(table, dtype = "<u8", count = blocks + 1)
+        self.ids: np.ndarray = np.frombuffer(table, dtype = "<i8", count = count, offset = 8 * (blocks + 1))
+        self.locations: np.ndarray = np.frombuffer(table, dtype = "<u4", count = 3 * count, offset = 8 * (blocks + 1 + count)).reshape(-1, 3)
+        self._cache_: OrderedDict[int: bytes] = OrderedDict()
+        self._cache_blocks_ = cacheBlocks
+        self._lock_ = threading.Lock()
+
+    @classmethod
+    def load(cls, folder: str) -> DocStore:
+        """Load the document store of the index in folder. Returns None if it has not been built."""
+        path = Path(f"{folder}/{DOCSTORE_FILE}")
+        if not path.exists():
+            return None
+        return cls(str(path))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def reopen(self) -> None:
+        """Open a new file handle and lock, eg: in a forked process which must not share the file position."""
+        self._file_ = open(self._file_.name, "rb")
+        self._lock_ = threading.Lock()
+
+    def close(self) -> None:
+        self._cache_.clear()
+        self._file_.close()
+
+    def readBlock(self, block: int, decompress: bool = True) -> bytes:
+        """Return a block, decompressed unless decompress is False."""
+        with self._lock_:
+            if decompress and block in self._cache_:
+                self._cache_.move_to_end(block)
+                return self._cache_[block]
+            self._file_.seek(int(self.blockOffsets[block]))
+            data = self._file_.read(int(self.blockOffsets[block+1] - self.blockOffsets[block]))
+            if not decompress:
+                return data
+            data = zlib.decompress(data)
+            self._cache_[block] = data
+            if len(self._cache_) > self._cache_blocks_:
+                self._cache_.popitem(last = False)
+            return data
+
+    def get(self, docID: int) -> str|None:
+        """Return the text of a document, or None if it is not in the store."""
+        i = int(np.searchsorted(self.ids, docID))
+        if i >= len(self.ids) or self.ids[i] != docID:
+            return None
+        block, start, length = (int(x) for x in self.locations[i])
+        return self.readBlock(block)[start:start+length].decode("utf-8", errors = "ignore")
+
+    def blocks(self) -> list[tuple[bytes, list[tuple[int, int, int]]]]:
+        """Return every compressed block with its (doc id, start, length) documents, in block order."""
+        order = np.argsort(self.locations[:, 0], kind = "stable")
+        docs: dict[int: list[tuple[int, int, int]]] = {}
+        for i in order.tolist():
+            block, start, length = (int(x) for x in self.locations[i])
+            docs.setdefault(block, []).append((int(self.ids[i]), start, length))
+        return [(self.readBlock(b, False), docs.get(b, [])) for b in range(len(self.blockOffsets) - 1)]
+
+def mergeDocStores(paths: list[str], output: str) -> int:
+    """Concatenate document stores into one without recompressing their blocks.
+
+    Args:
+        paths (list[str]): the stores to merge.
+        output (str): the merged store.
+
+    Returns:
+        int: the number of documents in the merged store.
+    """
+    writer = DocStoreWriter(output)
+    for p in paths:
+        store = DocStore(p)
+        for block,docs in store.blocks():
+            writer.addBlock(block, docs)
+        store.close()
+    writer.close()
+    return len(writer._docs_)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+import numpy as np
+import heapq
+from src.helpers import stableHash
+
+EDGE = np.dtype([("src", "<i8"), ("dst", "<i8")])
+"""A link from page src to page dst, both hashes of normalized urls."""
+
+def normalizeLink(base: str, href: str) -> str|None:
+    """Resolve a link against its page and normalize it so that links to the same page compare equal.
+
+    Args:
+        base (str): the url of the page containing the link.
+        href (str): the link.
+
+    Returns:
+        str|None: the normalized absolute url, or None if the link does not point to a web page.
+    """
+    if href is None:
+        return None
+    href = href.strip()
+    if len(href) < 1 or href.startswith(("#", "mailto:", "javascript:", "tel:")):
+        return None
+    try:
+        parts = urlsplit(urljoin(base, href))
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https"):
+        return None
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+def canonicalUrl(url: str, noise: list[str] = []) -> str:
+    """Canonicalize a page url so that variants of the same page compare equal.
+
+    The scheme and host are lowercased, the fragment is dropped and the query parameters are
+    sorted, leaving out the noise parameters which do not change the page.
+
+    Args:
+        url (str): the page url.
+        noise (list[str], optional): lowercase names of parameters to leave out, a trailing * matches any suffix. Defaults to [].
+
+    Returns:
+        str: the canonical url.
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    def isNoise(name: str) -> bool:
+        name = name.lower()
+        return any(name.startswith(n[:-1]) if n.endswith("*") else name == n for n in noise)
+    params = sorted((k, v) for k,v in parse_qsl(parts.query, keep_blank_values = True) if not isNoise(k))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(params), ""))
+
+def linkID(url: str) -> int:
+    """Return the graph node id of a normalized url."""
+    return stableHash(url)
+
+class EdgeSpill:
+    def __init__(self, path: str, bufferSize: int = 65536):
+        """Append link edges to a binary file instead of holding the graph in memory.
+
+        Args:
+            path (str): the spill file. Created on the first flush.
+            bufferSize (int, optional): the number of edges to buffer before writing. Defaults to 65536.
+        """
+        self.path = path
+        self.bufferSize = bufferSize
+        self.count: int = 0
+        self._buffer_: list[tuple[int, int]] = []
+        self._started_: bool = False
+
+    def add(self, src: int, dsts: Iterable[int]) -> None:
+        """Add the links from src to each of dsts."""
+        self._buffer_.extend((src, d) for d in dsts)
+        if len(self._buffer_) >= self.bufferSize:
+            self.flush()
+
+    def resume(self, size: int) -> None:
+        """Keep the edges of a previous run, discarding any written after its first size bytes."""
+        path = Path(self.path)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        with path.open("ab") as f:
+            f.truncate(size)
+        self.count = size // EDGE.itemsize
+        self._started_ = True
+
+    def flush(self) -> None:
+        """Write the buffered edges to the spill file."""
+        path = Path(self.path)
+        if not self._started_:
+            # truncate any spill left by a previous run
+            path.parent.mkdir(parents = True, exist_ok = True)
+            path.write_bytes(b"")
+            self._started_ = True
+        if len(self._buffer_) > 0:
+            with path.open("ab") as f:
+                np.array(self._buffer_, dtype = EDGE).tofile(f)
+            self.count += len(self._buffer_)
+            self._buffer_.clear()
+
+def _read_edges_(path: str, chunkSize: int) -> Iterator[np.ndarray]:
+    # read the spill file chunkSize edges at a time
+    with open(path, "rb") as f:
+        while True:
+            chunk = np.fromfile(f, dtype = EDGE, count = chunkSize)
+            if len(chunk) < 1:
+                return
+            yield chunk
+
+class LinkGraph:
+    def __init__(self, ids: np.ndarray, pages: dict[int: list[int]], indptr: np.ndarray, indices: np.ndarray, outDegree: np.ndarray, danglingOut: np.ndarray, danglingCount: int, files: list[str] = []):
+        """Compressed sparse row graph of the inbound links of the crawled pages.
+
+        Args:
+            ids (np.ndarray): the sorted node ids of the crawled pages.
+            pages (dict[int: list[int]]): the document ids of the pages at each node id.
+            indptr (np.ndarray): the inbound links of node i are indices[indptr[i]:indptr[i+1]].
+            indices (np.ndarray): the node numbers of the linking pages.
+            outDegree (np.ndarray): the number of outbound links of each node.
+            danglingOut (np.ndarray): the number of outbound links of each node to pages which were not crawled.
+            danglingCount (int): the number of distinct pages which were linked to but not crawled.
+            files (list[str], optional): files backing the graph, deleted by close. Defaults to [].
+        """
+        self.ids = ids
+        self.pages = pages
+        self.indptr = indptr
+        self.indices = indices
+        self.outDegree = outDegree
+        self.danglingOut = danglingOut
+        self.danglingCount = danglingCount
+        self._files_ = files
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nodeCount(self) -> int:
+        """Return the number of nodes, including the pages which were linked to but not crawled."""
+        return len(self.ids) + self.danglingCount
+
+    def close(self) -> None:
+        """Release the graph and delete its backing files."""
+        self.indices = None
+        for f in self._files_:
+            Path(f).unlink(missing_ok = True)
+
+def buildGraph(spillPath: str, pages: dict[int: list[int]], chunkSize: int = 1048576) -> LinkGraph:
+    """Build the inbound link CSR graph from a spill file with an external counting sort.
+
+    Only chunkSize edges are held in memory at a time. The CSR indices are written to a
+    memory-mapped file next to the spill file.
+
+    Args:
+        spillPath (str): the edge spill file.
+        pages (dict[int: list[int]]): the document ids of the crawled pages at each node id.
+        chunkSize (int, optional): the number of edges to process at a time. Defaults to 1048576.
+
+    Returns:
+        LinkGraph: the graph.
+    """
+    ids = np.array(sorted(pages.keys()), dtype = np.int64)
+    n = len(ids)
+    outDegree = np.zeros(n, dtype = np.int64)
+    inDegree = np.zeros(n, dtype = np.int64)
+    danglingOut = np.zeros(n, dtype = np.int64)
+    runs: list[str] = []
+    exists = Path(spillPath).exists() and n > 0
+
+    def locate(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # node numbers of the values and whether each is a crawled page
+        pos = np.minimum(np.searchsorted(ids, values), n - 1)
+        return pos, ids[pos] == values
+
+    # first pass: degrees, and sorted runs of the dangling targets
+    if exists:
+        for chunk in _read_edges_(spillPath, chunkSize):
+            chunk = chunk[locate(chunk["src"])[1]]
+            src, _ = locate(chunk["src"])
+            dst, crawled = locate(chunk["dst"])
+            outDegree += np.bincount(src, minlength = n)
+            inDegree += np.bincount(dst[crawled], minlength = n)
+            danglingOut += np.bincount(src[~crawled], minlength = n)
+            run = f"{spillPath}.run{len(runs)}.npy"
+            np.save(run, np.unique(chunk["dst"][~crawled]))
+            runs.append(run)
+
+    # count the distinct dangling targets by merging the runs
+    danglingCount = 0
+    previous = None
+    for d in heapq.merge(*(np.load(r, mmap_mode = "r") for r in runs)):
+        if d != previous:
+            danglingCount += 1
+            previous = d
+    for r in runs:
+        Path(r).unlink()
+
+    indptr = np.zeros(n + 1, dtype = np.int64)
+    np.cumsum(inDegree, out = indptr[1:])
+    indicesPath = f"{spillPath}.indices.npy"
+    indices = np.lib.format.open_memmap(indicesPath, mode = "w+", dtype = np.int32, shape = (max(int(indptr[-1]), 1),))
+
+    # second pass: scatter each crawled link into its target's row
+    if exists:
+        fill = indptr[:-1].copy()
+        for chunk in _read_edges_(spillPath, chunkSize):
+            chunk = chunk[locate(chunk["src"])[1]]
+            src, _ = locate(chunk["src"])
+            dst, crawled = locate(chunk["dst"])
+            src, dst = src[crawled], dst[crawled]
+            order = np.argsort(dst, kind = "stable")
+            src, dst = src[order], dst[order]
+            # rank of each edge within its target's group in this chunk
+            rank = np.arange(len(dst)) - np.searchsorted(dst, dst, side = "left")
+            indices[fill[dst] + rank] = src
+            fill += np.bincount(dst, minlength = n)
+        indices.flush()
+
+    return LinkGraph(ids, pages, indptr, indices, outDegree, danglingOut, danglingCount, [indicesPath])
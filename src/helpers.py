@@ -1,4 +1,3 @@
-from bs4.element import Comment, NavigableString
 import re
 import hashlib
 from collections.abc import Iterable
@@ -15,20 +14,16 @@ def tokenize(input_str: str) -> list[str]:
     WORD = re.compile(r"[\w+]+")
     return WORD.findall(input_str)
 
-def tag_visible(element: NavigableString) -> bool:
-    """Checks if the given element is a visible tag.
+def stableHash(text: str) -> int:
+    """Hash a string to a signed 64 bit int which, unlike hash, is the same in every process.
 
     Args:
-        element (NavigableString): the BeautifulSoup NavigableString to check.
+        text (str): the string to hash.
 
     Returns:
-        bool: True if element is visible to users when the page is rendered, else False
+        int: the hash
     """
-    if element.parent.name in ["style", "script", "head", "meta", "[document]", "a", "img"]:
-        return False
-    if isinstance(element, Comment):
-        return False
-    return True
+    return int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little", signed = True)
 
 def computeWordFrequencies(tokens: list[str]) -> dict[str:int]:
     """Computes the frequencies of each token in the tokens list
@@ -0,0 +1,162 @@
+from __future__ import annotations
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import time
+import gc
+import os
+from src.query import Queryier
+from src.publish import resolveIndex
+
+def residentMemory() -> int:
+    """Return the resident memory of this process in bytes (the peak if the current size is unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        # ru_maxrss is in kb on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _Generation_:
+    def __init__(self, queryier: Queryier):
+        # a loaded index and the number of requests using it
+        self.queryier = queryier
+        self.inflight = 0
+        self.retired = False
+
+class IndexSwapper:
+    def __init__(self, indexLoc: str, load: Callable[[str], Queryier], warm: Callable[[Queryier], None] = None):
+        """Serve queries from an index which can be replaced without stopping the server.
+
+        A reload loads and warms the new index on a background thread, then switches new
+        requests to it. The old index is closed once the requests using it have finished.
+
+        Args:
+            indexLoc (str): the index folder to load first.
+            load (Callable[[str], Queryier]): creates the querier for an index folder.
+            warm (Callable[[Queryier], None], optional): warms a new querier before it is switched in. Defaults to None.
+        """
+        self.indexLoc = indexLoc
+        self._load_ = load
+        self._warm_ = warm
+        self._lock_ = threading.Lock()
+        self._reloading_ = threading.Lock()
+        self._current_ = _Generation_(load(indexLoc))
+        self._watcher_: threading.Thread = None
+        self.status: dict = {"state": "idle", "index": indexLoc, "version": self._current_.queryier.version}
+        """State of the last reload, with its timings and memory use. Replaced whole on every change, never changed in place."""
+
+    @property
+    def current(self) -> Queryier:
+        """The querier new requests are sent to."""
+        return self._current_.queryier
+
+    @property
+    def inflight(self) -> int:
+        """The number of requests using the current querier."""
+        return self._current_.inflight
+
+    @contextmanager
+    def acquire(self) -> Iterator[Queryier]:
+        """Use the current querier for one request, keeping it open until the request finishes."""
+        with self._lock_:
+            generation = self._current_
+            generation.inflight += 1
+        try:
+            yield generation.queryier
+        finally:
+            with self._lock_:
+                generation.inflight -= 1
+                free = generation.retired and generation.inflight == 0
+            if free:
+                self._free_(generation)
+
+    def _set_status_(self, changes: dict, reset: bool = False) -> None:
+        # readers hold the old dict, so they never see a half updated status
+        with self._lock_:
+            self.status = {**({} if reset else self.status), **changes}
+
+    def _free_(self, generation: _Generation_) -> None:
+        generation.queryier.close()
+        generation.queryier = None
+        gc.collect()
+        self._set_status_({"memoryAfter": residentMemory(), "freed": True})
+
+    def _swap_(self, indexLoc: str) -> None:
+        start = time.time()
+        self._set_status_({"state": "loading", "index": indexLoc, "memoryBefore": residentMemory()}, reset = True)
+        try:
+            queryier = self._load_(indexLoc)
+            self._set_status_({"loadTime": (time.time() - start) * 1000})
+            if self._warm_ is not None:
+                self._set_status_({"state": "warming"})
+                warmStart = time.time()
+                self._warm_(queryier)
+                self._set_status_({"warmTime": (time.time() - warmStart) * 1000})
+        except Exception as e:
+            # keep serving the old index
+            self._set_status_({"state": "failed", "error": repr(e)})
+            return None
+        # both indexes are loaded at this point
+        self._set_status_({"memoryPeak": residentMemory()})
+
+        with self._lock_:
+            old = self._current_
+            self._current_ = _Generation_(queryier)
+            self.indexLoc = indexLoc
+            old.retired = True
+            free = old.inflight == 0
+            # published with the swap, so a request on the new index never sees the old status
+            self.status = {**self.status, "state": "swapped", "version": queryier.version, "freed": False, "swapTime": (time.time() - start) * 1000}
+        if free:
+            self._free_(old)
+
+    def reload(self, indexLoc: str = None, wait: bool = False) -> bool:
+        """Load an index in the background and switch to it.
+
+        Args:
+            indexLoc (str, optional): the index folder. Defaults to the current index folder.
+            wait (bool, optional): whether to wait for the swap to finish. Defaults to False.
+
+        Returns:
+            bool: False if a reload is already running.
+        """
+        if not self._reloading_.acquire(blocking = False):
+            return False
+        def run() -> None:
+            try:
+                self._swap_(indexLoc or self.indexLoc)
+            finally:
+                self._reloading_.release()
+        thread = threading.Thread(target = run, daemon = True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def modified(self) -> int|None:
+        """Return the modification time of the index's meta.json (or the published snapshot's, while it is building), None if it is missing."""
+        try:
+            return os.stat(Path(resolveIndex(self.indexLoc)) / "meta.json").st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Reload the index whenever its meta.json changes, checking every interval seconds.
+
+        Indexing writes meta.json last, so a change means the new index is complete. While an index
+        is being built, each snapshot it publishes is swapped in the same way.
+        """
+        last = self.modified()
+        def run() -> None:
+            nonlocal last
+            while True:
+                time.sleep(interval)
+                current = self.modified()
+                if current is not None and current != last and self.reload(wait = True) and self.status["state"] != "failed":
+                    last = current
+        self._watcher_ = threading.Thread(target = run, daemon = True)
+        self._watcher_.start()
+        return self._watcher_
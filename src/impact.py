@@ -0,0 +1,117 @@
+from msgspec.json import decode
+from pathlib import Path
+import json
+import csv
+import math
+import io
+import os
+from src.config import Config
+
+IMPACT_LEVELS = 255
+"""Impacts are quantized to integers in [0, IMPACT_LEVELS], fitting in 8 bits."""
+IMPACT_MIN = 1e-6
+"""The smallest score given its own level, smaller scores are raised to it."""
+IMPACT_SCALE = "log"
+"""How the impacts are quantized, saved in the index metadata so impacts quantized another way are not used."""
+IMPACT_VALUES = [0.0] + [IMPACT_MIN ** (1 - (l-1) / (IMPACT_LEVELS-1)) for l in range(1, IMPACT_LEVELS+1)]
+"""The score each impact level stands for, level 0 is a score of 0."""
+
+class ImpactException(Exception):
+    pass
+
+def impactWeights(config: Config) -> list[float]:
+    """Return the weights folded into the impacts, saved in the index metadata to detect stale impacts."""
+    return [config.cosine_similarity_weight, config.header_weight, config.title_weight, config.bold_weight]
+
+def impactScore(post: dict, length: float, config: Config) -> int:
+    """Compute the quantized impact of a posting.
+
+    The impact folds the document-length normalized tf score and the header, title and
+    bold field weights into one integer. The normalized weights sum to at most 1 and the
+    normalized tf is at most 1, so scores fall in [0, 1]. Levels 1 to IMPACT_LEVELS are
+    spaced evenly on a log scale from IMPACT_MIN to 1, so the small tf scores of long
+    documents get as many levels as the field weights: each step is a factor of
+    IMPACT_MIN**(-1/254), about 1.056, and IMPACT_VALUES[impact] is within 2.8% of the
+    score (or under IMPACT_MIN from it, for scores below IMPACT_MIN).
+
+    Args:
+        post (dict): the posting.
+        length (float): the normalized length of the posting's document.
+        config (Config): the config holding the weights.
+
+    Returns:
+        int: the quantized impact.
+    """
+    tf = 1 + math.log10(post["frequency"])
+    score = config.cosine_similarity_weight * tf / length
+    if post["header"]:
+        score += config.header_weight
+    if post["title"]:
+        score += config.title_weight
+    if post["bold"]:
+        score += config.bold_weight
+    if score <= 0:
+        return 0
+    level = 1 + round(math.log(max(score, IMPACT_MIN) / IMPACT_MIN) / -math.log(IMPACT_MIN) * (IMPACT_LEVELS-1))
+    return min(IMPACT_LEVELS, level)
+
+def requantize(indexPath: str, printing: bool = True) -> int:
+    """Recompute the impacts of an index for the current [WEIGHTS], without rebuilding it.
+
+    Args:
+        indexPath (str): the location of the index folder.
+        printing (bool, optional): whether to print progress markers. Defaults to True.
+
+    Returns:
+        int: the number of terms rewritten.
+    """
+    config = Config()
+    try:
+        with open(f"{indexPath}/meta.json", "r") as f:
+            meta = json.load(f)
+        filename = meta["filename"]
+        segments = len(meta["breakpoints"]) + 1
+    except FileNotFoundError:
+        raise ImpactException(f"Index metadata file not found at: {indexPath}")
+    except KeyError:
+        raise ImpactException(f"Malformed metadata: {indexPath}/meta.json")
+
+    # normalized document lengths
+    lengths: dict[int: float] = {}
+    with open(f"{indexPath}/documents.csv", "r", encoding = "utf-8") as f:
+        for row in csv.reader(f):
+            lengths[int(row[0])] = float(row[2])
+
+    index: dict[str: list[int]] = {}
+    for i in range(segments):
+        if printing:
+            print("Requantizing Segment:", i)
+        path = Path(f"{indexPath}/{filename}{i}.csv")
+        with path.open(mode = "r", encoding = "utf-8", newline = "") as f, open(f"{path}.tmp", mode = "wb") as out:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            pos = 0
+            for row in csv.reader(f):
+                postings = [decode(p) for p in row[2:]]
+                for p in postings:
+                    p["impact"] = impactScore(p, lengths[p["id"]], config)
+                writer.writerow([row[0], row[1], *[json.dumps(p) for p in postings]])
+                # track the byte position of each row for the meta index
+                line = buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+                index[row[0]] = [pos, i]
+                out.write(line)
+                pos += len(line)
+        os.replace(f"{path}.tmp", path)
+
+    with open(f"{indexPath}/meta_index.json", "w") as f:
+        json.dump(index, f, indent = 4)
+    meta["impactWeights"] = impactWeights(config)
+    meta["impactScale"] = IMPACT_SCALE
+    with open(f"{indexPath}/meta.json", "w") as f:
+        json.dump(meta, f, indent = 4)
+
+    if printing:
+        print("Requantizing Complete")
+    return len(index)
@@ -1,32 +1,46 @@
 from pathlib import Path
 from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
 from bs4.builder import XMLParsedAsHTMLWarning
+from bs4.element import Comment, NavigableString
 import warnings
-import json
+import time
 import re
 from nltk.stem import SnowballStemmer
-import openai
-import os
 from enum import Enum
-from src.helpers import tokenize, tag_visible, computeWordFrequencies, simhash, simHashSimilarity
+from src.helpers import tokenize, computeWordFrequencies, simhash, simHashSimilarity, stableHash
 from src.config import Config
+from src.summarizer import SummaryCache, SummaryPipeline, getSummarizer, textKey
+from src.corpus import PrefetchReader
+from src.graph import EdgeSpill, LinkGraph, buildGraph, normalizeLink, canonicalUrl, linkID
 
 warnings.filterwarnings("ignore", category = XMLParsedAsHTMLWarning)
 warnings.filterwarnings("ignore", category = MarkupResemblesLocatorWarning)
 
-openai.organization = "org-2egDI4pNkT6wiQgGhN5anyC6"
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 SMALL_DATASET_ROOT = "data/analyst_dataset"
 LARGE_DATASET_ROOT = "data/developer_dataset"
 
+def tag_visible(element: NavigableString) -> bool:
+    """Checks if the given element is a visible tag.
+
+    Args:
+        element (NavigableString): the BeautifulSoup NavigableString to check.
+
+    Returns:
+        bool: True if element is visible to users when the page is rendered, else False
+    """
+    if element.parent.name in ["style", "script", "head", "meta", "[document]", "a", "img"]:
+        return False
+    if isinstance(element, Comment):
+        return False
+    return True
+
 class TagType(Enum):
     TITLE = 0
     HEADER = 1
     BOLD = 2
 
 class Site:
-    def __init__(self, path: Path, tokens: dict[str: int], url: str, headers: set[str], bold: set[str], titles: set[str], title: str, summary: str):
+    def __init__(self, path: Path, tokens: dict[str: int], url: str, headers: set[str], bold: set[str], titles: set[str], title: str, summary: str, textHash: str, text: str, surfaces: dict[str: dict[str: int]]):
         self.path: Path = path
         self.tokens: dict[str: int] = tokens
         self.url: str = url
@@ -35,43 +49,76 @@ class Site:
         self.bold: set[str] = bold
         self.title: str = title
         self.summary: str = summary
+        self.textHash: str = textHash
+        self.text: str = text
+        self.surfaces: dict[str: dict[str: int]] = surfaces
 
 class Indexer:
-    def __init__(self, dataset: str = "test", summaries: bool = False):
+    def __init__(self, dataset: str = "test", summaries: bool = False, prefetch: int = 64, linkSpill: str = "index/links.bin"):
         """Create Indexer
 
         Args:
-            dataset (str, optional): 'large' or 'test'. Which dataset to run on. Defaults to 'test'. \n
-            summaries (bool, optional): whether to use the openai api to summarize the page. Defaults to False.
+            dataset (str, optional): 'large', 'test', or the path to a dataset folder, (gzipped) jsonl file or tar archive. Which dataset to run on. Defaults to 'test'. \n
+            summaries (bool, optional): whether to summarize the pages in the background. Defaults to False. \n
+            prefetch (int, optional): how many pages to read and decode ahead of parsing. Defaults to 64. \n
+            linkSpill (str, optional): the file link edges are appended to during indexing. Defaults to 'index/links.bin'.
         """
         if dataset == "large":
             self._dataset = LARGE_DATASET_ROOT
+        elif dataset != "test" and Path(dataset).exists():
+            self._dataset = dataset
         else:
             self._dataset = SMALL_DATASET_ROOT
 
-        self._getNextUrl = (url for url in Path(self._dataset).glob("**/*.json"))
+        # pages are read and decoded on a background thread
+        self._getNextUrl = PrefetchReader(self._dataset, prefetch)
         self.stemmer = SnowballStemmer("english")
         self.config = Config()
         self.simHashes: set[int] = set()
+        # hashes of the raw content and canonical url of every page which was parsed
+        self.contentHashes: set[int] = set()
+        self.canonicalUrls: set[int] = set()
+        self.dedupStats: dict[str: float] = {"exactDuplicates": 0, "urlVariants": 0, "parsed": 0, "parseTime": 0, "hashTime": 0}
+        """Pages skipped before parsing, and the time spent parsing and hashing pages, in seconds."""
         self.summaries: bool = summaries
-        self.links: dict[int: list[set[int], int]] = {}
+        self.summaryCache: SummaryCache = SummaryCache(self.config.summary_cache) if summaries else None
+        self.summaryPipeline: SummaryPipeline = None
+        if summaries:
+            self.summaryPipeline = SummaryPipeline(
+                getSummarizer(self.config.summarizer),
+                self.summaryCache,
+                self.config.summary_workers,
+                self.config.summary_rate_limit,
+                self.config.summary_retries
+            )
+        self.links: EdgeSpill = EdgeSpill(linkSpill)
+        self.pages: dict[int: list[int]] = {}
+        # files already indexed by a resumed build
+        self._skip_: set[str] = set()
+        # work since the last checkpoint: processed files, new simhashes, new (node, docid) pages, new (content, url) fingerprints
+        self._journal_: tuple[list[str], list[int], list[tuple[int, int]], list[tuple[int, int]]] = ([], [], [], [])
     
     def _validate_filetype_(self, url: str) -> bool:
         """Returns False if the url has an invalid filetype, else True."""
         return not re.match(r".*\.(txt|log|xml|git)", url.lower())
     
-    def _parse_html_(self, html: str) -> tuple[list[str], set[str], set[str], set[str], str, set[str]]:
+    def _parse_html_(self, html: str) -> tuple[list[str], set[str], set[str], set[str], str, dict[str: dict[str: int]], list[str], set[str]]:
         soup = BeautifulSoup(html, "lxml")
         
         # extract all visible text segments
         texts: list[str] = []
         tokens: list[str] = []
+        # the unstemmed forms of each term, to show terms to users
+        surfaces: dict[str: dict[str: int]] = {}
         for t in soup.findAll(string = True):
             if tag_visible(t):
                 texts.append(t)
                 # tokenize and stem the text segments
                 for tok in tokenize(t):
-                    tokens.append(self.stemmer.stem(tok))
+                    term = self.stemmer.stem(tok)
+                    tokens.append(term)
+                    forms = surfaces.setdefault(term, {})
+                    forms[tok.lower()] = forms.get(tok.lower(), 0) + 1
         
         headers: set[str] = set()
         bold: set[str] = set()
@@ -101,7 +148,33 @@ class Indexer:
                     case TagType.HEADER:
                         headers.add(self.stemmer.stem(tok))
         
-        return tokens, headers, bold, titles, None if len(title) < 1 else title[0], self.summarize(". ".join(texts)), links
+        return tokens, headers, bold, titles, None if len(title) < 1 else title[0], surfaces, texts, links
+    
+    def _seen_before_(self, url: str, content: str) -> bool:
+        """Check the raw content and canonical url of a page against the pages already parsed, recording them if they are new."""
+        start = time.perf_counter()
+        content = stableHash(content)
+        url = stableHash(canonicalUrl(url, self.config.noise_params))
+        seen = True
+        if content in self.contentHashes:
+            self.dedupStats["exactDuplicates"] += 1
+        elif url in self.canonicalUrls:
+            self.dedupStats["urlVariants"] += 1
+        else:
+            self.contentHashes.add(content)
+            self.canonicalUrls.add(url)
+            self._journal_[3].append((content, url))
+            seen = False
+        self.dedupStats["hashTime"] += time.perf_counter() - start
+        return seen
+    
+    def dedupReport(self) -> str:
+        """Summarize the pages skipped before parsing and the parse time they saved."""
+        s = self.dedupStats
+        mean = s["parseTime"] / s["parsed"] if s["parsed"] > 0 else 0
+        skipped = s["exactDuplicates"] + s["urlVariants"]
+        return (f"{s['exactDuplicates']} exact duplicates and {s['urlVariants']} url variants skipped before parsing, saving ~{skipped * mean:.2f} s of parsing " +
+            f"(mean {mean * 1000:.2f} ms over {s['parsed']} parsed pages, hashing took {s['hashTime']:.2f} s)")
     
     def _sim_in_set_(self, sim: int) -> bool:
         if sim in self.simHashes:
@@ -111,43 +184,69 @@ class Indexer:
                 if simHashSimilarity(sim, s) > self.config.sim_thresh:
                     return True
         self.simHashes.add(sim)
+        self._journal_[1].append(sim)
         return False
     
-    def summarize(self, text: str) -> str:
+    def summarize(self, key: str, text: str) -> str:
+        """Return the cached summary of the page text, queueing the page for summarization if there is none.
+
+        Args:
+            key (str): the hash of the page text.
+            text (str): the page text.
+
+        Returns:
+            str: the summary, empty until the pipeline has produced it.
+        """
         if not self.summaries:
             return ""
-        
-        response = openai.Completion.create(
-            engine = "text-davinci-003",
-            prompt = f"Summarize this text using less than 40 words:\n{text[:2048]}\nSummary:",
-            temperature = 0.5,
-            max_tokens = 40,
-            n = 1,
-            stop = None
-        )
-        return response.choices[0].text.strip()
+        summary = self.summaryCache.get(key)
+        if summary is None:
+            self.summaryPipeline.submit(key, text)
+            return ""
+        return summary
+    
+    def closeReader(self) -> None:
+        """Stop reading the dataset, closing it and dropping the pages read ahead. Call once indexing stops."""
+        self._getNextUrl.close()
+    
+    def closeSummaries(self, pendingPath: str = None) -> int:
+        """Stop the summary pipeline without waiting for it, saving unfinished pages to pendingPath.
+
+        Returns:
+            int: the number of unfinished pages.
+        """
+        if self.summaryPipeline is None:
+            return 0
+        return self.summaryPipeline.close(False, pendingPath)
+    
+    def _link_node_(self, base: str, href: str) -> int|None:
+        """Return the graph node id of a link, shared by the url variants which are skipped as duplicates of one page."""
+        link = normalizeLink(base, href)
+        return None if link is None else linkID(canonicalUrl(link, self.config.noise_params))
     
     def _add_links_(self, url: str, links: set[str]):
-        id = hash(url)
-        idSet = set(hash(i) for i in links)
-        if id not in self.links:
-            self.links[id] = [set(), len(links)]
-        else:
-            self.links[id][1] += len(links)
-        for l in idSet:
-            if l not in self.links:
-                self.links[l] = [set(), 0]
-            self.links[l][0].add(id)
+        # the graph node of the page, shared by urls which normalize the same
+        node = self._link_node_(url, url)
+        if node is None:
+            node = linkID(url)
+        self.pages.setdefault(node, []).append(stableHash(url))
+        self._journal_[2].append((node, stableHash(url)))
+        targets = set(t for t in (self._link_node_(url, h) for h in links) if t is not None)
+        self.links.add(node, targets)
     
-    def _tokenize_(self, url: Path) -> tuple[dict[str: int], str, set[str], set[str], set[str], str, str] | None:
-        # load file
-        with url.open("r") as f:
-            data = json.loads(f.read())
+    def _tokenize_(self, data: dict) -> tuple[dict[str: int], str, set[str], set[str], set[str], str, str, str, str, dict[str: dict[str: int]]] | None:
         # skip certain file types
         if not self._validate_filetype_(data["url"].split("#")[0]):
             return None
+        # skip exact duplicates and url variants without parsing them
+        if self.config.preparse_dedup and self._seen_before_(data["url"].split("#")[0], data["content"]):
+            return None
         # parse html
-        *tokens, links = self._parse_html_(data["content"])
+        start = time.perf_counter()
+        *tokens, surfaces, texts, links = self._parse_html_(data["content"])
+        self.dedupStats["parseTime"] += time.perf_counter() - start
+        self.dedupStats["parsed"] += 1
+        text = ". ".join(texts)
         # compute frequencies
         freqs = computeWordFrequencies(tokens[0])
         # check simhash
@@ -155,18 +254,51 @@ class Indexer:
             return None
         # add links
         self._add_links_(data["url"].split("#")[0], links)
+        # summarize only pages which made it past the similarity check
+        key = textKey(text)
         
-        return freqs, data["url"].split("#")[0], *tokens[1:]
+        # the visible text with its whitespace collapsed, for snippets
+        visible = " ".join(w for t in texts for w in t.split())
+        return freqs, data["url"].split("#")[0], *tokens[1:], self.summarize(key, text), key, visible, surfaces
     
-    def getLinks(self) -> dict[int: tuple[set[int], int]]:
-        return self.links
+    def drainJournal(self) -> tuple[list[str], list[int], list[tuple[int, int]], list[tuple[int, int]]]:
+        """Return the processed files, simhashes, pages and fingerprints added since the last call, and reset them."""
+        journal = self._journal_
+        self._journal_ = ([], [], [], [])
+        return journal
+    
+    def restore(self, processed: list[str], simhashes: list[int], pages: list[tuple[int, int]], fingerprints: list[tuple[int, int]] = []) -> None:
+        """Restore the state of a checkpointed build, so that its files are skipped.
+
+        Args:
+            processed (list[str]): the files already processed.
+            simhashes (list[int]): the simhashes of the pages already indexed.
+            pages (list[tuple[int, int]]): the (graph node, document id) of the pages already indexed.
+            fingerprints (list[tuple[int, int]], optional): the (raw content hash, canonical url hash) of the pages already parsed. Defaults to [].
+        """
+        self._skip_.update(processed)
+        self.simHashes.update(simhashes)
+        for content,url in fingerprints:
+            self.contentHashes.add(content)
+            self.canonicalUrls.add(url)
+        for node,doc in pages:
+            self.pages.setdefault(node, []).append(doc)
+    
+    def getLinks(self) -> LinkGraph:
+        """Build the link graph from the edges spilled during indexing."""
+        self.links.flush()
+        return buildGraph(self.links.path, self.pages)
     
     def getNextSite(self) -> Site:
-        try:
-            file = next(self._getNextUrl)
-        except StopIteration:
-            return None
-        parts = self._tokenize_(file)
-        if parts is None:
-            return self.getNextSite()
-        return Site(file, *parts)
+        # skip pages until one is not rejected
+        while True:
+            try:
+                file, data = next(self._getNextUrl)
+            except StopIteration:
+                return None
+            if len(self._skip_) > 0 and str(file) in self._skip_:
+                continue
+            self._journal_[0].append(str(file))
+            parts = self._tokenize_(data)
+            if parts is not None:
+                return Site(file, *parts)
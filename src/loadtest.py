@@ -0,0 +1,173 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+import subprocess
+import asyncio
+import socket
+import time
+import sys
+import os
+import re
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+PERCENTILES = (50, 90, 95, 99)
+
+class LoadTestException(Exception):
+    pass
+
+def loadQueries(path: str) -> list[str]:
+    """Read a query mix, one query per line.
+
+    Markdown headers and trailing [notes] are ignored, so TEST.txt and query logs both work.
+
+    Args:
+        path (str): the query file.
+
+    Returns:
+        list[str]: the queries.
+    """
+    queries = []
+    with open(path, "r", encoding = "utf-8") as f:
+        for line in f:
+            line = re.sub(r"\[.*\]", "", line).strip()
+            if len(line) > 0 and not line.startswith("#"):
+                queries.append(line)
+    if len(queries) < 1:
+        raise LoadTestException(f"No queries in: {path}")
+    return queries
+
+def _free_port_() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def startServer(index: str, port: int = None, timeout: float = 120) -> tuple[subprocess.Popen, str]:
+    """Start the search server on localhost in a separate process and wait until it answers.
+
+    Args:
+        index (str): the index folder to serve.
+        port (int, optional): the port. Defaults to a free port.
+        timeout (float, optional): seconds to wait for the server. Defaults to 120.
+
+    Raises:
+        LoadTestException: if the server exits or does not answer in time.
+
+    Returns:
+        tuple[subprocess.Popen, str]: the server process and its base url.
+    """
+    port = port or _free_port_()
+    # run from the current folder so the server reads the same config.ini, but keep the replayed queries out of its query log
+    env = {**os.environ, "SEARCH_INDEX": str(Path(index).resolve()), "QUERY_LOG": "", "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+    server = subprocess.Popen(
+        [sys.executable, "-c", f"from gui.flaskServe import serve; serve(port = {port})"],
+        env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise LoadTestException(f"Server exited with code {server.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout = 1):
+                return server, url
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise LoadTestException(f"Server did not start within {timeout} seconds")
+
+@dataclass
+class LoadReport:
+    duration: float
+    """Wall time of the run in seconds."""
+    latencies: list[float] = field(default_factory = list)
+    """Client observed latency of each successful request in ms."""
+    serverTimes: list[float] = field(default_factory = list)
+    """Server reported search time of each successful request in ms."""
+    errors: int = 0
+    rejected: int = 0
+    """Requests the server turned away with a 503, also counted as errors."""
+    partial: int = 0
+    """Successful requests whose ranking ran out of the server's time budget."""
+
+    def requests(self) -> int:
+        return len(self.latencies) + self.errors
+
+    def summary(self) -> dict:
+        """Return throughput, error rate and latency percentiles."""
+        latencies = np.array(self.latencies)
+        serverTimes = np.array(self.serverTimes)
+        def percentiles(values: np.ndarray) -> dict:
+            if len(values) < 1:
+                return {}
+            return {**{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}, "max": float(np.max(values))}
+        return {
+            "requests": self.requests(),
+            "duration": self.duration,
+            "throughput": len(latencies) / self.duration if self.duration > 0 else 0,
+            "errorRate": self.errors / self.requests() if self.requests() > 0 else 0,
+            "rejected": self.rejected,
+            "partial": self.partial,
+            "latency": percentiles(latencies),
+            "serverTime": percentiles(serverTimes),
+            # time spent outside the search itself: http, serialization and queueing in the server
+            "overhead": percentiles(latencies - serverTimes)
+        }
+
+async def _request_(session, url: str, query: str, start: float, report: LoadReport) -> None:
+    import aiohttp
+    try:
+        async with session.get(f"{url}/search/", params = {"query": query}) as response:
+            if response.status == 503:
+                report.rejected += 1
+            body = await response.json()
+            if response.status != 200:
+                raise LoadTestException(f"Status {response.status}")
+        report.latencies.append((time.perf_counter() - start) * 1000)
+        report.serverTimes.append(body["time"])
+        if body.get("partial"):
+            report.partial += 1
+    except (aiohttp.ClientError, asyncio.TimeoutError, LoadTestException, KeyError, ValueError):
+        report.errors += 1
+
+async def _run_(url: str, queries: list[str], duration: float, concurrency: int, rate: float, timeout: float) -> LoadReport:
+    import aiohttp
+    report = LoadReport(duration)
+    client = aiohttp.ClientTimeout(total = timeout)
+    async with aiohttp.ClientSession(timeout = client, connector = aiohttp.TCPConnector(limit = 0)) as session:
+        begin = time.perf_counter()
+        end = begin + duration
+        if rate > 0:
+            # open loop: send on a fixed schedule, timing each request from when it was due
+            # so that a slow server shows up as latency rather than a lower send rate
+            tasks = []
+            for i in range(int(duration * rate)):
+                due = begin + i / rate
+                await asyncio.sleep(max(due - time.perf_counter(), 0))
+                tasks.append(asyncio.create_task(_request_(session, url, queries[i % len(queries)], due, report)))
+            await asyncio.gather(*tasks)
+        else:
+            # closed loop: each client sends its next query as soon as the last one is answered
+            counter = iter(range(sys.maxsize))
+            async def client() -> None:
+                while time.perf_counter() < end:
+                    await _request_(session, url, queries[next(counter) % len(queries)], time.perf_counter(), report)
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+        report.duration = time.perf_counter() - begin
+    return report
+
+def loadTest(url: str, queries: list[str], duration: float = 30, concurrency: int = 8, rate: float = 0, timeout: float = 30) -> LoadReport:
+    """Replay a query mix against a running search server.
+
+    Args:
+        url (str): the base url of the server.
+        queries (list[str]): the queries, sent in order and repeated.
+        duration (float, optional): seconds to send requests for. Defaults to 30.
+        concurrency (int, optional): the number of clients when rate is 0. Defaults to 8.
+        rate (float, optional): requests per second to send regardless of responses, 0 to use concurrent clients instead. Defaults to 0.
+        timeout (float, optional): seconds before a request counts as an error. Defaults to 30.
+
+    Returns:
+        LoadReport: the latencies and errors of the run.
+    """
+    return asyncio.run(_run_(url, queries, duration, max(concurrency, 1), rate, timeout))
@@ -1,13 +1,23 @@
 from __future__ import annotations
 from sortedcontainers import SortedList
 from msgspec.json import decode
+from collections.abc import Iterable
 import json
 import heapq
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import shutil
+import io
+import os
 import csv
 import math
 import numpy as np
+from src.config import Config
+from src.impact import impactScore, impactWeights, IMPACT_SCALE
+from src.spelling import saveTrigramIndex
+from src.suggest import saveTermArray
+from src.docstore import DocStoreWriter, mergeDocStores, DOCSTORE_FILE
 
 class MatrixException(Exception):
     pass
@@ -79,7 +89,7 @@ class Posting:
 MatrixData = dict[str: SortedList[Posting]]
 
 class Matrix:
-    def __init__(self, data: list[MatrixData] = [], documents: dict[int: str] = {}, folder: str = "index", filename: str = "matrix", breakpoints: list[str] = ["a", "i", "r"], clean: bool = False):
+    def __init__(self, data: list[MatrixData] = [], documents: dict[int: str] = {}, folder: str = "index", filename: str = "matrix", breakpoints: list[str] = ["a", "i", "r"], clean: bool = False, blockSize: int = 16384):
         """Create a new Matrix object.
 
         Args:
@@ -89,6 +99,7 @@ class Matrix:
             filename (str, optional): the filename for the matrix files. Defaults to "matrix".
             breakpoints (list[str], optional): the breakpoints to segment the matrix on. Defaults to ["a", "i", "r"].
             clean (bool, optional): whether to delete the index files (if exist) on matrix initiation. Defaults to False.
+            blockSize (int, optional): the uncompressed bytes of text per block of the document store. Defaults to 16384.
         """
         self._breakpoints_ = breakpoints
         self._matrix_count_ = len(self._breakpoints_) + 1
@@ -97,10 +108,20 @@ class Matrix:
         self._document_lengths_: dict[int: float] = {}
         self._document_titles_: dict[int: str] = {}
         self._document_summaries_: dict[int: str] = {}
+        self._document_hashes_: dict[int: str] = {}
+        # texts of the documents added since the last save, for the document store
+        self._document_texts_: dict[int: str] = {}
+        # count of each unstemmed form of each term since the last save, to show terms to users
+        self._surfaces_: dict[str: dict[str: int]] = {}
+        self._block_size_ = blockSize
+        # documents added since the last checkpoint
+        self._new_documents_: list[int] = []
         self._sizes_: list[int] = [0 for _ in range(self._matrix_count_)]
         self._filename_ = filename
         self._root_ = folder
         self._counter_: int = 0
+        # (term count, byte size) of each finished segment, recorded by finalize
+        self._segment_stats_: list[tuple[int, int]] = None
         
         # clean folder
         p = Path(self._root_)
@@ -173,20 +194,56 @@ class Matrix:
         self._add_(brk, self._submatrices_[brk], term, post, update)
         self._document_lengths_[post.id] += (1 + math.log10(post.frequency))**2
         
-    def addDocument(self, docID: int, url: str, title: str, summary: str) -> None:
+    def addDocument(self, docID: int, url: str, title: str, summary: str, textHash: str = "", text: str = None, surfaces: dict[str: dict[str: int]] = None) -> None:
         """Add a document to the corpus.
 
         Args:
             docID (int): the id of the document \n
             url (str): the url of the document \n
             title (str): the document's title (if any) \n
-            summary (str): the summary of the document
+            summary (str): the summary of the document \n
+            textHash (str, optional): the hash of the document's text, used to attach summaries later \n
+            text (str, optional): the visible text of the document, saved to the document store for snippets \n
+            surfaces (dict[str: dict[str: int]], optional): the count of each unstemmed form of the document's terms
         """
         if docID not in self._documents_:
             self._documents_[docID] = url
             self._document_lengths_[docID] = 0
             self._document_titles_[docID] = "" if title is None else title
             self._document_summaries_[docID] = summary
+            self._document_hashes_[docID] = textHash
+            if text is not None:
+                self._document_texts_[docID] = text
+            for term,forms in (surfaces or {}).items():
+                counts = self._surfaces_.setdefault(term, {})
+                for form,count in forms.items():
+                    counts[form] = counts.get(form, 0) + count
+            self._new_documents_.append(docID)
+    
+    def drainDocuments(self) -> list[tuple[int, str, float, str, str, str]]:
+        """Return the documents added since the last call as (id, url, length, title, summary, textHash) rows, and reset them.
+
+        The length is the sum of squares before the square root taken by finalize.
+        """
+        rows = [(i, self._documents_[i], self._document_lengths_[i], self._document_titles_[i], self._document_summaries_[i], self._document_hashes_[i]) for i in self._new_documents_]
+        self._new_documents_ = []
+        return rows
+    
+    def restoreDocuments(self, rows: Iterable[list[str]], counter: int) -> None:
+        """Restore the documents and partial count of a checkpointed build.
+
+        Args:
+            rows (Iterable[list[str]]): the rows returned by drainDocuments, read back from csv.
+            counter (int): the number of partial matrices saved.
+        """
+        for i,url,length,title,summary,textHash in rows:
+            docID = int(i)
+            self._documents_[docID] = url
+            self._document_lengths_[docID] = float(length)
+            self._document_titles_[docID] = title
+            self._document_summaries_[docID] = summary
+            self._document_hashes_[docID] = textHash
+        self._counter_ = counter
     
     def _remove_(self, id: int, matrix: MatrixData, term: str, postID: int = None) -> Posting|SortedList[Posting]:
         # remove a post from term's list, or remove the term entirely.
@@ -229,8 +286,18 @@ class Matrix:
         """Returns the current size of the matrix. Does not include matrix sections offloaded to files."""
         return sum(self._sizes_)
     
+    def segment_sizes(self) -> list[int]:
+        """Returns the size in bytes of each matrix file."""
+        if self._segment_stats_ is not None:
+            # recorded by finalize
+            return [size for _,size in self._segment_stats_]
+        return [os.stat(f"{self._root_}/{self._filename_}{i}.csv").st_size for i in range(self._matrix_count_)]
+    
     def scan_size(self) -> int:
         """Returns the number of unique tokens in the matrix files."""    
+        if self._segment_stats_ is not None:
+            # recorded by finalize
+            return sum(terms for terms,_ in self._segment_stats_)
         size = 0
         for i in range(self._matrix_count_):
             with Path(f"{self._root_}/{self._filename_}{i}.csv").open(mode = "rb") as f:
@@ -246,71 +313,134 @@ class Matrix:
                 writer.writerows([k, *[json.dumps(p.toDict()) for p in v]] for k,v in self._submatrices_[i].items())
                 self._submatrices_[i].clear()
                 self._sizes_[i] = 0
+        # document texts of this chunk, merged into the document store by finalize
+        if len(self._document_texts_) > 0:
+            writer = DocStoreWriter(f"{self._root_}/{self._filename_}_docs_partial{self._counter_}.bin", self._block_size_)
+            for d,text in self._document_texts_.items():
+                writer.add(d, text)
+            writer.close()
+            self._document_texts_.clear()
+        # surface forms of this chunk, merged into the display form of each term by finalize
+        if len(self._surfaces_) > 0:
+            with open(f"{self._root_}/{self._filename_}_surfaces_partial{self._counter_}.json", "w", encoding = "utf-8") as f:
+                json.dump(self._surfaces_, f)
+            self._surfaces_.clear()
         self._counter_ += 1
         
-    def _index_matrix_(self) -> dict[str: int]:
-        """Index the matrix.
+    def finalize(self, pageranks: dict[int: float], printing: bool = False, pagerankStats: dict = None, output: str = None, snapshot: dict = None) -> None:
+        """Merge the partial matrices and save final index.
         
-        Returns:
-            dict[str: int]: the index of [str -> byte position]
+        Each posting is saved with its quantized impact score for the current [WEIGHTS].
+        The pagerank stats are saved in meta.json for the next build to warm start from.
+        With output, the partials saved so far are merged into a complete index in that folder
+        and kept, so indexing can continue and merge them again later.
+
+        With more than one segment, the segments are merged by a pool of up to one process per core.
+        The workers are started with forkserver (spawn where it is unavailable) rather than forked,
+        since indexing still has prefetch and summary threads running. pageranks and the document
+        lengths are copied into each worker, so peak memory holds workers + 1 copies of them on top
+        of the segment each worker is merging.
+
+        Args:
+            pageranks (dict[int: float]): the pagerank of every document.
+            printing (bool, optional): whether to print progress. Defaults to False.
+            pagerankStats (dict, optional): the stats of the pagerank run, saved in meta.json. Defaults to None.
+            output (str, optional): the folder to write a snapshot of the index to instead of the index folder. Defaults to None.
+            snapshot (dict, optional): details of the snapshot (version, pages, pagerank) saved in meta.json. Defaults to None.
         """
-        index = {}
-        for i in range(self._matrix_count_):
-            with open(f"{self._root_}/{self._filename_}{i}.csv", mode = "r", encoding = "utf-8") as f:
-                while True:
-                    pos = f.tell()
-                    tokenID = f.readline().split(",")[0]
-                    if len(tokenID.strip()) < 1:
-                        break
-                    index[tokenID] = [pos, i]
-        return index
-    
-    def finalize(self, pageranks: dict[int: float], printing: bool = False) -> None:
-        """Merge the partial matrices and save final index."""
+        config = Config()
+        root = self._root_ if output is None else output
+        Path(root).mkdir(parents = True, exist_ok = True)
         meta = {
             "filename": self._filename_,
             "documentCount": len(self._documents_),
-            "breakpoints": self._breakpoints_
+            "breakpoints": self._breakpoints_,
+            "impactWeights": impactWeights(config),
+            "impactScale": IMPACT_SCALE
         }
+        if pagerankStats:
+            meta["pagerank"] = pagerankStats
+        if snapshot:
+            meta["snapshot"] = snapshot
         if printing:
-            print("\nSaving Metadata...")
-        # save metadata
-        with open(f"{self._root_}/meta.json", "w") as f:
-            json.dump(meta, f, indent = 4)
-        
-        if printing:
-            print("Saving Documents...")
+            print("\nSaving Documents...")
         # save documents
-        with open(f"{self._root_}/documents.csv", newline = "", mode = "w", encoding = "utf-8") as f:
+        with open(f"{root}/documents.csv", newline = "", mode = "w", encoding = "utf-8") as f:
             writer = csv.writer(f, delimiter = ",")
-            writer.writerows((i, d, math.sqrt(self._document_lengths_[i]), self._document_titles_[i], self._document_summaries_[i], pageranks[i]) for i,d in self._documents_.items())
+            writer.writerows((i, d, math.sqrt(self._document_lengths_[i]), self._document_titles_[i], self._document_summaries_[i], pageranks[i], self._document_hashes_[i]) for i,d in self._documents_.items())
         
         if printing:
             print("Merging Index...")
-        # merge partials
-        for i in range(self._matrix_count_):
-            matrices = [self._load_submatrix_(i, p) for p in range(self._counter_)]
-            matrix = self._merge_matrices_(matrices, pageranks)
-            with open(f"{self._root_}/{self._filename_}{i}.csv", mode = "w", encoding = "utf-8", newline = "") as f:
-                writer = csv.writer(f)
-                writer.writerows([k, len(v), *[json.dumps(p.toDict()) for p in v]] for k,v in matrix.items())
+        lengths = {i: math.sqrt(l) for i,l in self._document_lengths_.items()}
+        dfs: dict[str: int] = {}
+        index: dict[str: list[int]] = {}
+        # the segments hold disjoint terms, so they are merged in parallel
+        jobs = [(self._root_, root, self._filename_, self._breakpoints_, self._counter_, i) for i in range(self._matrix_count_)]
+        if len(jobs) > 1:
+            workers = min(len(jobs), os.cpu_count() or 1)
+            # forked workers would inherit the locks of the running prefetch and summary threads
+            context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+            with ProcessPoolExecutor(workers, mp_context = context, initializer = _init_finalize_, initargs = (pageranks, lengths, config)) as pool:
+                segments = list(pool.map(_finalize_segment_, jobs))
+        else:
+            _init_finalize_(pageranks, lengths, config)
+            segments = [_finalize_segment_(j) for j in jobs]
+        # each writer recorded its term offsets, so the finished files are never re-read
+        self._segment_stats_ = []
+        for offsets,counts,size in segments:
+            index.update(offsets)
+            dfs.update(counts)
+            self._segment_stats_.append((len(counts), size))
         
-        if printing:
-            print("Cleaning Partial Indeces...")
-        # delete partials
-        for p in Path(self._root_).glob("*partial*.*"):
-            p.unlink()
+        # concatenate the compressed blocks of the partial document stores
+        stores = [p for p in (f"{self._root_}/{self._filename_}_docs_partial{i}.bin" for i in range(self._counter_)) if Path(p).exists()]
+        if len(stores) > 0:
+            if printing:
+                print("Saving Document Store...")
+            mergeDocStores(stores, f"{root}/{DOCSTORE_FILE}")
         
-        # scan index and make index of index
-        if printing:
-            print("Indexing Index...")
-        index = self._index_matrix_()
+        display = self._display_forms_()
+        
+        if output is None:
+            if printing:
+                print("Cleaning Partial Indeces...")
+            # delete partials
+            for p in Path(self._root_).glob("*partial*.*"):
+                p.unlink()
         
         # save index of index
         if printing:
             print("Saving Meta Index...")
-        with open(f"{self._root_}/meta_index.json", "w") as f:
+        with open(f"{root}/meta_index.json", "w") as f:
             json.dump(index, f, indent = 4)
+        
+        # build n-gram index for spelling suggestions
+        if printing:
+            print("Saving Term Dictionaries...")
+        saveTrigramIndex(root, dfs, display)
+        # sorted term array for prefix completion
+        saveTermArray(root, dfs, display)
+        
+        if printing:
+            print("Saving Metadata...")
+        # save metadata last, so its presence means the rest of the index is complete
+        with open(f"{root}/meta.json", "w") as f:
+            json.dump(meta, f, indent = 4)
+    
+    def _display_forms_(self) -> dict[str: str]:
+        """Merge the surface form partials into the most frequent unstemmed form of each term."""
+        counts: dict[str: dict[str: int]] = {}
+        for i in range(self._counter_):
+            path = Path(f"{self._root_}/{self._filename_}_surfaces_partial{i}.json")
+            if not path.exists():
+                continue
+            with path.open("rb") as f:
+                for term,forms in decode(f.read()).items():
+                    merged = counts.setdefault(term, {})
+                    for form,count in forms.items():
+                        merged[form] = merged.get(form, 0) + count
+        # ties go to the shorter, then alphabetically first form
+        return {term: min(forms.items(), key = lambda x: (-x[1], len(x[0]), x[0]))[0] for term,forms in counts.items()}
     
     def _load_submatrix_(self, id: int, pid: int = None) -> MatrixData:
         """Load a partial matrix.
@@ -383,4 +513,42 @@ class Matrix:
             length = math.sqrt(np.sum(np.power(arr, 2)))
             matrix[k].sort(key = lambda x: (pageranks[x.id], x.tf_norm(length)), reverse = True)
 
-        return matrix
\ No newline at end of file
+        return matrix
+
+
+# finalize worker state, set once per worker process instead of sent with every segment
+_finalize_state_: dict = {}
+
+def _init_finalize_(pageranks: dict[int: float], lengths: dict[int: float], config: Config) -> None:
+    _finalize_state_.update(pageranks = pageranks, lengths = lengths, config = config)
+
+def _finalize_segment_(job: tuple[str, str, str, list[str], int, int]) -> tuple[dict[str: list[int]], dict[str: int], int]:
+    """Merge the partials of one segment and write it, recording the byte offset and df of every term as it is written.
+
+    Args:
+        job (tuple[str, str, str, list[str], int, int]): the index folder, output folder, filename, breakpoints, number of partials and segment number.
+
+    Returns:
+        tuple[dict[str: list[int]], dict[str: int], int]: the meta index entries and document frequencies of the segment's terms, and its size in bytes.
+    """
+    root, output, filename, breakpoints, counter, i = job
+    pageranks, lengths, config = _finalize_state_["pageranks"], _finalize_state_["lengths"], _finalize_state_["config"]
+    matrix = Matrix(folder = root, filename = filename, breakpoints = breakpoints, documents = {})
+    matrix._counter_ = counter
+    merged = matrix._merge_matrices_([matrix._load_submatrix_(i, p) for p in range(counter)], pageranks)
+    offsets: dict[str: list[int]] = {}
+    counts: dict[str: int] = {}
+    pos = 0
+    row = io.StringIO()
+    writer = csv.writer(row)
+    with open(f"{output}/{filename}{i}.csv", mode = "wb") as f:
+        for k,v in merged.items():
+            writer.writerow([k, len(v), *[json.dumps({**p.toDict(), "impact": impactScore(p.toDict(), lengths[p.id], config)}) for p in v]])
+            data = row.getvalue().encode("utf-8")
+            row.seek(0)
+            row.truncate()
+            f.write(data)
+            offsets[k] = [pos, i]
+            counts[k] = len(v)
+            pos += len(data)
+    return offsets, counts, pos
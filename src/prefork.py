@@ -0,0 +1,134 @@
+from __future__ import annotations
+import threading
+import signal
+import socket
+import time
+import gc
+import os
+from src.hotswap import IndexSwapper, residentMemory
+
+DRAIN_TIMEOUT = 30
+"""Seconds a stopping worker waits for its in-flight requests."""
+
+class PreforkException(Exception):
+    pass
+
+def _worker_(index: IndexSwapper, app, host: str, port: int, sock: socket.socket) -> None:
+    """Serve requests in a forked worker until it is sent SIGTERM."""
+    from werkzeug.serving import make_server
+    # the file positions are shared with the parent, the shared memory is not copied
+    index.current.reopen()
+    server = make_server(host, port, app, threaded = True, fd = sock.fileno())
+    def stop(signum, frame) -> None:
+        # shutdown waits for serve_forever, which is running on this thread
+        threading.Thread(target = server.shutdown, daemon = True).start()
+    signal.signal(signal.SIGTERM, stop)
+    # reloads are handled by the parent
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    # finish the requests already accepted
+    deadline = time.time() + DRAIN_TIMEOUT
+    while index.inflight > 0 and time.time() < deadline:
+        time.sleep(0.05)
+
+def preforkServe(index: IndexSwapper, app, host: str = "127.0.0.1", port: int = 5000, workers: int = 4, watch: float = 0) -> None:
+    """Serve the search app from forked worker processes sharing one loaded index.
+
+    The parent moves the term dictionary and documents of the index into shared memory, then forks
+    the workers, which all accept connections on the parent's socket. Each worker only adds its own
+    caches and file handles. The parent restarts workers which exit, and on SIGHUP or a change to
+    the index's meta.json (checked every watch seconds) it loads the index again and replaces the
+    workers, letting the old ones finish their requests.
+
+    Args:
+        index (IndexSwapper): the loaded index.
+        app: the WSGI app.
+        host (str, optional): the address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): the port. Defaults to 5000.
+        workers (int, optional): the number of worker processes. Defaults to 4.
+        watch (float, optional): seconds between checks for a rebuilt index, <= 0 to only reload on SIGHUP. Defaults to 0.
+
+    Raises:
+        PreforkException: if processes cannot be forked on this platform.
+    """
+    if not hasattr(os, "fork"):
+        raise PreforkException("Prefork serving needs os.fork, which this platform does not have")
+    sock = socket.create_server((host, port))
+    sock.set_inheritable(True)
+
+    pids: dict[int: int] = {}
+    generation = 0
+    requests = {"reload": False, "stop": False}
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # never return into the parent's code
+            try:
+                _worker_(index, app, host, port, sock)
+            finally:
+                os._exit(0)
+        pids[pid] = generation
+    def share() -> None:
+        index.current.share()
+        # keep the garbage collector from writing to the shared objects
+        gc.freeze()
+
+    signal.signal(signal.SIGHUP, lambda signum, frame: requests.update(reload = True))
+    signal.signal(signal.SIGTERM, lambda signum, frame: requests.update(stop = True))
+    share()
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on http://{host}:{port} with {workers} workers (parent resident memory {residentMemory() / 1024**2:.1f} mb)")
+
+    last = index.modified()
+    checked = time.time()
+    try:
+        while not requests["stop"]:
+            time.sleep(0.2)
+            # reap exited workers, replacing the current ones
+            while len(pids) > 0:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                if pids.pop(pid, None) == generation:
+                    print(f"Worker {pid} exited, restarting it")
+                    spawn()
+            if watch > 0 and time.time() - checked >= watch:
+                checked = time.time()
+                current = index.modified()
+                if current is not None and current != last:
+                    last = current
+                    requests["reload"] = True
+            if requests["reload"]:
+                requests["reload"] = False
+                gc.unfreeze()
+                index.reload(wait = True)
+                if index.status["state"] == "failed":
+                    print(f"Reload failed, keeping the current workers: {index.status['error']}")
+                    gc.freeze()
+                    continue
+                share()
+                old = list(pids)
+                generation += 1
+                for _ in range(workers):
+                    spawn()
+                for pid in old:
+                    os.kill(pid, signal.SIGTERM)
+                print(f"Reloaded {index.indexLoc} (version {index.status['version']}) and replaced the workers")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
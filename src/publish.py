@@ -0,0 +1,131 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from pathlib import Path
+import shutil
+import time
+import os
+from src.ranker import PageRanker
+
+if TYPE_CHECKING:
+    from src.graph import LinkGraph
+    from src.matrix import Matrix
+
+CURRENT_FILE = "CURRENT"
+PUBLISH_FOLDER = "published"
+
+class PublishException(Exception):
+    pass
+
+def resolveIndex(folder: str) -> str:
+    """Return the folder to open for an index which may still be building.
+
+    A finished index (one with a meta.json) is opened as is. Otherwise, if a snapshot has been
+    published during indexing, the folder named by its CURRENT pointer is opened.
+
+    Args:
+        folder (str): the index folder.
+
+    Returns:
+        str: the folder holding the index files.
+    """
+    root = Path(folder)
+    if (root / "meta.json").exists():
+        return folder
+    try:
+        current = (root / CURRENT_FILE).read_text(encoding = "utf-8").strip()
+    except FileNotFoundError:
+        return folder
+    return str(root / current) if len(current) > 0 else folder
+
+def publishedVersion(folder: str) -> int:
+    """Return the version of the snapshot the CURRENT pointer of an index folder names, 0 if there is none."""
+    try:
+        current = (Path(folder) / CURRENT_FILE).read_text(encoding = "utf-8").strip()
+        return int(Path(current).name.lstrip("v"))
+    except (FileNotFoundError, ValueError):
+        return 0
+
+class Publisher:
+    def __init__(self, folder: str = "index", keep: int = 2, provisional: bool = True):
+        """Publish queryable snapshots of an index while it is being built.
+
+        Each snapshot merges the partials saved so far into a versioned folder inside the index
+        folder, then the CURRENT pointer is replaced atomically to name it, so a querier opening
+        the index folder sees either the old snapshot or the new one, never a half written one.
+        The final index is written to the index folder itself and takes over from the snapshots.
+
+        Args:
+            folder (str, optional): the index folder. Defaults to "index".
+            keep (int, optional): the number of snapshots to keep, so servers still reading an older one are not cut off. Defaults to 2.
+            provisional (bool, optional): whether to rank pages with a pagerank of the links crawled so far instead of uniform ranks. Defaults to True.
+        """
+        self.root = Path(folder)
+        self.folder = self.root / PUBLISH_FOLDER
+        self.keep = max(keep, 1)
+        self.provisional = provisional
+        # a resumed build continues from the snapshots it already published
+        self.version: int = publishedVersion(folder)
+        self.ranker = PageRanker()
+        # the last provisional ranks, each snapshot's pagerank warm starts from them
+        self._ranks_: dict[int: float] = {}
+        self.stats: dict = {}
+        """Version, pages and timings of the last snapshot."""
+
+    def publish(self, matrix: Matrix, graph: LinkGraph, count: int) -> str:
+        """Publish a snapshot of the index so far. Call right after the matrix has been offloaded.
+
+        Args:
+            matrix (Matrix): the matrix being built, with every document added so far saved to its partials.
+            graph (LinkGraph): the link graph of the pages indexed so far.
+            count (int): the number of pages indexed so far.
+
+        Returns:
+            str: the folder of the snapshot.
+
+        Raises:
+            PublishException: if the matrix holds postings which were not offloaded.
+        """
+        if matrix.size() > 0:
+            raise PublishException("The matrix must be offloaded before publishing a snapshot")
+        start = time.perf_counter()
+        if self.provisional:
+            pageranks = self.ranker.run(graph, self._ranks_, self.ranker.stats)
+            self._ranks_ = pageranks
+        else:
+            pageranks = {doc: 1/graph.nodeCount() for docs in graph.pages.values() for doc in docs}
+        rankTime = time.perf_counter() - start
+
+        self.version += 1
+        name = f"v{self.version}"
+        output = self.folder / name
+        # left over from an interrupted publish
+        shutil.rmtree(output, ignore_errors = True)
+        matrix.finalize(pageranks, False, self.ranker.stats if self.provisional else None, str(output), {
+            "version": self.version,
+            "pages": count,
+            "pagerank": "provisional" if self.provisional else "uniform"
+        })
+        pointer = self.root / f"{CURRENT_FILE}.tmp"
+        pointer.write_text(f"{PUBLISH_FOLDER}/{name}", encoding = "utf-8")
+        os.replace(pointer, self.root / CURRENT_FILE)
+
+        # drop the snapshots no server should still be moving off
+        for p in self.folder.iterdir():
+            try:
+                version = int(p.name.lstrip("v"))
+            except ValueError:
+                continue
+            if version <= self.version - self.keep:
+                shutil.rmtree(p, ignore_errors = True)
+        self.stats = {"version": self.version, "pages": count, "rankTime": rankTime, "time": time.perf_counter() - start}
+        return str(output)
+
+    def report(self) -> str:
+        """Summarize the last snapshot."""
+        s = self.stats
+        return f"v{s['version']} with {s['pages']} pages in {s['time']:.2f} s (pagerank {s['rankTime']:.2f} s)"
+
+    def clear(self) -> None:
+        """Remove the snapshots and the CURRENT pointer once the final index is written."""
+        (self.root / CURRENT_FILE).unlink(missing_ok = True)
+        shutil.rmtree(self.folder, ignore_errors = True)
@@ -3,11 +3,26 @@ from nltk.stem import SnowballStemmer
 from typing import TextIO
 import csv
 import math
+import os
+import pickle
+import hashlib
+import html
+import re
+import time
+import threading
+import gc
 import numpy as np
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import OrderedDict, Counter
 from src.helpers import tokenize, multiSetIntersection
 from src.config import Config
+from src.impact import impactWeights, IMPACT_SCALE, IMPACT_VALUES
+from src.spelling import SpellingCorrector, TRIGRAM_FILE
+from src.suggest import TermArray
+from src.docstore import DocStore
+from src.shared import SharedLexicon, SharedDocuments
+from src.publish import resolveIndex
 
 class QueryException(Exception):
     pass
@@ -23,89 +38,349 @@ class Result:
     url: str
     title: str
     summary: str
+    snippet: str = ""
+    """Html escaped text around the query terms, which are in bold."""
+
+class ResultCache:
+    def __init__(self, ttl: float = 300, max_size: int = 1000000):
+        """Cache of full query rankings, evicting least recently used entries.
+
+        Args:
+            ttl (float, optional): seconds before an entry expires. Value <= 0 indicates no expiry. Defaults to 300.
+            max_size (int, optional): the maximum total number of document ids stored across all entries. Defaults to 1000000.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.size = 0
+        self._entries_: OrderedDict[tuple: tuple[float, np.ndarray, int]] = OrderedDict()
+        # searches run on server threads, reentrant since get and put evict through _pop_
+        self._lock_ = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._entries_)
+    
+    def get(self, key: tuple) -> np.ndarray|None:
+        """Return the cached ranking for key, or None if it is missing or expired."""
+        with self._lock_:
+            entry = self._entries_.get(key)
+            if entry is None:
+                return None
+            if self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                self._pop_(key)
+                return None
+            self._entries_.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key: tuple, ranked: np.ndarray, size: int = None) -> None:
+        """Store a ranking, evicting the least recently used entries until the cache fits in max_size.
+
+        Args:
+            key (tuple): the cache key.
+            ranked (np.ndarray): the ranking, or any other value.
+            size (int, optional): the number of documents in the value. Defaults to len(ranked).
+        """
+        size = len(ranked) if size is None else size
+        if self.max_size <= 0 or size > self.max_size:
+            return None
+        with self._lock_:
+            if key in self._entries_:
+                self._pop_(key)
+            self._entries_[key] = (time.monotonic(), ranked, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._pop_(next(iter(self._entries_)))
+    
+    def _pop_(self, key: tuple) -> None:
+        with self._lock_:
+            self.size -= self._entries_.pop(key)[2]
+    
+    def clear(self) -> None:
+        with self._lock_:
+            self._entries_.clear()
+            self.size = 0
+
+@dataclass
+class QueryState:
+    """Partial scores of a query, kept between evaluation stages."""
+    queryTerms: list[str]
+    results: dict[str: list[dict[str: int]]] = field(default_factory = dict)
+    df: dict[str: int] = field(default_factory = dict)
+    docIDs: dict[int: int] = field(default_factory = dict)
+    cosineSimScores: list[float] = field(default_factory = list)
+    headerScores: list[float] = field(default_factory = list)
+    titleScores: list[float] = field(default_factory = list)
+    strongScores: list[float] = field(default_factory = list)
+    impactScores: list[float] = field(default_factory = list)
+    scored: set[str] = field(default_factory = set)
+    impacts: bool = False
+    """Whether to score with the precomputed impacts instead of the per-field scores."""
+    deadline: float = None
+    """perf_counter time after which no more terms are added, None for no deadline."""
+    partial: bool = False
+    """Whether terms were left out because the deadline passed."""
 
 IndexData = list[dict[str: int]]
+Components = tuple[np.ndarray, np.ndarray]
+"""The ids of the matching documents and their unweighted score components, one row per document."""
+
+WEIGHT_NAMES = ("HEADER", "BOLD", "TITLE", "COSINE_SIMILARITY", "CONJUNCTIVE")
+FIELD_COMPONENTS = ("COSINE_SIMILARITY", "HEADER", "TITLE", "BOLD", "CONJUNCTIVE")
+"""Columns of the per-field components, followed by pagerank."""
+IMPACT_COMPONENTS = ("IMPACT", "CONJUNCTIVE")
+"""Columns of the impact components, followed by pagerank."""
+
+SNAPSHOT_FILE = "snapshot.bin"
+SNAPSHOT_VERSION = 6
+STOPWORDS_FILE = "stop_words.txt"
+PARTIAL_TTL = 60
+"""Seconds a partial ranking is kept for fetching its later pages."""
 
 class Queryier:    
-    def __init__(self, indexLoc: str, cache_size: int = 25, cacheStrategy: CacheStrategy = CacheStrategy.TIMELY):
+    def __init__(self, indexLoc: str, cache_size: int = 25, cacheStrategy: CacheStrategy = CacheStrategy.TIMELY, useSnapshot: bool = True, queryLog: str = None):
         """Create Queryier object to query an index.
 
         Args:
-            indexLoc (str): the folder containing the index.
+            indexLoc (str): the folder containing the index. If the index is still being built, the snapshot it last published is opened.
             cache_size (int, optional): how many query terms to store in the cache. Defaults to 25.
             cacheStrategy (CacheStrategy, optional): cache update policy. Defaults to TIMELY (overwrite oldest value).
+            useSnapshot (bool, optional): whether to load the startup snapshot if a current one exists. Defaults to True.
+            queryLog (str, optional): if provided, the stemmed terms of each query are appended to this file. Defaults to None.
 
         Raises:
             QueryException: if the index is not found or if the index metadata file is missing/malformed.
         """
+        start = time.time_ns()
+        indexLoc = resolveIndex(indexLoc)
+        self.indexLoc = indexLoc
+        self.stemmer = SnowballStemmer("english")
+        
+        snapshot = self._load_snapshot_() if useSnapshot else None
+        self.snapshotLoaded: bool = snapshot is not None
+        if snapshot is not None:
+            self.filename: str = snapshot["filename"]
+            self.breakpoints: list[str] = snapshot["breakpoints"]
+            self.documentCount: int = snapshot["documentCount"]
+            self.impactWeights: list[float] = snapshot["impactWeights"]
+            self._meta_index_ = snapshot["meta_index"]
+            self.docs = snapshot["docs"]
+            self.stopwords = snapshot["stopwords"]
+            self.spelling: SpellingCorrector = None if snapshot["spelling"] is None else SpellingCorrector(snapshot["spelling"])
+        else:
+            self._load_index_()
+        
+        self.pointer = 0
+        self.CACHE_SIZE = cache_size
+        self.cacheStrat = cacheStrategy
+        self.cacheUse: dict[int: int] = {}
+        self._cache_: list[tuple[str, int, list[dict[str: int]]]] = []
+        self._cache_lock_ = threading.Lock()
+        self._query_log_: TextIO = None if queryLog is None else open(queryLog, "a", encoding = "utf-8", buffering = 1)
+        # memory-mapped, so it is not part of the snapshot
+        self.terms: TermArray = TermArray.load(indexLoc)
+        # page texts for snippets, only the blocks of shown results are decompressed
+        self.docstore: DocStore = DocStore.load(indexLoc)
+        self._files_: list[TextIO] = [open(f"{indexLoc}/{self.filename}{i}.csv", "r", encoding = "utf-8") for i in range(len(self.breakpoints)+1)]
+        self.config = Config()
+        # impacts are only usable if they were quantized with the current weights
+        self.impacts: bool = self.config.impact_scores and self.impactWeights == impactWeights(self.config)
+        self._results_ = ResultCache(self.config.result_cache_ttl, self.config.result_cache_size)
+        # unweighted score components of recent queries, to re-rank them under other weights
+        self._components_ = ResultCache(self.config.result_cache_ttl, self.config.component_cache_size)
+        # partial rankings, kept briefly so the later pages of a query come from the same ranking
+        self._partials_ = ResultCache(PARTIAL_TTL, self.config.result_cache_size)
+        self._stopword_postings_: dict[str: tuple[int, list[dict[str: int]]]] = {}
+        if self.config.stopword_preload and self.config.r_docs > 0:
+            self._preload_stopwords_()
+        self.version: str = self._index_version_()
+        """Identifies the loaded index files and ranking settings, changes whenever search results could."""
+        self.startupTime: float = (time.time_ns() - start) / 10**6
+        """Time taken to load the index, in ms."""
+    
+    def _load_index_(self) -> None:
+        """Load the index metadata, meta index, documents and stopwords from the index files."""
         # read meta data
         try:
-            with open(f"{indexLoc}/meta.json", "r") as f:
+            with open(f"{self.indexLoc}/meta.json", "r") as f:
                 meta = decode(f.read())
             self.filename: str = meta["filename"]
             self.breakpoints: list[str] = meta["breakpoints"]
             self.documentCount: int = meta["documentCount"]
+            # impacts quantized on the older linear scale are not used until the index is requantized
+            self.impactWeights: list[float] = meta.get("impactWeights") if meta.get("impactScale") == IMPACT_SCALE else None
         except FileNotFoundError:
-            raise QueryException(f"Index metadata file not found at: {indexLoc}")
+            raise QueryException(f"Index metadata file not found at: {self.indexLoc}")
         except KeyError:
-            raise QueryException(f"Malformed metadata file at: {indexLoc}")
+            raise QueryException(f"Malformed metadata file at: {self.indexLoc}")
         
         # read meta index
         try:
-            with open(f"{indexLoc}/meta_index.json", "r") as f:
+            with open(f"{self.indexLoc}/meta_index.json", "r") as f:
                 self._meta_index_ = decode(f.read())
         except FileNotFoundError:
-            raise QueryException(f"Index meta_index file not found at: {indexLoc}")
+            raise QueryException(f"Index meta_index file not found at: {self.indexLoc}")
         
-        self.indexLoc = indexLoc
-        self.pointer = 0
-        self.CACHE_SIZE = cache_size
-        self.cacheStrat = cacheStrategy
-        self.cacheUse: dict[int: int] = {}
-        self._cache_: list[dict[str:list[str]]] = []
-        self.stemmer = SnowballStemmer("english")
         self.docs = self.getDocs()
-        self._files_: list[TextIO] = [open(f"{indexLoc}/{self.filename}{i}.csv", "r", encoding = "utf-8") for i in range(len(self.breakpoints)+1)]
-        self.config = Config()
+        self.spelling: SpellingCorrector = SpellingCorrector.load(self.indexLoc)
         
         # load stopwords
         try:
-            with open("stop_words.txt", "r") as f:
-                self.stopwords = set(self.stemmer.stem(s) for s in f.readlines())
+            with open(STOPWORDS_FILE, "r") as f:
+                self.stopwords = set(self.stemmer.stem(s.strip()) for s in f.readlines() if len(s.strip()) > 0)
         except FileNotFoundError:
             raise QueryException("Stopwords file not found")
     
-    def __del__(self):
-        """Destructor. Closes all index files."""
+    def _preload_stopwords_(self) -> None:
+        """Load the postings of every stopword in the index, truncated to RDOCS postings like any query term."""
+        for term in self.stopwords:
+            if term in self._meta_index_:
+                self._stopword_postings_[term] = self.getToken(term)
+    
+    def applySettings(self, settings: dict[str: float]) -> None:
+        """Change ranking settings in memory, without reloading the index.
+
+        Args:
+            settings (dict[str: float]): new values keyed by their config.ini names: RDOCS, KRESULTS, ALPHA or a [WEIGHTS] name.
+
+        Raises:
+            QueryException: if a setting is unknown.
+        """
+        unknown = set(settings) - {"RDOCS", "KRESULTS", "ALPHA", *self.config.weights}
+        if len(unknown) > 0:
+            raise QueryException(f"Unknown settings: {sorted(unknown)}")
+        self.config.setWeights({k: float(settings.get(k, v)) for k,v in self.config.weights.items()})
+        self.config.alpha = float(settings.get("ALPHA", self.config.alpha))
+        self.config.k_results = int(settings.get("KRESULTS", self.config.k_results))
+        if int(settings.get("RDOCS", self.config.r_docs)) != self.config.r_docs:
+            # cached postings were truncated to the old RDOCS
+            self.config.r_docs = int(settings["RDOCS"])
+            with self._cache_lock_:
+                self._cache_.clear()
+                self.cacheUse.clear()
+                self.pointer = 0
+            self._stopword_postings_ = {}
+            if self.config.stopword_preload and self.config.r_docs > 0:
+                self._preload_stopwords_()
+        self.impacts = self.config.impact_scores and self.impactWeights == impactWeights(self.config)
+        self.version = self._index_version_()
+    
+    def _snapshot_sources_(self) -> dict[str: int]:
+        """Return the modification times of the files the snapshot is built from."""
+        sources = {}
+        for path in (f"{self.indexLoc}/meta.json", f"{self.indexLoc}/meta_index.json", f"{self.indexLoc}/documents.csv", f"{self.indexLoc}/{TRIGRAM_FILE}", STOPWORDS_FILE):
+            try:
+                sources[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                sources[path] = None
+        return sources
+    
+    def _index_version_(self) -> str:
+        """Hash the size and modification time of the index files together with the ranking settings."""
+        files = ["meta.json", "meta_index.json", "documents.csv", *(f"{self.filename}{i}.csv" for i in range(len(self.breakpoints)+1))]
+        stats = [(f, os.stat(f"{self.indexLoc}/{f}").st_size, os.stat(f"{self.indexLoc}/{f}").st_mtime_ns) for f in files]
+        return hashlib.sha1(repr((stats, self._result_key_([]))).encode("utf-8")).hexdigest()[:16]
+    
+    def _load_snapshot_(self) -> dict|None:
+        """Load the startup snapshot in a single read.
+
+        Returns:
+            dict|None: the snapshot contents. None if there is no snapshot or it is out of date.
+        """
+        try:
+            with open(f"{self.indexLoc}/{SNAPSHOT_FILE}", "rb") as f:
+                snapshot = pickle.loads(f.read())
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("sources") != self._snapshot_sources_():
+            return None
+        return snapshot
+    
+    def saveSnapshot(self) -> str:
+        """Save the startup snapshot (term dictionary, documents and stemmed stopwords) to the index folder.
+
+        Returns:
+            str: the path of the snapshot file.
+        """
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "sources": self._snapshot_sources_(),
+            "filename": self.filename,
+            "breakpoints": self.breakpoints,
+            "documentCount": self.documentCount,
+            "impactWeights": self.impactWeights,
+            "meta_index": self._meta_index_,
+            "docs": self.docs,
+            "stopwords": self.stopwords,
+            "spelling": None if self.spelling is None else {"terms": self.spelling.terms, "display": self.spelling.display, "df": self.spelling.df, "grams": self.spelling.grams}
+        }
+        path = f"{self.indexLoc}/{SNAPSHOT_FILE}"
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump(snapshot, f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+        return path
+    
+    def share(self) -> None:
+        """Move the term dictionary and the documents into shared memory.
+        
+        Processes forked afterwards use the same memory instead of copies of the dicts,
+        each must call reopen before querying.
+        """
+        if not isinstance(self._meta_index_, SharedLexicon):
+            self._meta_index_ = SharedLexicon(self._meta_index_)
+            self.docs = SharedDocuments(self.docs)
+            gc.collect()
+    
+    def reopen(self) -> None:
+        """Open new handles to the index files and new locks, in a process forked after the querier was loaded."""
+        self._files_ = [open(f.name, "r", encoding = "utf-8") for f in self._files_]
+        if self._query_log_ is not None:
+            self._query_log_ = open(self._query_log_.name, "a", encoding = "utf-8", buffering = 1)
+        if self.docstore is not None:
+            self.docstore.reopen()
+        self._cache_lock_ = threading.Lock()
+    
+    def close(self) -> None:
+        """Close all index files."""
         try:
             for f in self._files_:
                 f.close()
+            if self._query_log_ is not None:
+                self._query_log_.close()
+            if self.terms is not None:
+                self.terms.close()
+            if self.docstore is not None:
+                self.docstore.close()
         except AttributeError:
             # occurs when an error is thrown in the constructor before the _files_ attribute is created
             # caught to prevent the destructor from throwing errors
             pass
     
-    def _add_cache_(self, term: str, results: list[str]) -> None:
+    def __del__(self):
+        """Destructor. Closes all index files."""
+        self.close()
+    
+    def _add_cache_(self, term: str, results: list[str], df: int) -> None:
         """Add a term and its index results to the cache, replacing the oldest cache entry if the cache is full.
 
         Args:
             term (str): the term to add.
             results (list[str]): the documents returned as results for that term.
+            df (int): the document frequency of the term.
         """
         if self.CACHE_SIZE == 0:
             return None
         
-        if len(self._cache_) >= self.CACHE_SIZE:
-            if self.cacheStrat == CacheStrategy.TIMELY:
-                self._cache_[self.pointer] = {term: results}
-                self.pointer = (self.pointer + 1) % self.CACHE_SIZE
-            elif self.cacheStrat == CacheStrategy.POPULARITY:
-                index = min(self.cacheUse.items(), key = lambda x: x[1])[0]
-                self._cache_[index] = {term: results}
-                self.cacheUse[index] = 1
-        else:
-            self._cache_.append({term: results, "df": len(results)})
-            self.cacheUse[len(self.cacheUse)] = 1
+        with self._cache_lock_:
+            if len(self._cache_) >= self.CACHE_SIZE:
+                if self.cacheStrat == CacheStrategy.TIMELY:
+                    self._cache_[self.pointer] = (term, df, results)
+                    self.pointer = (self.pointer + 1) % self.CACHE_SIZE
+                elif self.cacheStrat == CacheStrategy.POPULARITY:
+                    index = min(self.cacheUse.items(), key = lambda x: x[1])[0]
+                    self._cache_[index] = (term, df, results)
+                    self.cacheUse[index] = 1
+            else:
+                self._cache_.append((term, df, results))
+                self.cacheUse[len(self.cacheUse)] = 1
     
     def _check_cache_(self, term: str) -> None|tuple[int, list[str]]:
         """Check if a term is in the cache.
@@ -114,15 +389,65 @@ class Queryier:
             term (str): the term to search for.
 
         Returns:
-            None|list[str]: the list of results stored in the cache. Returns None if the term was not in the cache.
+            None|tuple[int, list[str]]: the document frequency and list of results stored in the cache. Returns None if the term was not in the cache.
         """
-        for i,r in enumerate(self._cache_):
-            if term in r:
-                if self.cacheStrat == CacheStrategy.POPULARITY:
-                    self.cacheUse[i] += 1
-                return r["df"], r[term]
+        # the warmer and request threads replace entries and update their use counts
+        with self._cache_lock_:
+            for i,(t, df, r) in enumerate(self._cache_):
+                if t == term:
+                    if self.cacheStrat == CacheStrategy.POPULARITY:
+                        self.cacheUse[i] += 1
+                    return df, r
         return None
     
+    def logQuery(self, terms: list[str]) -> None:
+        """Append the stemmed terms of a query to the query log, if there is one."""
+        if self._query_log_ is None or len(terms) < 1:
+            return None
+        with self._cache_lock_:
+            self._query_log_.write(" ".join(terms) + "\n")
+    
+    def warm(self, logPath: str, count: int) -> int:
+        """Warm the postings cache and the OS page cache with the most frequent terms in a query log.
+        
+        The top CACHE_SIZE terms are loaded into the postings cache, and the index rows of the
+        top count terms are read so the OS keeps them in the page cache.
+
+        Args:
+            logPath (str): the query log.
+            count (int): the number of terms to warm.
+
+        Returns:
+            int: the number of terms warmed.
+        """
+        try:
+            with open(logPath, "r", encoding = "utf-8") as f:
+                frequencies = Counter(t for line in f for t in line.split())
+        except FileNotFoundError:
+            return 0
+        
+        terms = [t for t,_ in frequencies.most_common() if t in self._meta_index_][:count]
+        # separate file handles, the query files are in use by the server
+        files = [open(f"{self.indexLoc}/{self.filename}{i}.csv", "rb") for i in range(len(self.breakpoints)+1)]
+        try:
+            for rank,term in enumerate(terms):
+                pos, fileno = self._meta_index_[term]
+                files[fileno].seek(pos)
+                line = files[fileno].readline()
+                if rank < self.CACHE_SIZE and term not in self._stopword_postings_ and self._check_cache_(term) is None:
+                    df, res = self._parse_row_(line.decode("utf-8"))
+                    self._add_cache_(term, res, df)
+        finally:
+            for f in files:
+                f.close()
+        return len(terms)
+    
+    def warmInBackground(self, logPath: str, count: int) -> threading.Thread:
+        """Run warm on a background thread so startup is not delayed."""
+        thread = threading.Thread(target = self.warm, args = (logPath, count), daemon = True)
+        thread.start()
+        return thread
+    
     def getToken(self, token: str) -> tuple[int, list[dict[str:int]]]:
         """Get the postings list for the token.
 
@@ -139,7 +464,10 @@ class Queryier:
         # set the file pointer position
         f.seek(pos)
         # read that line
-        line = f.readline()
+        return self._parse_row_(f.readline())
+    
+    def _parse_row_(self, line: str) -> tuple[int, list[dict[str:int]]]:
+        """Parse an index row into the document frequency and the first RDOCS postings."""
         reader = csv.reader([line])
         line = next(reader)
         # return the decoded first r items in the line
@@ -157,115 +485,400 @@ class Queryier:
                 docs[int(row[0])] = (row[1], float(row[2]), row[3], row[4], float(row[5]))
         return docs
 
-    def searchIndex(self, query: str, useStopWords: bool = False) -> tuple[list[Result], int]:
+    def _result_key_(self, terms: list[str], weights: dict[str: float] = None, alpha: float = None, impacts: bool = None) -> tuple:
+        """Key for the result cache: the normalized stemmed terms and every setting that affects the ranking.
+
+        The weights, alpha and impacts default to the config's, see _ranking_weights_.
+        """
+        if weights is None:
+            weights, alpha = self._ranking_weights_()
+            impacts = self.impacts
+        return (
+            tuple(sorted(terms)),
+            weights["COSINE_SIMILARITY"],
+            weights["HEADER"],
+            weights["TITLE"],
+            weights["BOLD"],
+            weights["CONJUNCTIVE"],
+            alpha,
+            self.config.r_docs,
+            self.config.k_results,
+            impacts
+        )
+    
+    def _ranking_weights_(self, overrides: dict[str: float] = None) -> tuple[dict[str: float], float]:
+        """Return the normalized relevance weights and alpha, with any overrides applied.
+
+        Args:
+            overrides (dict[str: float], optional): new relative weights keyed by their [WEIGHTS] names, and ALPHA. Defaults to None.
+
+        Raises:
+            QueryException: if an override is unknown or the weights sum to 0.
+
+        Returns:
+            tuple[dict[str: float], float]: the weights normalized to sum to 1, keyed by their [WEIGHTS] names, and alpha.
+        """
+        if not overrides:
+            return {
+                "HEADER": self.config.header_weight,
+                "BOLD": self.config.bold_weight,
+                "TITLE": self.config.title_weight,
+                "COSINE_SIMILARITY": self.config.cosine_similarity_weight,
+                "CONJUNCTIVE": self.config.conjunctive_weight
+            }, self.config.alpha
+        unknown = set(overrides) - {"ALPHA", *WEIGHT_NAMES}
+        if len(unknown) > 0:
+            raise QueryException(f"Unknown weights: {sorted(unknown)}")
+        weights = {k: float(overrides.get(k, v)) for k,v in self.config.weights.items()}
+        total = sum(weights.values())
+        if total <= 0 or any(v < 0 for v in weights.values()):
+            raise QueryException(f"Invalid weights: {overrides}")
+        return {k: v / total for k,v in weights.items()}, float(overrides.get("ALPHA", self.config.alpha))
+    
+    def complete(self, prefix: str, k: int = 10) -> list[str]:
+        """Complete the last word of a partial query with the most popular index terms.
+
+        Args:
+            prefix (str): the partial query.
+            k (int, optional): the number of completions. Defaults to 10.
+
+        Returns:
+            list[str]: the completed queries.
+        """
+        if self.terms is None or len(prefix.strip()) < 1 or not prefix[-1].isalnum():
+            return []
+        words = prefix.lower().split()
+        head = " ".join(words[:-1])
+        return [f"{head} {t}" if len(head) > 0 else t for t in self.terms.complete(words[-1], k)]
+    
+    def didYouMean(self, query: str) -> str|None:
+        """Suggest a correction for a query with terms which are not in the index.
+
+        Args:
+            query (str): the query.
+
+        Returns:
+            str|None: the query with each unknown term replaced by the unstemmed form of the closest known term, or None if there is nothing to correct.
+        """
+        if self.spelling is None:
+            return None
+        words = tokenize(query)
+        corrected = False
+        for i,w in enumerate(words):
+            term = self.stemmer.stem(w)
+            if term in self._meta_index_ or term in self.stopwords:
+                continue
+            suggestion = self.spelling.suggest(term, self.config.spelling_distance, self.config.spelling_budget)
+            if len(suggestion) > 0:
+                words[i] = suggestion[0]
+                corrected = True
+        return " ".join(words) if corrected else None
+    
+    def searchIndex(self, query: str, useStopWords: bool = False, cursor: int = 0, budget: float = None, weights: dict[str: float] = None) -> tuple[list[Result], int, bool]:
         """Query an index.
 
         Args:
             query (str): the query to search for.
             useStopWords (str, optional): whether to include stopwords in the searched-for terms. Defaults to False.
+            cursor (int, optional): the rank to start the returned page of results at. Defaults to 0.
+            budget (float, optional): time budget in ms for ranking the first page, <= 0 for none. Once it runs out the terms with the lowest idf are left out. Defaults to QUERY_BUDGET.
+            weights (dict[str: float], optional): [WEIGHTS] and ALPHA values to rank with instead of the config's. Defaults to None.
+
+        Raises:
+            QueryException: if a weight override is unknown or invalid.
 
         Returns:
-            tuple[list[str], int]: a list of document names that matched the query and the number of total results found.
+            tuple[list[str], int, bool]: a list of document names that matched the query, the number of total results found and whether the ranking is partial.
         """
-        
-        results: dict[str: list[dict[str: int]]] = {}
-        cosineSimScores: list[float] = []
-        headerScores: list[float] = []
-        titleScores: list[float] = []
-        strongScores: list[float] = []
-        conjunctiveScores: list[float] = []
-        docIDs = {}
-        queryDF: dict[str: float] = {}
-        
+        start = time.perf_counter()
+        budget = self.config.query_budget if budget is None else budget
+        weights, alpha = self._ranking_weights_(weights)
+        # impacts only hold the weights they were quantized with
+        impacts = self.config.impact_scores and self.impactWeights == [weights[k] for k in FIELD_COMPONENTS[:4]]
         # stem query tokens
         terms = [self.stemmer.stem(w) for w in tokenize(query)]
-        if not useStopWords:
-            tempL = len(terms)
-            terms = [w for w in terms if w not in self.stopwords]
-            removedStopWords = len(terms) < tempL
-        # for each token in the query
+        if cursor == 0:
+            self.logQuery(terms)
+        
+        # check the result cache, then the component cache, before ranking
+        key = (self._result_key_(terms, weights, alpha, impacts), useStopWords)
+        ranked = self._results_.get(key)
+        partial = False
+        if ranked is None and cursor > 0:
+            # page on through the partial ranking the first page came from
+            ranked = self._partials_.get(key)
+            partial = ranked is not None
+        if ranked is None:
+            componentKey = (tuple(sorted(terms)), useStopWords, self.config.r_docs, self.config.k_results, impacts)
+            components = self._components_.get(componentKey)
+            if components is None:
+                # later pages are ranked in full, their first page cannot have been a partial ranking which is still kept
+                deadline = start + budget / 1000 if budget > 0 and cursor <= 0 else None
+                components, partial = self._rank_(terms, useStopWords, deadline, impacts)
+                if not partial:
+                    self._components_.put(componentKey, components, len(components[0]))
+            ranked = self._score_(components, weights, alpha)
+            # a partial ranking would hide the full one from later queries
+            if partial:
+                self._partials_.put(key, ranked)
+            else:
+                self._results_.put(key, ranked)
+        
+        # convert the requested page to urls
+        page = ranked[max(cursor, 0):max(cursor, 0)+self.config.k_results].tolist()
+        results = [Result(self.docs[d][0], self.docs[d][2], self.docs[d][3]) for d in page]
+        if self.docstore is not None and len(terms) > 0:
+            pattern = self._snippet_pattern_(terms)
+            for d,r in zip(page, results):
+                r.snippet = self.snippet(d, set(terms), pattern)
+        return results, len(ranked), partial
+    
+    def _snippet_pattern_(self, terms: list[str]) -> re.Pattern:
+        """Match the words which may stem to one of the terms, by the first letters of the stems."""
+        prefixes = sorted(set(re.escape(t[:4]) for t in terms), key = len, reverse = True)
+        return re.compile(r"\b(?:" + "|".join(prefixes) + r")\w*", re.IGNORECASE)
+    
+    def snippet(self, docID: int, terms: set[str], pattern: re.Pattern = None) -> str:
+        """Build a snippet of a document's text around the query terms.
+
+        Args:
+            docID (int): the document id.
+            terms (set[str]): the stemmed query terms.
+            pattern (re.Pattern, optional): the pattern from _snippet_pattern_, to reuse it across documents. Defaults to None.
+
+        Returns:
+            str: about SNIPPET_WORDS words of html escaped text with the query terms in bold, empty if the text is not stored.
+        """
+        text = None if self.docstore is None else self.docstore.get(docID)
+        if not text:
+            return ""
+        pattern = pattern or self._snippet_pattern_(list(terms))
+        # (start, end, term) of each word which stems to a query term
+        hits = []
+        stems: dict[str: str] = {}
+        for m in pattern.finditer(text):
+            word = m.group().lower()
+            if word not in stems:
+                stems[word] = self.stemmer.stem(word)
+            if stems[word] in terms:
+                hits.append((m.start(), m.end(), stems[word]))
+        # about 7 characters per word
+        width = self.config.snippet_words * 7
+        start = 0
+        if len(hits) > 0:
+            # the window with the most distinct terms, then the most hits
+            best = (0, 0, 0)
+            j = 0
+            for i in range(len(hits)):
+                while hits[i][0] - hits[j][0] > width:
+                    j += 1
+                window = hits[j:i+1]
+                best = max(best, (len(set(h[2] for h in window)), len(window), -j))
+            first = hits[-best[2]][0]
+            # start a few words before the first hit
+            start = text.rfind(" ", 0, max(first - width // 4, 0)) + 1
+        end = text.find(" ", min(start + width, len(text)))
+        end = len(text) if end < 0 else end
+        # escape the text and bold the hits
+        parts = ["..." if start > 0 else ""]
+        position = start
+        for s,e,_ in hits:
+            if s >= start and e <= end:
+                parts.append(html.escape(text[position:s]) + "<b>" + html.escape(text[s:e]) + "</b>")
+                position = e
+        parts.append(html.escape(text[position:end]) + ("..." if end < len(text) else ""))
+        return "".join(parts)
+    
+    def _fetch_(self, term: str) -> tuple[int, list[dict[str: int]]]:
+        """Get the document frequency and postings for a term from the preloaded stopwords, the cache or the index.
+
+        Args:
+            term (str): the stemmed term.
+
+        Returns:
+            tuple[int, list[dict[str: int]]]: the document frequency and the postings for that term.
+        """
+        if term in self._stopword_postings_:
+            return self._stopword_postings_[term]
+        # check cache
+        cacheResult = self._check_cache_(term)
+        if cacheResult is not None:
+            return cacheResult
+        try:
+            df, res = self.getToken(term)
+            # add to cache
+            self._add_cache_(term, res, df)
+            return df, res
+        except KeyError:
+            # if the term is not found in the index
+            return self.documentCount - 1, []
+    
+    def _document_frequency_(self, term: str) -> int:
+        """Estimate the document frequency of a term without reading its postings, 0 if it is unknown."""
+        if term not in self._meta_index_:
+            # no postings to read
+            return -1
+        if term in self._stopword_postings_:
+            return self._stopword_postings_[term][0]
+        if self.terms is not None:
+            return self.terms.frequency(term) or 0
+        return 0
+    
+    def _accumulate_(self, state: QueryState, terms: list[str]) -> None:
+        """Fetch the postings for the terms and add their unnormalized scores to the query state.
+        
+        Terms are added rarest first. Once the state's deadline passes, the remaining terms are
+        left out and the state is marked partial, so the most common terms are dropped first.
+
+        Args:
+            state (QueryState): the partial scores of the query.
+            terms (list[str]): the stemmed terms to add, with repeats.
+        """
+        if state.deadline is not None:
+            # highest idf first, repeats of a term stay together
+            terms = sorted(terms, key = self._document_frequency_)
         for term in terms:
-            # check cache
-            cacheResult = self._check_cache_(term)
-            if cacheResult is not None:
-                queryDF[term] = cacheResult[0]
-                results[term] = cacheResult[1]
+            if term in state.results:
                 continue
-            try:
-                df, res = self.getToken(term)
-                queryDF[term] = df
-                results[term] = res
-                # add to cache
-                self._add_cache_(term, res)
-            except KeyError:
-                # if the term is not found in the index
-                queryDF[term] = self.documentCount - 1
-                results[term] = []
-        
-        # calculate all query term weights
-        queryDF = {term: (1 + math.log10(terms.count(term))) * math.log10(self.documentCount / queryDF[term]) for term in terms}
-        queryLength = math.sqrt(sum(v**2 for v in queryDF.values()))
+            if state.deadline is not None and len(state.results) > 0 and time.perf_counter() > state.deadline:
+                state.partial = True
+                break
+            state.df[term], state.results[term] = self._fetch_(term)
         
+        previous = None
         for term in terms:
-            # calculate w-tq
-            wtq = queryDF[term] / queryLength
+            if term not in state.results:
+                continue
+            if term != previous and term not in state.scored:
+                if state.deadline is not None and len(state.scored) > 0 and time.perf_counter() > state.deadline:
+                    # fetched too late, leave it out of the query
+                    state.partial = True
+                    del state.results[term], state.df[term]
+                    continue
+                state.scored.add(term)
+            previous = term
+            # the query term weight, normalized by the query length once all stages are done
+            wtq = (1 + math.log10(state.queryTerms.count(term))) * math.log10(self.documentCount / state.df[term])
             # add score for this term in each doc to the running sum
-            for post in results[term]:
+            for post in state.results[term]:
                 id = post["id"]
-                tf = 1 + math.log10(post["frequency"])
-                if id not in docIDs:
-                    docIDs[id] = len(docIDs)
-                    cosineSimScores.append(0)
-                    headerScores.append(0)
-                    titleScores.append(0)
-                    strongScores.append(0)
-                    conjunctiveScores.append(0)
-                cosineSimScores[docIDs[id]] += wtq * tf
+                if id not in state.docIDs:
+                    state.docIDs[id] = len(state.docIDs)
+                    state.cosineSimScores.append(0)
+                    state.headerScores.append(0)
+                    state.titleScores.append(0)
+                    state.strongScores.append(0)
+                    state.impactScores.append(0)
+                i = state.docIDs[id]
+                if state.impacts:
+                    # the impact already folds in tf, document length and field weights
+                    state.impactScores[i] += wtq * IMPACT_VALUES[post["impact"]]
+                    continue
+                state.cosineSimScores[i] += wtq * (1 + math.log10(post["frequency"]))
                 if post["header"]:
-                    headerScores[docIDs[id]] += 1
+                    state.headerScores[i] += 1
                 if post["title"]:
-                    titleScores[docIDs[id]] += 1
+                    state.titleScores[i] += 1
                 if post["bold"]:
-                    strongScores[docIDs[id]] += 1
+                    state.strongScores[i] += 1
+    
+    def _finish_(self, state: QueryState) -> Components:
+        """Combine the accumulated scores of a query into unweighted score components.
+
+        Args:
+            state (QueryState): the partial scores of the query.
+
+        Returns:
+            Components: the matching document ids and a row of components per document, the
+            FIELD_COMPONENTS or IMPACT_COMPONENTS columns followed by pagerank.
+        """
+        ids = np.fromiter(state.docIDs.keys(), dtype = np.int64, count = len(state.docIDs))
+        if len(ids) < 1:
+            return ids, np.zeros((0, len(IMPACT_COMPONENTS if state.impacts else FIELD_COMPONENTS) + 1))
+        
+        # calculate the query length over the unique terms
+        # terms left out by the deadline are not part of the query
+        queryTerms = set(t for t in state.queryTerms if t in state.results)
+        queryWeights = {term: (1 + math.log10(state.queryTerms.count(term))) * math.log10(self.documentCount / state.df[term]) for term in queryTerms}
+        queryLength = math.sqrt(sum(v**2 for v in queryWeights.values()))
         
         # compute conjunctive processing score
-        conjunctiveRes: set[int] = multiSetIntersection([set(p["id"] for p in v) for v in results.values()])
+        conjunctiveScores = np.zeros(len(ids))
+        conjunctiveRes: set[int] = multiSetIntersection([set(p["id"] for p in state.results[t]) for t in queryTerms])
         for id in conjunctiveRes:
-            conjunctiveScores[docIDs[id]] = 1
+            conjunctiveScores[state.docIDs[id]] = 1
         
-        # pagerank
-        pagerankScores: list[float] = [0 for _ in range(len(docIDs))]
-        
-        for d,i in docIDs.items():
-            # calculate final cosine similarity scores by dividing by normalized doc lengths
-            cosineSimScores[i] /= self.docs[d][1]
-            # retrieve pagerank scores
-            pagerankScores[i] = self.docs[d][4]
-        
-        # weight the score methods
-        cosineSimScores: np.ndarray = np.multiply(cosineSimScores, self.config.cosine_similarity_weight)
-        headerScores: np.ndarray = np.multiply(headerScores, self.config.header_weight)
-        titleScores: np.ndarray = np.multiply(titleScores, self.config.title_weight)
-        strongScores: np.ndarray = np.multiply(strongScores, self.config.bold_weight)
-        conjunctiveScores: np.ndarray = np.multiply(conjunctiveScores, self.config.conjunctive_weight)
-        # combine relevance scores and weight by ALPHA
-        relevance_scores: np.ndarray = np.multiply(np.sum([cosineSimScores, headerScores, titleScores, strongScores, conjunctiveScores], 0), self.config.alpha)
-        
-        # authority scores
-        authority_scores: np.ndarray = np.array(pagerankScores)
+        # pagerank and normalized document lengths
+        lengths, pagerankScores = self._document_values_(ids)
+        # terms in every document have no idf, a query of only those has no content score
+        if queryLength == 0:
+            queryLength = math.inf
+        if state.impacts:
+            # impacts are already weighted, only the query length remains
+            impactScores = np.divide(state.impactScores, queryLength)
+            return ids, np.column_stack([impactScores, conjunctiveScores, pagerankScores])
+        # calculate final cosine similarity scores by dividing by the query length and normalized doc lengths
+        cosineSimScores = np.divide(state.cosineSimScores, queryLength) / lengths
+        return ids, np.column_stack([cosineSimScores, state.headerScores, state.titleScores, state.strongScores, conjunctiveScores, pagerankScores])
+    
+    def _document_values_(self, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the normalized lengths and pageranks of documents."""
+        if isinstance(self.docs, SharedDocuments):
+            return self.docs.values(ids)
+        return np.array([self.docs[d][1] for d in ids.tolist()]), np.array([self.docs[d][4] for d in ids.tolist()])
+    
+    def _score_(self, components: Components, weights: dict[str: float], alpha: float) -> np.ndarray:
+        """Weight the score components of a query and sort the documents by their scores.
+
+        Args:
+            components (Components): the matching document ids and their unweighted components.
+            weights (dict[str: float]): the normalized relevance weights, keyed by their [WEIGHTS] names.
+            alpha (float): the weight of relevance against pagerank.
+
+        Returns:
+            np.ndarray: the document ids in rank order.
+        """
+        ids, matrix = components
+        if matrix.shape[1] == len(IMPACT_COMPONENTS) + 1:
+            # the impacts already fold in the field weights
+            vector = [alpha, alpha * weights["CONJUNCTIVE"], 1]
+        else:
+            vector = [alpha * weights[k] for k in FIELD_COMPONENTS] + [1]
+        scores = matrix @ np.array(vector)
+        # ties keep the order the documents were found in
+        return ids[np.argsort(-scores, kind = "stable")]
+    
+    def _rank_(self, terms: list[str], useStopWords: bool = False, deadline: float = None, impacts: bool = None) -> tuple[Components, bool]:
+        """Score the documents for the stemmed query terms, without weighting the scores.
         
-        # sum different score methods
-        scores: np.ndarray = np.sum([relevance_scores, authority_scores], 0)
+        Stopwords are left out at first. If that gives fewer than k results, the stopwords
+        are added in a second stage which reuses the postings and partial scores of the first.
+
+        Args:
+            terms (list[str]): the stemmed query terms.
+            useStopWords (str, optional): whether to include stopwords in the searched-for terms. Defaults to False.
+            deadline (float, optional): perf_counter time to stop adding terms at, the scores so far are returned. Defaults to None.
+            impacts (bool, optional): whether to score with the impacts. Defaults to whether they match the config's weights.
+
+        Returns:
+            tuple[Components, bool]: the score components of every matching document, and whether terms were left out because of the deadline.
+        """
+        if useStopWords:
+            stopTerms = []
+        else:
+            stopTerms = [w for w in terms if w in self.stopwords]
+            terms = [w for w in terms if w not in self.stopwords]
         
-        # divide by normalized document length and retrieve documents in rank order
-        ranked = sorted(((d, scores[i]) for d,i in docIDs.items()), key = lambda x: x[1], reverse = True)
+        state = QueryState(list(terms), deadline = deadline, impacts = self.impacts if impacts is None else impacts)
+        self._accumulate_(state, terms)
         
-        # redo using stopwords if not enough results
-        if len(ranked) < self.config.k_results and not useStopWords and removedStopWords:
-            return self.searchIndex(query, True)
+        # add the stopwords if not enough results
+        if len(state.docIDs) < self.config.k_results and len(stopTerms) > 0:
+            if state.partial or (deadline is not None and len(state.results) > 0 and time.perf_counter() > deadline):
+                # out of time, the stopwords are the lowest idf terms
+                state.partial = True
+            else:
+                state.queryTerms.extend(stopTerms)
+                self._accumulate_(state, stopTerms)
         
-        # convert to urls
-        urls = [Result(self.docs[d][0], self.docs[d][2], self.docs[d][3]) for d,_ in ranked[:self.config.k_results]]
-
-        # return top k results
-        return urls, len(ranked)
\ No newline at end of file
+        return self._finish_(state), state.partial
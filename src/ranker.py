@@ -1,40 +1,133 @@
 from src.config import Config
+from src.graph import LinkGraph
+from pathlib import Path
+import json
+import time
+import csv
+import numpy as np
+
+def loadRanks(indexPath: str) -> tuple[dict[int: float], dict]:
+    """Read the pageranks of a previous index to warm start PageRank from.
+
+    Args:
+        indexPath (str): the previous index folder.
+
+    Returns:
+        tuple[dict[int: float], dict]: the pagerank of each document id and the pagerank stats saved in
+        the index's meta.json, both empty if the index has no documents.csv.
+    """
+    path = Path(indexPath)
+    ranks: dict[int: float] = {}
+    if not (path / "documents.csv").exists():
+        return ranks, {}
+    with (path / "documents.csv").open("r", encoding = "utf-8") as f:
+        for row in csv.reader(f):
+            ranks[int(row[0])] = float(row[5])
+    try:
+        with (path / "meta.json").open("r") as f:
+            stats = json.load(f).get("pagerank", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        stats = {}
+    return ranks, stats
 
 class PageRanker:
     def __init__(self):
         """Compute the PageRank for a dataset."""
         self.config = Config()
-    
-    def run(self, links: dict[int: list[set[int], int]]) -> dict[int: float]:
+        self.stats: dict = {}
+        """Iterations, time and convergence of the last run, saved in meta.json."""
+
+    def run(self, graph: LinkGraph, previous: dict[int: float] = None, previousStats: dict = None) -> dict[int: float]:
         """Compute PageRank.
-        
+
+        Pages which were linked to but not crawled have no outgoing links, so they never pass rank
+        on. Their ranks only count towards the normalization total, which is computed from the
+        number of links to them rather than storing them as nodes.
+
+        The iteration stops once the mean change of a page's rank drops below PAGERANK_TOLERANCE.
+        With previous ranks, each page starts from its previous rank instead of a uniform rank,
+        so a graph which changed little converges in a few iterations.
+
         Args:
-            links (dict[int: list[set[int], int]]): the extracted links corpus of incoming links to each page and the number of outgoing links.
+            graph (LinkGraph): the inbound link graph of the crawled pages.
+            previous (dict[int: float], optional): the pageranks of a previous index, by document id. Defaults to None.
+            previousStats (dict, optional): the pagerank stats of the previous index, from loadRanks. Defaults to None.
+
+        Returns:
+            dict[int: float]: the pagerank of each document id.
         """
-        pageranks: dict[int: float] = {id: 1 for id in links.keys()}
-        old: dict[int: float] = {}
-        
-        # calculate new page rank
-        def pr(i):
-            nonlocal old, links
-            s = 0
-            for j in links[i][0]:
-                s += old[j]/links[j][1]
-            return (1-self.config.pageRank_damping_factor) + self.config.pageRank_damping_factor * s
-        
+        start = time.perf_counter()
+        d = self.config.pageRank_damping_factor
+        tolerance = self.config.pageRank_tolerance
+        n = len(graph)
+        pageranks = np.ones(n)
+        matched = 0
+        if previous:
+            # saved ranks were divided by the normalization total, undo it (it is about the node count for older indexes)
+            scale = (previousStats or {}).get("total", graph.nodeCount())
+            for i,node in enumerate(graph.ids.tolist()):
+                for doc in graph.pages[node]:
+                    if doc in previous:
+                        pageranks[i] = previous[doc] * scale
+                        matched += 1
+                        break
+        # share of each page's rank passed along each of its links
+        share = np.divide(1, graph.outDegree, out = np.zeros(n), where = graph.outDegree > 0)
+        hasInbound = np.diff(graph.indptr) > 0
+        starts = graph.indptr[:-1][hasInbound]
+        danglingTotal = graph.danglingCount
+
         # max iterations
-        iters = len(links)
+        iters = graph.nodeCount()
         if self.config.pageRank_max_iters > 0:
             iters = min(iters, self.config.pageRank_max_iters)
-        
+
+        iterations = 0
+        delta = 0.0
         for _ in range(iters):
-            # update old
-            old = dict(pageranks)
-            # calculate pr for each page
-            for page in pageranks.keys():
-                pageranks[page] = pr(page)
-        
-        total = sum(pageranks.values())
-        for page,rank in pageranks.items():
-            pageranks[page] = rank/total
-        return pageranks
\ No newline at end of file
+            contributions = pageranks * share
+            # ranks of the uncrawled pages, only needed for the normalization total
+            danglingTotal = graph.danglingCount * (1-d) + d * np.sum(contributions * graph.danglingOut)
+            # sum the contributions of the inbound links of each page
+            inbound = np.zeros(n)
+            if len(starts) > 0:
+                inbound[hasInbound] = np.add.reduceat(contributions[graph.indices[:graph.indptr[-1]]], starts)
+            updated = (1-d) + d * inbound
+            iterations += 1
+            delta = float(np.mean(np.abs(updated - pageranks))) if n > 0 else 0.0
+            pageranks = updated
+            if delta < tolerance:
+                break
+
+        total = np.sum(pageranks) + danglingTotal
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats = {
+            "warmStart": bool(previous),
+            "matched": matched,
+            "pages": n,
+            "iterations": iterations,
+            "time": elapsed,
+            "delta": delta,
+            "total": float(total)
+        }
+        if not previous:
+            # the latest cold start, to measure what warm starts save
+            self.stats.update({"coldIterations": iterations, "coldTime": elapsed, "coldPages": n})
+        elif previousStats and "coldPages" in previousStats:
+            cold = {k: previousStats[k] for k in ("coldIterations", "coldTime", "coldPages")}
+            self.stats.update(cold)
+            self.stats["savedIterations"] = cold["coldIterations"] - iterations
+            # the cold start's time per iteration, scaled by how much the graph has grown since
+            perIteration = cold["coldTime"] / max(cold["coldIterations"], 1) * n / max(cold["coldPages"], 1)
+            self.stats["savedTime"] = self.stats["savedIterations"] * perIteration
+        return {doc: pageranks[i] / total for i,node in enumerate(graph.ids.tolist()) for doc in graph.pages[node]}
+
+    def report(self) -> str:
+        """Summarize the last run, with what the warm start saved when it is known."""
+        s = self.stats
+        text = f"{s['iterations']} iterations in {s['time']:.2f} ms (final change {s['delta']:.2e})"
+        if s["warmStart"]:
+            text += f", warm started from {s['matched']} of {s['pages']} pages"
+            if "savedIterations" in s:
+                text += f", saved {s['savedIterations']} iterations (~{s['savedTime']:.2f} ms) against the last cold start's {s['coldIterations']}"
+        return text
@@ -1,23 +1,88 @@
 import json
 import csv
+import bisect
 from pathlib import Path
 
-CACHE_SIZE = 5000
-
 class RefactorException(Exception):
     pass
 
-def refactor(indexPath: str, rfName: str, breakpoints: list[str], printing: bool = True, clean: bool = False) -> None:
+def _row_term_(line: bytes) -> str:
+    """Extract the term from a raw index row without decoding the postings."""
+    if line.startswith(b'"'):
+        # quoted term, fall back to the csv parser for the first field only
+        return next(csv.reader([line.decode("utf-8")]))[0]
+    return line.split(b",", 1)[0].decode("utf-8")
+
+def scanTerms(indexPath: str, filename: str) -> list[tuple[str, int, int, int]]:
+    """Scan the index segments and list the byte location of every term row.
+
+    Args:
+        indexPath (str): the location of the index folder.
+        filename (str): the name of the index files.
+
+    Returns:
+        list[tuple[str, int, int, int]]: (term, segment, byte position, row size) for each row, sorted by term.
+    """
+    rows = []
+    id = 0
+    path = Path(f"{indexPath}/{filename}{id}.csv")
+    while path.exists():
+        with path.open(mode = "rb") as f:
+            pos = 0
+            for line in f:
+                if len(line.strip()) > 0:
+                    rows.append((_row_term_(line), id, pos, len(line)))
+                pos += len(line)
+        id += 1
+        path = Path(f"{indexPath}/{filename}{id}.csv")
+    rows.sort()
+    return rows
+
+def autoBreakpoints(rows: list[tuple[str, int, int, int]], segments: int) -> list[str]:
+    """Choose breakpoints which split the index into segments of roughly equal byte size.
+
+    Args:
+        rows (list[tuple[str, int, int, int]]): the sorted term rows, as returned by scanTerms.
+        segments (int): the number of segments to create.
+
+    Returns:
+        list[str]: the breakpoints. May be fewer than segments-1 if there are too few terms.
+    """
+    if segments < 1:
+        raise RefactorException(f"Invalid segment count: {segments}")
+    # cumulative size histogram over the sorted terms
+    cumulative = []
+    total = 0
+    for r in rows:
+        total += r[3]
+        cumulative.append(total)
+
+    breakpoints = []
+    for k in range(1, segments):
+        # first term past the k'th size quantile starts the next segment
+        i = bisect.bisect_left(cumulative, total * k / segments) + 1
+        if i < len(rows) and (len(breakpoints) < 1 or rows[i][0] > breakpoints[-1]):
+            breakpoints.append(rows[i][0])
+    return breakpoints
+
+def refactor(indexPath: str, rfName: str, breakpoints: list[str], printing: bool = True, clean: bool = False, auto: int = None) -> list[str]:
     """Refactor an index to a new set of breakpoints.
 
+    Rows are copied byte for byte, the postings are never decoded. The meta index and
+    index metadata are rebuilt in the same pass.
+
     Args:
         indexPath (str): the location of the index folder.
         rfName (str): the name of the refactored index files. Must be different from the original index file names.
         breakpoints (list[str]): the new set of breakpoints.
         printing (bool, optional): whether to print progress markers. Defaults to True.
         clean (bool, optional): whether to delete the old index. Defaults to False.
+        auto (int, optional): if provided, ignore breakpoints and choose breakpoints which split the index into this many segments of similar size. Defaults to None.
+
+    Returns:
+        list[str]: the breakpoints used.
     """
-        
+    filename = None
     try:
         with open(f"{indexPath}/meta.json", "r") as f:
             meta = json.load(f)
@@ -25,57 +90,59 @@ def refactor(indexPath: str, rfName: str, breakpoints: list[str], printing: bool
     except FileNotFoundError:
         raise RefactorException(f"Index metadata file not found at: {indexPath}")
     except KeyError:
-        raise RefactorException(f"Malformed metadata: {filename}/meta.json")
-    
+        raise RefactorException(f"Malformed metadata: {indexPath}/meta.json")
+
     if filename == rfName:
         raise RefactorException(f"New index filename cannot be the same as the original index filename.")
-    
+
     if printing:
         print("Begin Refactoring")
+        print("Scanning Index")
+    rows = scanTerms(indexPath, filename)
+
+    if auto is not None:
+        breakpoints = autoBreakpoints(rows, auto)
+
+    if printing:
         print("Breakpoints:", breakpoints)
-    
-    brks = iter(breakpoints + [None, None])
-    brk = next(brks)
-    id = 0
-    outId = 0
-    data: dict = {}
-    out = {}
-    
-    # local func to save index segment to file
-    def dump() -> None:
-        nonlocal out, outId
+
+    segmentCount = len(breakpoints) + 1
+    sources = {}
+    outputs = [open(f"{indexPath}/{rfName}{i}.csv", mode = "wb") for i in range(segmentCount)]
+    index: dict[str: list[int]] = {}
+
+    try:
+        outId = 0
         if printing:
             print("Saving Index Segment:", outId)
-        with open(f"{indexPath}/{rfName}{outId}.csv", mode = "a", newline = "", encoding = "utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerows([k, *[json.dumps(p) for p in v]] for k,v in out.items())
-            out.clear()
-    
-    while True:
-        # for keys in current data, add to new index segment, dumping if a key is reached which is in the subsequent segment
-        for k in sorted(data.keys()):
-            if brk is None or k < brk:
-                out[k] = data.pop(k)
-                if len(out) >= CACHE_SIZE:
-                    dump()
-            else:
-                dump()
-                brk = next(brks)
+        for term, src, pos, size in rows:
+            # advance to the segment this term belongs to
+            while outId < len(breakpoints) and term >= breakpoints[outId]:
                 outId += 1
-                break
-        
-        # get the next index file
-        if len(data) < 1:
-            try:
-                with open(f"{indexPath}/{filename}{id}.csv", mode = "r", encoding = "utf-8") as f:
-                    reader = csv.reader(f)
-                    data.update({r[0]: [json.loads(i) for i in r[1:]] for r in reader})
-                    id += 1
-            except FileNotFoundError:
-                break
-    
-    dump()
-    
+                if printing:
+                    print("Saving Index Segment:", outId)
+            if src not in sources:
+                sources[src] = open(f"{indexPath}/{filename}{src}.csv", mode = "rb")
+            f = sources[src]
+            f.seek(pos)
+            index[term] = [outputs[outId].tell(), outId]
+            outputs[outId].write(f.read(size))
+    finally:
+        for f in outputs:
+            f.close()
+        for f in sources.values():
+            f.close()
+
+    # save the meta index and metadata
+    if printing:
+        print("Saving Meta Index")
+    with open(f"{indexPath}/meta_index.json", "w") as f:
+        json.dump(index, f, indent = 4)
+    meta["filename"] = rfName
+    meta["breakpoints"] = breakpoints
+    with open(f"{indexPath}/meta.json", "w") as f:
+        json.dump(meta, f, indent = 4)
+
     # delete old index files
     if clean:
         if printing:
@@ -86,6 +153,7 @@ def refactor(indexPath: str, rfName: str, breakpoints: list[str], printing: bool
             path.unlink()
             id += 1
             path = Path(f"{indexPath}/{filename}{id}.csv")
-    
+
     if printing:
-        print("Refactoring Complete")
\ No newline at end of file
+        print("Refactoring Complete")
+    return breakpoints
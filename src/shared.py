@@ -0,0 +1,137 @@
+from __future__ import annotations
+from collections.abc import Iterator
+import mmap
+import numpy as np
+from src.helpers import stableHash
+
+class SharedException(Exception):
+    pass
+
+def _share_(arrays: list[np.ndarray]) -> tuple[mmap.mmap, list[np.ndarray]]:
+    """Copy arrays into one anonymous shared mapping, which forked processes see without copying.
+
+    Returns:
+        tuple[mmap.mmap, list[np.ndarray]]: the mapping and a read-only view of each array in it.
+    """
+    # 8 byte aligned so every dtype can be viewed in place
+    sizes = [(a.nbytes + 7) // 8 * 8 for a in arrays]
+    memory = mmap.mmap(-1, max(sum(sizes), 1))
+    views = []
+    offset = 0
+    for a,size in zip(arrays, sizes):
+        memory[offset:offset+a.nbytes] = a.tobytes()
+        view = np.frombuffer(memory, dtype = a.dtype, count = a.size, offset = offset)
+        view.flags.writeable = False
+        views.append(view)
+        offset += size
+    return memory, views
+
+class SharedLexicon:
+    def __init__(self, metaIndex: dict[str: list[int]]):
+        """The term dictionary (term to row position and file number) in shared memory.
+
+        Terms are found by binary search on their stable hashes, so lookups need no Python
+        objects per term and the mapping stays shared after the process forks.
+
+        Args:
+            metaIndex (dict[str: list[int]]): the [position, file number] of each term's row.
+        """
+        terms = sorted(metaIndex.keys(), key = stableHash)
+        encoded = [t.encode("utf-8") for t in terms]
+        offsets = np.zeros(len(terms) + 1, dtype = np.int64)
+        np.cumsum([len(t) for t in encoded], out = offsets[1:])
+        self._memory_, (self.hashes, self.offsets, self.positions, self.files, text) = _share_([
+            np.array([stableHash(t) for t in terms], dtype = np.int64),
+            offsets,
+            np.array([metaIndex[t][0] for t in terms], dtype = np.int64),
+            np.array([metaIndex[t][1] for t in terms], dtype = np.int32),
+            np.frombuffer(b"".join(encoded), dtype = np.uint8)
+        ])
+        self._text_: memoryview = memoryview(text)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _term_(self, i: int) -> bytes:
+        return bytes(self._text_[int(self.offsets[i]):int(self.offsets[i+1])])
+
+    def _find_(self, term: str) -> int:
+        # index of the term, or -1
+        key = stableHash(term)
+        encoded = term.encode("utf-8")
+        i = int(np.searchsorted(self.hashes, key))
+        # hashes may collide, check every entry with the same hash
+        while i < len(self.hashes) and self.hashes[i] == key:
+            if self._term_(i) == encoded:
+                return i
+            i += 1
+        return -1
+
+    def __contains__(self, term: str) -> bool:
+        return self._find_(term) >= 0
+
+    def __getitem__(self, term: str) -> tuple[int, int]:
+        i = self._find_(term)
+        if i < 0:
+            raise KeyError(term)
+        return int(self.positions[i]), int(self.files[i])
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._term_(i).decode("utf-8")
+
+class SharedDocuments:
+    def __init__(self, docs: dict[int: tuple[str, float, str, str, float]]):
+        """The documents (url, normalized length, title, summary, pagerank) in shared memory.
+
+        Args:
+            docs (dict[int: tuple[str, float, str, str, float]]): the documents keyed by id, as loaded from documents.csv.
+        """
+        ids = sorted(docs.keys())
+        encoded = [docs[d][f].encode("utf-8") for d in ids for f in (0, 2, 3)]
+        offsets = np.zeros(len(encoded) + 1, dtype = np.int64)
+        np.cumsum([len(t) for t in encoded], out = offsets[1:])
+        self._memory_, (self.ids, self.lengths, self.pageranks, self.offsets, text) = _share_([
+            np.array(ids, dtype = np.int64),
+            np.array([docs[d][1] for d in ids], dtype = np.float64),
+            np.array([docs[d][4] for d in ids], dtype = np.float64),
+            offsets,
+            np.frombuffer(b"".join(encoded), dtype = np.uint8)
+        ])
+        self._text_: memoryview = memoryview(text)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _find_(self, docID: int) -> int:
+        i = int(np.searchsorted(self.ids, docID))
+        if i >= len(self.ids) or self.ids[i] != docID:
+            raise KeyError(docID)
+        return i
+
+    def _text_field_(self, i: int, field: int) -> str:
+        j = 3 * i + field
+        return bytes(self._text_[int(self.offsets[j]):int(self.offsets[j+1])]).decode("utf-8")
+
+    def __contains__(self, docID: int) -> bool:
+        try:
+            self._find_(docID)
+            return True
+        except KeyError:
+            return False
+
+    def __getitem__(self, docID: int) -> tuple[str, float, str, str, float]:
+        i = self._find_(docID)
+        return self._text_field_(i, 0), float(self.lengths[i]), self._text_field_(i, 1), self._text_field_(i, 2), float(self.pageranks[i])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids.tolist())
+
+    def values(self, docIDs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the normalized lengths and pageranks of documents, which must all exist."""
+        i = np.searchsorted(self.ids, docIDs)
+        if len(i) < 1:
+            return self.lengths[i], self.pageranks[i]
+        if np.any(i >= len(self.ids)) or np.any(self.ids[np.minimum(i, len(self.ids) - 1)] != docIDs):
+            raise SharedException("Unknown document ids")
+        return self.lengths[i], self.pageranks[i]
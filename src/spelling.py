@@ -0,0 +1,136 @@
+from msgspec.json import decode
+from pathlib import Path
+import json
+import time
+import numpy as np
+
+NGRAM = 3
+TRIGRAM_FILE = "trigrams.json"
+
+def ngrams(term: str) -> set[str]:
+    """Return the character n-grams of a term, padded so the first and last characters have their own n-grams."""
+    padded = f"${term}$"
+    return set(padded[i:i+NGRAM] for i in range(max(len(padded) - NGRAM + 1, 1)))
+
+def editDistance(a: str, b: str, limit: int) -> int:
+    """Compute the Levenshtein distance between two strings, stopping early once it exceeds limit.
+
+    Args:
+        a (str): the first string.
+        b (str): the second string.
+        limit (int): the largest distance of interest.
+
+    Returns:
+        int: the edit distance, or limit+1 if it is larger than limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i,ca in enumerate(a, 1):
+        current = [i]
+        for j,cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+def buildTrigramIndex(dfs: dict[str: int], display: dict[str: str] = None) -> dict:
+    """Build the n-gram index over a term dictionary.
+
+    Args:
+        dfs (dict[str: int]): the document frequency of every term.
+        display (dict[str: str], optional): the unstemmed form to show for each term, the term itself if it has none. Defaults to None.
+
+    Returns:
+        dict: the sorted terms, their display forms, their document frequencies and the term numbers containing each n-gram.
+    """
+    terms = sorted(dfs.keys())
+    grams: dict[str: list[int]] = {}
+    for i,t in enumerate(terms):
+        for g in ngrams(t):
+            grams.setdefault(g, []).append(i)
+    display = display or {}
+    return {"terms": terms, "display": [display.get(t, t) for t in terms], "df": [dfs[t] for t in terms], "grams": grams}
+
+def saveTrigramIndex(folder: str, dfs: dict[str: int], display: dict[str: str] = None) -> None:
+    """Build and save the n-gram index for the index in folder."""
+    with open(f"{folder}/{TRIGRAM_FILE}", "w") as f:
+        json.dump(buildTrigramIndex(dfs, display), f)
+
+def scanDocumentFrequencies(folder: str, filename: str, segments: int) -> dict[str: int]:
+    """Read the document frequency of every term from the index segments, without decoding the postings."""
+    dfs = {}
+    for i in range(segments):
+        with open(f"{folder}/{filename}{i}.csv", "rb") as f:
+            for line in f:
+                parts = line.split(b",", 2)
+                if len(parts) > 1:
+                    dfs[parts[0].decode("utf-8")] = int(parts[1])
+    return dfs
+
+class SpellingCorrector:
+    def __init__(self, data: dict):
+        """Find terms close to an unknown term with the n-gram index.
+
+        Args:
+            data (dict): the n-gram index, as built by buildTrigramIndex.
+        """
+        self.terms: list[str] = data["terms"]
+        # older indexes have no display forms, their terms are shown stemmed
+        self.display: list[str] = data.get("display", self.terms)
+        self.df: list[int] = data["df"]
+        # arrays, so candidates are counted and filtered without a Python loop per posting
+        self.grams: dict[str: np.ndarray] = {g: np.asarray(ids, dtype = np.int32) for g,ids in data["grams"].items()}
+        self._lengths_: np.ndarray = np.array([len(t) for t in self.terms], dtype = np.int32)
+
+    @classmethod
+    def load(cls, folder: str) -> "SpellingCorrector":
+        """Load the n-gram index of the index in folder. Returns None if it has not been built."""
+        path = Path(f"{folder}/{TRIGRAM_FILE}")
+        if not path.exists():
+            return None
+        with path.open("rb") as f:
+            return cls(decode(f.read()))
+
+    def suggest(self, term: str, maxDistance: int = 2, budget: float = 5, limit: int = 1) -> list[str]:
+        """Find the known terms closest to term.
+
+        Args:
+            term (str): the unknown term.
+            maxDistance (int, optional): the largest edit distance to accept. Defaults to 2.
+            budget (float, optional): the time budget in ms, the best candidates found so far are returned once it runs out. Defaults to 5.
+            limit (int, optional): the number of terms to return. Defaults to 1.
+
+        Returns:
+            list[str]: the display (unstemmed) forms of the closest terms, ordered by edit distance then document frequency.
+        """
+        deadline = time.perf_counter() + budget / 1000
+        grams = ngrams(term)
+        # an edit changes at most NGRAM n-grams, so a match within maxDistance shares at least this many
+        required = max(len(grams) - NGRAM * maxDistance, 1)
+        candidates = []
+        for g in grams:
+            if time.perf_counter() > deadline:
+                break
+            ids = self.grams.get(g)
+            if ids is None:
+                continue
+            # terms whose length differs by more than maxDistance can never match
+            candidates.append(ids[np.abs(self._lengths_[ids] - len(term)) <= maxDistance])
+        if len(candidates) < 1 or time.perf_counter() > deadline:
+            return []
+        ids, shared = np.unique(np.concatenate(candidates), return_counts = True)
+        keep = shared >= required
+        ids, shared = ids[keep], shared[keep]
+
+        found = []
+        # verify the candidates sharing the most n-grams first
+        for i in ids[np.argsort(-shared, kind = "stable")].tolist():
+            if time.perf_counter() > deadline:
+                break
+            distance = editDistance(term, self.terms[i], maxDistance)
+            if distance <= maxDistance:
+                found.append((distance, -self.df[i], self.terms[i], self.display[i]))
+        found.sort()
+        return [d for _,_,_,d in found[:limit]]
@@ -0,0 +1,141 @@
+from msgspec.json import decode
+from pathlib import Path
+import heapq
+import array
+import json
+import csv
+import sys
+import numpy as np
+from src.refactor import _row_term_
+
+STATS_FILE = "stats.json"
+DF_PERCENTILES = (50, 75, 90, 95, 99, 99.9)
+CACHE_TIERS = (10, 100, 1000, 10000)
+SAMPLE_POSTINGS = 2000
+"""Number of postings decoded, the first few of each row, to measure the memory of a decoded posting."""
+
+class StatsException(Exception):
+    pass
+
+def _row_header_(line: bytes) -> tuple[str, int, int]:
+    """Return the term, document frequency and byte length of the term and df fields of a raw index row."""
+    if line.startswith(b'"'):
+        term, df = next(csv.reader([line.decode("utf-8")]))[:2]
+        start = line.find(b",\"{")
+        return term, int(df), start + 1 if start >= 0 else len(line)
+    term, df, _ = line.split(b",", 2)
+    return _row_term_(line), int(df), len(term) + len(df) + 2
+
+def _decoded_size_(post: dict) -> int:
+    # the dict and its values, the keys are shared by every posting
+    return sys.getsizeof(post) + sum(sys.getsizeof(v) for v in post.values()) + 8
+
+def indexStats(indexPath: str, top: int = 20, cacheSize: int = None, rDocs: int = -1) -> dict:
+    """Compute the shape of an index, streaming over its segments one row at a time.
+
+    Args:
+        indexPath (str): the index folder.
+        top (int, optional): the number of heaviest posting lists to report. Defaults to 20.
+        cacheSize (int, optional): an extra number of cached terms to estimate the memory of. Defaults to None.
+        rDocs (int, optional): the number of postings the querier reads per term, < 0 for all. Defaults to -1.
+
+    Returns:
+        dict: the statistics.
+    """
+    path = Path(indexPath)
+    if not (path / "meta.json").exists():
+        raise StatsException(f"No index found in: {indexPath}")
+    with (path / "meta.json").open("r") as f:
+        meta = json.load(f)
+
+    dfs = array.array("q")
+    heaviest: list[tuple[int, str, int, int]] = []
+    segments = []
+    sample: list[int] = []
+    postingBytes = 0
+    for i in range(len(meta["breakpoints"]) + 1):
+        segment = {"segment": i, "bytes": 0, "terms": 0, "postings": 0}
+        with (path / f"{meta['filename']}{i}.csv").open("rb") as f:
+            for line in f:
+                if len(line.strip()) < 1:
+                    continue
+                term, df, header = _row_header_(line)
+                dfs.append(df)
+                segment["bytes"] += len(line)
+                segment["terms"] += 1
+                segment["postings"] += df
+                postingBytes += len(line) - header
+                # keep only the top heaviest rows in memory
+                item = (len(line), term, df, i)
+                if len(heaviest) < top:
+                    heapq.heappush(heaviest, item)
+                elif item > heaviest[0]:
+                    heapq.heapreplace(heaviest, item)
+                if len(sample) < SAMPLE_POSTINGS and df > 0:
+                    for p in next(csv.reader([line.decode("utf-8")]))[2:12]:
+                        sample.append(_decoded_size_(decode(p)))
+        segments.append(segment)
+
+    dfs = np.array(dfs, dtype = np.int64)
+    if len(dfs) < 1:
+        raise StatsException(f"Index is empty: {indexPath}")
+    postings = int(np.sum(dfs))
+    sizes = np.array([s["bytes"] for s in segments])
+    perPosting = float(np.mean(sample)) if len(sample) > 0 else 0
+
+    # the querier caches the first RDOCS decoded postings of each term, estimate it for the most frequent terms
+    cached = np.sort(dfs if rDocs <= 0 else np.minimum(dfs, rDocs))[::-1]
+    cumulative = np.cumsum(cached)
+    tiers = sorted(set([t for t in CACHE_TIERS if t < len(dfs)] + ([min(cacheSize, len(dfs))] if cacheSize else []) + [len(dfs)]))
+
+    # df histogram in powers of two
+    buckets = np.bincount(np.floor(np.log2(np.maximum(dfs, 1))).astype(np.int64))
+    return {
+        "index": str(indexPath),
+        "documents": meta["documentCount"],
+        "terms": len(dfs),
+        "postings": postings,
+        "bytes": int(np.sum(sizes)),
+        "bytesPerPosting": postingBytes / postings if postings > 0 else 0,
+        "df": {
+            "mean": float(np.mean(dfs)),
+            **{f"p{p}": float(np.percentile(dfs, p)) for p in DF_PERCENTILES},
+            "max": int(np.max(dfs)),
+            "singletons": int(np.sum(dfs == 1)),
+            "histogram": {f"{2**b}-{2**(b+1)-1}": int(c) for b,c in enumerate(buckets) if c > 0}
+        },
+        "heaviest": [{"term": t, "bytes": b, "df": df, "segment": s} for b,t,df,s in sorted(heaviest, reverse = True)],
+        "segments": segments,
+        "segmentSkew": float(np.max(sizes) / np.mean(sizes)) if np.mean(sizes) > 0 else 0,
+        "cache": {
+            "rDocs": rDocs,
+            "bytesPerDecodedPosting": perPosting,
+            "topTerms": [{"terms": int(n), "postings": int(cumulative[n-1]), "bytes": int(cumulative[n-1] * perPosting)} for n in tiers]
+        }
+    }
+
+def saveStats(indexPath: str, stats: dict) -> str:
+    """Save the statistics next to the index and return the file path."""
+    out = f"{indexPath}/{STATS_FILE}"
+    with open(out, "w") as f:
+        json.dump(stats, f, indent = 4)
+    return out
+
+def formatStats(stats: dict) -> str:
+    """Format the statistics as a human readable summary."""
+    df = stats["df"]
+    lines = [
+        f"Index: {stats['index']}",
+        f"  Documents: {stats['documents']} | Terms: {stats['terms']} | Postings: {stats['postings']}",
+        f"  Size: {stats['bytes'] / 1024**2:.4f} mb | {stats['bytesPerPosting']:.2f} bytes per posting",
+        f"Document Frequency: mean {df['mean']:.2f} | " + " | ".join(f"{k} {df[k]:g}" for k in df if k.startswith("p")) + f" | max {df['max']}",
+        f"  Singletons: {df['singletons']} ({df['singletons'] / stats['terms'] * 100:.2f}% of terms)",
+        *(f"  df {k}: {v}" for k,v in df["histogram"].items()),
+        "Heaviest Posting Lists:",
+        *(f"  {h['term']}: {h['bytes'] / 1024:.2f} kb, df {h['df']}, segment {h['segment']}" for h in stats["heaviest"]),
+        f"Segments (skew {stats['segmentSkew']:.2f}x the mean):",
+        *(f"  {s['segment']}: {s['bytes'] / 1024**2:.4f} mb, {s['terms']} terms, {s['postings']} postings" for s in stats["segments"]),
+        f"Cache Memory (RDOCS {stats['cache']['rDocs']}, {stats['cache']['bytesPerDecodedPosting']:.0f} bytes per decoded posting):",
+        *(f"  top {t['terms']} terms: {t['postings']} postings, {t['bytes'] / 1024**2:.4f} mb" for t in stats["cache"]["topTerms"])
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+from pathlib import Path
+import numpy as np
+import mmap
+import struct
+
+TERMS_FILE = "terms.bin"
+MAGIC = b"TRMD"
+# term arrays written before display forms were saved
+MAGIC_STEMMED = b"TRMS"
+
+class SuggestException(Exception):
+    pass
+
+def saveTermArray(folder: str, popularity: dict[str: int], display: dict[str: str] = None) -> None:
+    """Save the sorted term array used for prefix completion.
+
+    The file holds a header (magic, term count), the byte offset of every term, the
+    popularity of every term, the byte offset of every display form, then the utf-8
+    terms, sorted bytewise, and their utf-8 display forms.
+
+    Args:
+        folder (str): the index folder.
+        popularity (dict[str: int]): the popularity (eg: document frequency) of every term.
+        display (dict[str: str], optional): the unstemmed form to show for each term, the term itself if it has none. Defaults to None.
+    """
+    display = display or {}
+    terms = sorted(t.encode("utf-8") for t in popularity.keys())
+    shown = [display.get(t.decode("utf-8"), t.decode("utf-8")).encode("utf-8") for t in terms]
+    offsets = np.zeros(len(terms) + 1, dtype = np.uint32)
+    np.cumsum([len(t) for t in terms], out = offsets[1:])
+    shownOffsets = np.zeros(len(terms) + 1, dtype = np.uint32)
+    np.cumsum([len(t) for t in shown], out = shownOffsets[1:])
+    shownOffsets += offsets[-1]
+    pops = np.array([popularity[t.decode("utf-8")] for t in terms], dtype = np.uint32)
+    with open(f"{folder}/{TERMS_FILE}", "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(terms)))
+        f.write(offsets.astype("<u4").tobytes())
+        f.write(pops.astype("<u4").tobytes())
+        f.write(shownOffsets.astype("<u4").tobytes())
+        f.write(b"".join(terms))
+        f.write(b"".join(shown))
+
+class TermArray:
+    def __init__(self, path: str):
+        """Memory-map a sorted term array for prefix completion.
+
+        Args:
+            path (str): the term array file.
+
+        Raises:
+            SuggestException: if the file is malformed.
+        """
+        self._file_ = open(path, "rb")
+        self._mmap_ = mmap.mmap(self._file_.fileno(), 0, access = mmap.ACCESS_READ)
+        if self._mmap_[:4] not in (MAGIC, MAGIC_STEMMED):
+            raise SuggestException(f"Malformed term array: {path}")
+        self.count: int = struct.unpack("<I", self._mmap_[4:8])[0]
+        self.offsets: np.ndarray = np.frombuffer(self._mmap_, dtype = "<u4", count = self.count + 1, offset = 8)
+        self.popularity: np.ndarray = np.frombuffer(self._mmap_, dtype = "<u4", count = self.count, offset = 8 + 4 * (self.count + 1))
+        self._start_: int = 8 + 8 * self.count + 4
+        # offsets of the display forms, which follow the terms, or the terms themselves in older files
+        self.displayOffsets: np.ndarray = self.offsets
+        if self._mmap_[:4] == MAGIC:
+            self.displayOffsets = np.frombuffer(self._mmap_, dtype = "<u4", count = self.count + 1, offset = self._start_)
+            self._start_ += 4 * (self.count + 1)
+
+    @classmethod
+    def load(cls, folder: str) -> "TermArray":
+        """Load the term array of the index in folder. Returns None if it has not been built."""
+        path = Path(f"{folder}/{TERMS_FILE}")
+        if not path.exists():
+            return None
+        return cls(str(path))
+
+    def close(self) -> None:
+        self.offsets = None
+        self.popularity = None
+        self.displayOffsets = None
+        self._mmap_.close()
+        self._file_.close()
+
+    def term(self, i: int) -> bytes:
+        """Return the i'th term, as utf-8 bytes."""
+        return self._mmap_[self._start_ + int(self.offsets[i]):self._start_ + int(self.offsets[i+1])]
+
+    def display(self, i: int) -> str:
+        """Return the form of the i'th term to show users."""
+        return self._mmap_[self._start_ + int(self.displayOffsets[i]):self._start_ + int(self.displayOffsets[i+1])].decode("utf-8")
+
+    def _lower_bound_(self, key: bytes) -> int:
+        # first term >= key
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def frequency(self, term: str) -> int|None:
+        """Return the popularity of a term, or None if it is not in the array."""
+        key = term.encode("utf-8")
+        i = self._lower_bound_(key)
+        if i >= self.count or self.term(i) != key:
+            return None
+        return int(self.popularity[i])
+
+    def complete(self, prefix: str, k: int = 10) -> list[str]:
+        """Find the most popular terms starting with prefix.
+
+        Args:
+            prefix (str): the prefix.
+            k (int, optional): the number of completions. Defaults to 10.
+
+        Returns:
+            list[str]: the display forms of up to k terms, most popular first.
+        """
+        key = prefix.encode("utf-8")
+        lo = self._lower_bound_(key)
+        # no utf-8 byte is 0xff, so this bounds every term with the prefix
+        hi = self._lower_bound_(key + b"\xff")
+        if hi <= lo:
+            return []
+        pops = self.popularity[lo:hi]
+        if hi - lo > k:
+            best = np.argpartition(pops, -k)[-k:]
+        else:
+            best = np.arange(hi - lo)
+        best = best[np.argsort(-pops[best].astype(np.int64), kind = "stable")]
+        completions = []
+        for i in best:
+            # different terms can share a display form
+            shown = self.display(lo + int(i))
+            if shown not in completions:
+                completions.append(shown)
+        return completions
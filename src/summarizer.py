@@ -0,0 +1,243 @@
+import asyncio
+import threading
+import hashlib
+import json
+import time
+import csv
+import os
+from pathlib import Path
+
+OPENAI_ORGANIZATION = "org-2egDI4pNkT6wiQgGhN5anyC6"
+PENDING_FILE = "summary_pending.jsonl"
+PROMPT_CHARS = 2048
+"""The number of characters of a page's text a summary is made from."""
+
+class SummaryException(Exception):
+    pass
+
+def textKey(text: str) -> str:
+    """Return the cache key for a page's text."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class StubSummarizer:
+    def __init__(self, words: int = 40):
+        """Local summarizer for testing, returns the first words of the text.
+
+        Args:
+            words (int, optional): the number of words in the summary. Defaults to 40.
+        """
+        self.words = words
+
+    def __call__(self, text: str) -> str:
+        return " ".join(text.split()[:self.words])
+
+class OpenAISummarizer:
+    def __call__(self, text: str) -> str:
+        # imported lazily, only needed when summaries are enabled
+        import openai
+        openai.organization = OPENAI_ORGANIZATION
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        response = openai.Completion.create(
+            engine = "text-davinci-003",
+            prompt = f"Summarize this text using less than 40 words:\n{text[:PROMPT_CHARS]}\nSummary:",
+            temperature = 0.5,
+            max_tokens = 40,
+            n = 1,
+            stop = None
+        )
+        return response.choices[0].text.strip()
+
+def getSummarizer(name: str):
+    """Get a summarizer by name: 'openai' or 'stub'."""
+    if name == "openai":
+        return OpenAISummarizer()
+    elif name == "stub":
+        return StubSummarizer()
+    raise SummaryException(f"Unknown summarizer: {name}")
+
+class SummaryCache:
+    def __init__(self, path: str):
+        """Persistent cache of summaries keyed by the hash of the page text.
+
+        Args:
+            path (str): the csv file holding the cache. Created if it does not exist.
+        """
+        self.path = path
+        self._lock_ = threading.Lock()
+        self._data_: dict[str: str] = {}
+        if Path(path).exists():
+            with open(path, "r", encoding = "utf-8", newline = "") as f:
+                for row in csv.reader(f):
+                    if len(row) == 2:
+                        self._data_[row[0]] = row[1]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data_
+
+    def __len__(self) -> int:
+        return len(self._data_)
+
+    def get(self, key: str, default: str = None) -> str:
+        return self._data_.get(key, default)
+
+    def put(self, key: str, summary: str) -> None:
+        """Add a summary, appending it to the cache file immediately."""
+        with self._lock_:
+            self._data_[key] = summary
+            with open(self.path, "a", encoding = "utf-8", newline = "") as f:
+                csv.writer(f).writerow([key, summary])
+
+class SummaryPipeline:
+    def __init__(self, summarizer, cache: SummaryCache, workers: int = 4, rateLimit: float = 2, retries: int = 3):
+        """Summarize pages in the background on an asyncio worker pool.
+
+        Args:
+            summarizer (Callable[[str], str]): the function producing a summary from page text.
+            cache (SummaryCache): where finished summaries are stored.
+            workers (int, optional): the number of concurrent summary requests. Defaults to 4.
+            rateLimit (float, optional): the maximum number of summary requests per minute. Value <= 0 indicates no limit. Defaults to 2.
+            retries (int, optional): how many times to retry a failed request. Defaults to 3.
+        """
+        self.summarizer = summarizer
+        self.cache = cache
+        self.retries = retries
+        self.failed: int = 0
+        self._interval_: float = 60 / rateLimit if rateLimit > 0 else 0
+        self._next_: float = 0
+        self._pending_: dict[str: str] = {}
+        self._lock_ = threading.Lock()
+
+        self._loop_ = asyncio.new_event_loop()
+        self._thread_ = threading.Thread(target = self._loop_.run_forever, daemon = True)
+        self._thread_.start()
+        asyncio.run_coroutine_threadsafe(self._start_(workers), self._loop_).result()
+
+    async def _start_(self, workers: int) -> None:
+        self._queue_: asyncio.Queue = asyncio.Queue()
+        self._throttle_lock_ = asyncio.Lock()
+        self._workers_ = [asyncio.create_task(self._worker_()) for _ in range(workers)]
+
+    async def _throttle_(self) -> None:
+        # space requests evenly to respect the rate limit
+        async with self._throttle_lock_:
+            now = time.monotonic()
+            if self._next_ > now:
+                await asyncio.sleep(self._next_ - now)
+            self._next_ = max(now, self._next_) + self._interval_
+
+    async def _worker_(self) -> None:
+        while True:
+            key, text = await self._queue_.get()
+            try:
+                for attempt in range(self.retries + 1):
+                    await self._throttle_()
+                    try:
+                        summary = await asyncio.to_thread(self.summarizer, text)
+                    except Exception:
+                        if attempt < self.retries:
+                            await asyncio.sleep(2**attempt)
+                        continue
+                    self.cache.put(key, summary)
+                    with self._lock_:
+                        self._pending_.pop(key, None)
+                    break
+                else:
+                    # left pending so a later run retries it
+                    self.failed += 1
+            finally:
+                self._queue_.task_done()
+
+    def pending(self) -> int:
+        """Return the number of pages queued or in progress."""
+        return len(self._pending_)
+
+    def submit(self, key: str, text: str) -> None:
+        """Queue a page for summarization, unless it is already cached or queued.
+
+        Only the first PROMPT_CHARS characters of the text are kept, so memory stays bounded while pages wait on the rate limit.
+
+        Args:
+            key (str): the hash of the page text.
+            text (str): the page text.
+        """
+        text = text[:PROMPT_CHARS]
+        with self._lock_:
+            if key in self.cache or key in self._pending_:
+                return None
+            self._pending_[key] = text
+        self._loop_.call_soon_threadsafe(self._queue_.put_nowait, (key, text))
+
+    def load(self, path: str) -> int:
+        """Queue the pages saved by a previous close.
+
+        Args:
+            path (str): the pending pages file.
+
+        Returns:
+            int: the number of pages read.
+        """
+        count = 0
+        if Path(path).exists():
+            with open(path, "r", encoding = "utf-8") as f:
+                for line in f:
+                    item = json.loads(line)
+                    self.submit(item["key"], item["text"])
+                    count += 1
+        return count
+
+    def close(self, wait: bool = True, pendingPath: str = None) -> int:
+        """Stop the pipeline.
+
+        Args:
+            wait (bool, optional): whether to finish all queued pages first. Defaults to True.
+            pendingPath (str, optional): if provided, unfinished pages are saved here to be loaded by a later run. Defaults to None.
+
+        Returns:
+            int: the number of unfinished pages.
+        """
+        if wait:
+            asyncio.run_coroutine_threadsafe(self._queue_.join(), self._loop_).result()
+
+        async def cancel():
+            for w in self._workers_:
+                w.cancel()
+            await asyncio.gather(*self._workers_, return_exceptions = True)
+        asyncio.run_coroutine_threadsafe(cancel(), self._loop_).result()
+        self._loop_.call_soon_threadsafe(self._loop_.stop)
+        self._thread_.join()
+        self._loop_.close()
+
+        with self._lock_:
+            pending = dict(self._pending_)
+        if pendingPath is not None:
+            if len(pending) > 0:
+                with open(pendingPath, "w", encoding = "utf-8") as f:
+                    for k,v in pending.items():
+                        f.write(json.dumps({"key": k, "text": v}) + "\n")
+            else:
+                Path(pendingPath).unlink(missing_ok = True)
+        return len(pending)
+
+def attachSummaries(indexLoc: str, cache: SummaryCache) -> int:
+    """Fill in the summaries in an index's documents.csv from the summary cache.
+
+    Args:
+        indexLoc (str): the folder containing the index.
+        cache (SummaryCache): the summary cache.
+
+    Returns:
+        int: the number of documents with a summary.
+    """
+    count = 0
+    path = f"{indexLoc}/documents.csv"
+    with open(path, "r", encoding = "utf-8", newline = "") as f, open(f"{path}.tmp", "w", encoding = "utf-8", newline = "") as out:
+        writer = csv.writer(out)
+        for row in csv.reader(f):
+            # the text hash is the 7th column
+            if len(row) > 6:
+                row[4] = cache.get(row[6], row[4])
+            if len(row[4]) > 0:
+                count += 1
+            writer.writerow(row)
+    os.replace(f"{path}.tmp", path)
+    return count
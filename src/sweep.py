@@ -0,0 +1,108 @@
+from pathlib import Path
+import itertools
+import json
+import time
+import numpy as np
+from src.query import Queryier
+
+SWEEP_FILE = "sweep.json"
+PERCENTILES = (50, 90, 99)
+
+class SweepException(Exception):
+    pass
+
+def loadGrid(grid: str) -> dict[str: list]:
+    """Load a settings grid from a json file or a json string, eg: {"RDOCS": [100, 500], "HEADER": [1, 1.5]}.
+
+    Single values are treated as a grid of one value.
+    """
+    text = Path(grid).read_text() if Path(grid).exists() else grid
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        raise SweepException(f"Invalid settings grid: {grid}")
+    if not isinstance(data, dict):
+        raise SweepException(f"Invalid settings grid: {grid}")
+    return {k: v if isinstance(v, list) else [v] for k,v in data.items()}
+
+def settingsGrid(grid: dict[str: list]) -> list[dict[str: float]]:
+    """Return every combination of the settings in the grid."""
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def loadJudgments(path: str) -> dict[str: set[str]]:
+    """Read judged results, one tab separated query and relevant url per line."""
+    judgments: dict[str: set[str]] = {}
+    with open(path, "r", encoding = "utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) == 2 and not line.startswith("#"):
+                judgments.setdefault(parts[0].strip(), set()).add(parts[1].strip())
+    return judgments
+
+def _run_(q: Queryier, queries: list[str], repeat: int) -> tuple[list[float], dict[str: list[str]]]:
+    # latency of every query (each repeat is timed), and the result urls of each query
+    latencies = []
+    results = {}
+    for _ in range(repeat):
+        for query in queries:
+            # time the ranking, not the result cache, and always rank in full
+            q._results_.clear()
+            q._components_.clear()
+            start = time.perf_counter()
+            res, _, _ = q.searchIndex(query, budget = 0)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results[query] = [r.url for r in res]
+    return latencies, results
+
+def sweep(q: Queryier, queries: list[str], grid: dict[str: list], judgments: dict[str: set[str]] = None, repeat: int = 3) -> dict:
+    """Run a query set under every combination of settings in a grid, on one loaded index.
+
+    Each setting is compared with a reference ranking: the config.ini settings with RDOCS = -1,
+    so every posting is scored. Overlap is the share of the reference top k found in the top k.
+    The impacts only hold the config.ini weights, so the reference and every setting are scored
+    per field, keeping settings which change [WEIGHTS] comparable with the ones which do not.
+
+    Args:
+        q (Queryier): the querier, its settings are changed in memory.
+        queries (list[str]): the query set.
+        grid (dict[str: list]): the values to try for each setting, keyed by config.ini name.
+        judgments (dict[str: set[str]], optional): relevant urls of each query, to also report their recall in the top k. Defaults to None.
+        repeat (int, optional): how many times to run the query set for each setting. Defaults to 3.
+
+    Returns:
+        dict: the reference settings and the latency and quality of each setting.
+    """
+    settings = settingsGrid(grid)
+    base = {**q.config.weights, "ALPHA": q.config.alpha, "RDOCS": q.config.r_docs, "KRESULTS": q.config.k_results}
+    depth = max([int(s.get("KRESULTS", base["KRESULTS"])) for s in settings] + [base["KRESULTS"]])
+    reference = {**base, "RDOCS": -1, "KRESULTS": depth}
+    impactScores = q.config.impact_scores
+    q.config.impact_scores = False
+    q.applySettings(reference)
+    _, expected = _run_(q, queries, 1)
+
+    report = {"reference": reference, "queries": len(queries), "impacts": False, "settings": []}
+    for s in settings:
+        setting = {**base, **s}
+        q.applySettings(setting)
+        latencies, results = _run_(q, queries, repeat)
+        k = setting["KRESULTS"]
+        overlap = [len(set(results[x]) & set(expected[x][:k])) / len(expected[x][:k]) for x in queries if len(expected[x]) > 0]
+        entry = {
+            "settings": s,
+            "latency": {"mean": float(np.mean(latencies)), **{f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}, "max": float(np.max(latencies))},
+            "overlap": float(np.mean(overlap)) if len(overlap) > 0 else 1.0
+        }
+        if judgments:
+            recall = [len(set(results[x]) & judgments[x]) / len(judgments[x]) for x in queries if x in judgments]
+            entry["judgedRecall"] = float(np.mean(recall)) if len(recall) > 0 else None
+        report["settings"].append(entry)
+    q.config.impact_scores = impactScores
+    q.applySettings(base)
+    return report
+
+def fastestSetting(report: dict, minOverlap: float) -> dict|None:
+    """Return the setting with the lowest median latency whose overlap is at least minOverlap."""
+    good = [s for s in report["settings"] if s["overlap"] >= minOverlap]
+    return min(good, key = lambda s: s["latency"]["p50"]) if len(good) > 0 else None